@@ -1,11 +1,10 @@
 import os
 import sys
+import time
+import argparse
 import django
-import uuid
 from dotenv import load_dotenv
 from PyPDF2 import PdfReader
-from django.utils import timezone
-from openai import AzureOpenAI
 
 # Ensure module path works when running: python -m controller.ai-pipeline.populate_document
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -16,86 +15,47 @@ sys.path.append(PROJECT_ROOT)
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 django.setup()
 
-from controller.models import Rag_Context  # after django.setup()
-
 # Load environment variables
 load_dotenv()
 
-AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_EMB_ENDPOINT")
-AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME = "text-embedding-3-small"
+from controller.ai import clients  # noqa: E402  (reads credentials from the environment)
+from controller.ai.ingestion import (  # noqa: E402
+    DEFAULT_BATCH_SIZE, DEFAULT_MAX_IN_FLIGHT, ingest_document, ingest_in_processes, remove_deleted_sources,
+)
 
-if not AZURE_OPENAI_KEY or not AZURE_OPENAI_ENDPOINT:
+if not clients.AZURE_OPENAI_KEY or not clients.AZURE_OPENAI_EMB_ENDPOINT:
     raise ValueError("Missing Azure OpenAI credentials in .env")
 
-# Azure client
-client = AzureOpenAI(
-    api_version="2024-12-01-preview",
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-    api_key=AZURE_OPENAI_KEY,
-)
-
 # PDF directory → controller/ai-pipeline/pdfs
 PDF_DIR = os.path.join(CURRENT_DIR, "pdfs")
 
-
-# Text Chunking
-def chunk_text(text, chunk_size=600, overlap=100):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + chunk_size)
-        chunks.append(text[start:end].strip())
-        start += chunk_size - overlap
-    return [c for c in chunks if len(c) > 50]
+DEFAULT_PROCESSES = os.cpu_count() or 1  # PDFs ingested in parallel
 
 
-# PDF Processor
-def process_pdf(file_path):
-    pdf_name = os.path.basename(file_path)
-    print(f"\nProcessing PDF: {pdf_name}")
-
-    # Read PDF data
+def iter_page_texts(file_path):
+    """Extract a PDF one page at a time."""
     reader = PdfReader(file_path)
-    text = "".join(page.extract_text() or "" for page in reader.pages)
-
-    if not text.strip():
-        print(f"No readable text in {pdf_name}")
-        return
+    for page in reader.pages:
+        # Keep the last sentence of a page apart from the first of the next
+        yield (page.extract_text() or "") + "\n"
 
-    chunks = chunk_text(text)
-    print(f"Split into {len(chunks)} chunks")
 
-    source_url = f"file://{file_path}"
-
-    # Insert each chunk as a new Rag_Context row
-    for i, chunk in enumerate(chunks, start=1):
-        try:
-            res = client.embeddings.create(
-                model=AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME,
-                input=chunk
-            )
-            embedding = res.data[0].embedding
-
-            Rag_Context.objects.create(
-                id=uuid.uuid4(),
-                source_name=pdf_name,
-                source_url=source_url,
-                content_chunk=chunk,
-                embedding=embedding,
-                created_at=timezone.now(),
-            )
-
-            print(f"Chunk {i}/{len(chunks)} added")
-
-        except Exception as e:
-            print(f"Error embedding chunk {i}: {e}")
-
-    print(f"Finished '{pdf_name}'")
+# PDF Processor
+def process_pdf(file_path, batch_size=DEFAULT_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """Embed and store the new chunks of one PDF (see controller.ai.ingestion). Returns the number stored."""
+    pdf_name = os.path.basename(file_path)
+    print(f"Processing PDF: {pdf_name}")
+    return ingest_document(pdf_name, f"file://{file_path}", iter_page_texts(file_path), batch_size, max_in_flight)
 
 
 # Main runner
 def main():
+    parser = argparse.ArgumentParser(description="Embed the PDFs in ai-pipeline/pdfs into Rag_Context")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="chunks per embeddings request")
+    parser.add_argument("--max-in-flight", type=int, default=DEFAULT_MAX_IN_FLIGHT, help="concurrent embeddings requests across all processes (also caps --processes)")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES, help="PDFs ingested in parallel")
+    args = parser.parse_args()
+
     if not os.path.exists(PDF_DIR):
         print(f"PDF directory missing: {PDF_DIR}")
         return
@@ -106,10 +66,16 @@ def main():
         print("No PDF files found.")
         return
 
-    for pdf in pdf_files:
-        process_pdf(os.path.join(PDF_DIR, pdf))
+    remove_deleted_sources(pdf_files)
+
+    start = time.perf_counter()
+    # Each PDF is extracted, chunked and embedded in its own worker process, so
+    # extraction (CPU bound) scales with cores
+    pdf_paths = [os.path.join(PDF_DIR, pdf) for pdf in pdf_files]
+    total = ingest_in_processes(process_pdf, pdf_paths, args.processes, args.batch_size, args.max_in_flight)
 
-    print("\nAll PDFs processed.")
+    elapsed = time.perf_counter() - start
+    print(f"\nAll PDFs processed: {total} new chunks in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} chunks/s)")
 
 
 # python -m controller.ai-pipeline.populate_document
@@ -108,6 +108,22 @@ else:
         }
     }
 
+# State of background speech assessment jobs (controller/ai/jobs.py). Polls can reach any
+# gunicorn process, so with PostgreSQL the state lives in the database cache table (created by
+# "python manage.py createcachetable"); the local memory cache only works for a single process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'speech_jobs': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'speech_job_cache',
+    } if os.getenv('DATABASE_NAME') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'speech_jobs',
+    },
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
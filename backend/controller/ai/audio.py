@@ -0,0 +1,196 @@
+"""
+In-memory audio handling for speech assessment uploads.
+
+Uploads are decoded by ffmpeg straight to 16 kHz mono 16-bit PCM (the format Azure Speech
+recognises natively) and handed to the recognizer through a push stream, so no temp files
+are written. The upload size and decoded duration are both capped, which bounds the memory
+a single request can hold.
+
+Before recognition, preprocess_pcm() trims leading and trailing silence with an energy-based
+voice-activity detector (vectorised with NumPy over 20 ms frames) and caps the remaining
+speech, so Azure is neither billed for nor kept waiting on silence:
+
+    SPEECH_VAD_ENABLED          "1" (default) or "0"
+    SPEECH_VAD_THRESHOLD_DB     frames quieter than this (dBFS) never count as speech (default -45);
+                                with silence in the clip, the bar rises to 12 dB above its noise floor
+    SPEECH_VAD_PADDING_MS       audio kept either side of the detected speech (default 200)
+    SPEECH_MAX_SPEECH_SECONDS   longest audio sent to recognition after trimming (default 30)
+"""
+import os
+import subprocess
+import threading
+import azure.cognitiveservices.speech as speechsdk
+import numpy as np
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # bytes per sample (16-bit)
+CHANNELS = 1
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH * CHANNELS
+
+MAX_UPLOAD_BYTES = int(os.getenv("SPEECH_MAX_UPLOAD_BYTES", 10 * 1024 * 1024))
+MAX_AUDIO_SECONDS = int(os.getenv("SPEECH_MAX_AUDIO_SECONDS", 60))
+FFMPEG_TIMEOUT_SECONDS = 30
+
+SPEECH_VAD_ENABLED = os.getenv("SPEECH_VAD_ENABLED", "1") == "1"
+SPEECH_VAD_THRESHOLD_DB = float(os.getenv("SPEECH_VAD_THRESHOLD_DB", -45))
+SPEECH_VAD_PADDING_MS = int(os.getenv("SPEECH_VAD_PADDING_MS", 200))
+SPEECH_MAX_SPEECH_SECONDS = int(os.getenv("SPEECH_MAX_SPEECH_SECONDS", 30))
+VAD_FRAME_MS = 20
+# A frame counts as speech when it is this many dB above the recording's noise floor
+VAD_NOISE_MARGIN_DB = 12
+
+# Push the recognizer one second of audio at a time
+PUSH_CHUNK_BYTES = BYTES_PER_SECOND
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+def _ffmpeg_command(source):
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin',
+        '-i', source,
+        '-t', str(MAX_AUDIO_SECONDS),
+        '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ac', str(CHANNELS), '-ar', str(SAMPLE_RATE),
+        'pipe:1',
+    ]
+
+
+def _run_ffmpeg(source, **kwargs):
+    try:
+        return subprocess.run(
+            _ffmpeg_command(source), capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS, **kwargs
+        )
+    except subprocess.TimeoutExpired:
+        raise AudioDecodeError('Timed out decoding audio')
+
+
+def decode_to_pcm(chunks, size=None):
+    """
+    Decode an iterable of encoded audio chunks (e.g. UploadedFile.chunks()) to raw PCM bytes.
+
+    On Linux the chunks are written to an anonymous memory-backed file (memfd) so ffmpeg can
+    seek it - m4a files from phones usually keep their index at the end, which a plain pipe
+    can't handle. Elsewhere the chunks are piped to ffmpeg's stdin.
+    """
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise AudioDecodeError(f'Audio upload exceeds {MAX_UPLOAD_BYTES} bytes')
+
+    if hasattr(os, 'memfd_create'):
+        fd = os.memfd_create('speech-upload')
+        try:
+            written = 0
+            for chunk in chunks:
+                written += len(chunk)
+                if written > MAX_UPLOAD_BYTES:
+                    raise AudioDecodeError(f'Audio upload exceeds {MAX_UPLOAD_BYTES} bytes')
+                os.write(fd, chunk)
+            os.lseek(fd, 0, os.SEEK_SET)
+            proc = _run_ffmpeg(f'/proc/self/fd/{fd}', pass_fds=(fd,))
+        finally:
+            os.close(fd)
+    else:
+        data = b''.join(chunks)
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise AudioDecodeError(f'Audio upload exceeds {MAX_UPLOAD_BYTES} bytes')
+        proc = _run_ffmpeg('pipe:0', input=data)
+
+    if proc.returncode != 0:
+        raise AudioDecodeError(f'Could not decode audio: {proc.stderr.decode(errors="replace").strip()}')
+    if not proc.stdout:
+        raise AudioDecodeError('Audio upload contains no samples')
+    return proc.stdout
+
+
+def pcm_duration_ms(pcm):
+    return int(len(pcm) * 1000 / BYTES_PER_SECOND)
+
+
+_preprocess_lock = threading.Lock()
+_preprocess_stats = {'processed': 0, 'no_speech': 0, 'capped': 0, 'input_ms': 0, 'output_ms': 0}
+
+
+def speech_bounds(pcm):
+    """
+    (start, end) byte offsets of the detected speech in 16-bit mono PCM, padded by
+    SPEECH_VAD_PADDING_MS, or None when no frame is loud enough to be speech.
+    """
+    frame_samples = SAMPLE_RATE * VAD_FRAME_MS // 1000
+    samples = np.frombuffer(pcm, dtype='<i2')
+    frame_count = len(samples) // frame_samples
+    if frame_count == 0:
+        return None
+
+    frames = samples[:frame_count * frame_samples].astype(np.float32).reshape(frame_count, frame_samples)
+    rms = np.sqrt(np.mean(np.square(frames / 32768.0), axis=1))
+    db = 20 * np.log10(np.maximum(rms, 1e-10))
+    # The quietest tenth of the frames approximates the background noise - but only when they
+    # are quiet enough to be silence. A clip with no pauses has speech there, and raising the
+    # threshold above it would trim real speech.
+    threshold = SPEECH_VAD_THRESHOLD_DB
+    noise_floor = float(np.percentile(db, 10))
+    if noise_floor < SPEECH_VAD_THRESHOLD_DB:
+        threshold = max(threshold, noise_floor + VAD_NOISE_MARGIN_DB)
+    voiced = np.flatnonzero(db > threshold)
+    if len(voiced) == 0:
+        return None
+
+    padding = SPEECH_VAD_PADDING_MS // VAD_FRAME_MS
+    first = max(0, voiced[0] - padding)
+    last = min(frame_count, voiced[-1] + 1 + padding)
+    frame_bytes = frame_samples * SAMPLE_WIDTH
+    end = len(pcm) if last == frame_count else last * frame_bytes
+    return int(first * frame_bytes), int(end)
+
+
+def preprocess_pcm(pcm):
+    """
+    Trim silence and cap the duration of decoded PCM before recognition.
+    Returns (pcm, info) where info reports the input/output duration and what was done.
+    Audio in which no speech is detected is passed on untrimmed (a quiet child is better
+    judged by Azure than dropped here).
+    """
+    input_ms = pcm_duration_ms(pcm)
+    bounds = speech_bounds(pcm) if SPEECH_VAD_ENABLED else (0, len(pcm))
+    if bounds is not None:
+        pcm = pcm[bounds[0]:bounds[1]]
+
+    max_bytes = SPEECH_MAX_SPEECH_SECONDS * BYTES_PER_SECOND
+    capped = len(pcm) > max_bytes
+    if capped:
+        pcm = pcm[:max_bytes]
+
+    info = {'input_ms': input_ms, 'output_ms': pcm_duration_ms(pcm),
+            'speech_detected': bounds is not None, 'capped': capped}
+    with _preprocess_lock:
+        _preprocess_stats['processed'] += 1
+        _preprocess_stats['no_speech'] += bounds is None
+        _preprocess_stats['capped'] += capped
+        _preprocess_stats['input_ms'] += info['input_ms']
+        _preprocess_stats['output_ms'] += info['output_ms']
+    return pcm, info
+
+
+def preprocess_stats():
+    with _preprocess_lock:
+        report = dict(_preprocess_stats)
+    report['removed_ms'] = report['input_ms'] - report['output_ms']
+    report['removed_ratio'] = round(report['removed_ms'] / report['input_ms'], 3) if report['input_ms'] else None
+    report['vad_enabled'] = SPEECH_VAD_ENABLED
+    return report
+
+
+def pcm_audio_config(pcm):
+    """AudioConfig that feeds the recognizer from an in-memory push stream of 16 kHz mono PCM."""
+    stream_format = speechsdk.audio.AudioStreamFormat(
+        samples_per_second=SAMPLE_RATE,
+        bits_per_sample=SAMPLE_WIDTH * 8,
+        channels=CHANNELS,
+    )
+    stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+    for offset in range(0, len(pcm), PUSH_CHUNK_BYTES):
+        stream.write(pcm[offset:offset + PUSH_CHUNK_BYTES])
+    stream.close()
+    return speechsdk.audio.AudioConfig(stream=stream)
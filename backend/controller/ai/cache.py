@@ -0,0 +1,231 @@
+"""
+Small thread-safe caches shared by the AI views: in-process (LRUCache) or backed by a Django
+cache alias that every web process sees (SharedCache).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache bounded by entry count and/or total size.
+
+    max_items -- evict once more than this many entries are stored (None = unbounded)
+    max_bytes -- evict once the summed sizeof(value) exceeds this (None = unbounded)
+    ttl       -- seconds an entry stays valid (None = never expires)
+    """
+
+    def __init__(self, max_items=None, max_bytes=None, ttl=None, sizeof=len):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry):
+        return entry[2] is not None and entry[2] <= time.monotonic()
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self.current_bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self.current_bytes += size
+            while self._data and (
+                (self.max_items is not None and len(self._data) > self.max_items)
+                or (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'max_items': self.max_items,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class SharedCache:
+    """
+    The get/set/delete/stats interface of LRUCache over a Django cache alias (settings.CACHES),
+    for entries other web processes should see. Keys are prefixed with name, values must be
+    picklable, and a failing cache backend reads as a miss.
+    """
+
+    def __init__(self, alias, name, ttl):
+        self.alias = alias
+        self.name = name
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, key):
+        return f'{self.name}:{key}'
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, default=None):
+        try:
+            value = caches[self.alias].get(self._key(key))
+        except Exception:
+            logger.exception(f"Could not read {self._key(key)} from the {self.alias} cache")
+            self._count('errors')
+            value = None
+        self._count('misses' if value is None else 'hits')
+        return default if value is None else value
+
+    def set(self, key, value):
+        try:
+            caches[self.alias].set(self._key(key), value, self.ttl)
+        except Exception:
+            logger.exception(f"Could not store {self._key(key)} in the {self.alias} cache")
+            self._count('errors')
+
+    def delete(self, key):
+        try:
+            caches[self.alias].delete(self._key(key))
+        except Exception:
+            logger.exception(f"Could not delete {self._key(key)} from the {self.alias} cache")
+            self._count('errors')
+
+    def stats(self):
+        with self._lock:
+            return {'store': self.alias, 'hits': self.hits, 'misses': self.misses, 'errors': self.errors}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and remembers recent results.
+
+    do(key, fn) returns (value, shared): a value stored within the last ttl seconds is
+    returned with shared="stored"; if another thread is already computing the key, this one
+    waits for it and gets shared="in_flight"; otherwise fn() runs here and shared is None.
+    A waiting thread gives up after wait_timeout seconds (None waits as long as the first call
+    takes) and runs fn() itself, so a hung call doesn't hold every duplicate with it.
+    Only values for which should_store(value) is true are kept after the call finishes.
+
+    Results go to an in-process LRUCache of max_items entries, or to results (e.g. a
+    SharedCache) so that other processes can answer from them; waiting for a call still
+    running is always per process.
+    """
+
+    def __init__(self, max_items=None, ttl=None, should_store=lambda value: True, wait_timeout=None, results=None):
+        self.results = results if results is not None else LRUCache(max_items=max_items, ttl=ttl)
+        self.should_store = should_store
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.waits = 0
+        self.wait_timeouts = 0
+
+    def do(self, key, fn):
+        # Read outside the lock: a shared store is a network or database round trip
+        value = self.results.get(key)
+        if value is not None:
+            return value, 'stored'
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+            else:
+                self.waits += 1
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.value, 'in_flight'
+            with self._lock:
+                self.wait_timeouts += 1
+            value = fn()
+            if self.should_store(value):
+                self.results.set(key, value)
+            return value, None
+
+        try:
+            call.value = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        else:
+            if self.should_store(call.value):
+                self.results.set(key, call.value)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+        return call.value, None
+
+    def stats(self):
+        with self._lock:
+            report = self.results.stats()
+            report['in_flight'] = len(self._in_flight)
+            report['in_flight_waits'] = self.waits
+            report['in_flight_wait_timeouts'] = self.wait_timeouts
+        return report
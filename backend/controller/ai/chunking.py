@@ -0,0 +1,142 @@
+"""
+Sentence- and token-aware text chunking for RAG ingestion (Rag_Context).
+
+Text is split on sentence and paragraph boundaries with one compiled regex scan, sentence
+token counts come from a single batched tokenizer call, and sentences are packed greedily
+into chunks of at most max_tokens, repeating up to overlap_tokens of trailing sentences at
+the start of the next chunk. Sentences are never cut unless a single sentence is longer
+than max_tokens. A tiny final chunk (fewer than max_tokens // 20 new tokens) is merged into
+the previous one rather than embedded on its own, so the last chunk can run over max_tokens
+by up to max_tokens // 20 - 1 tokens; every other chunk stays within max_tokens.
+
+Token counts use tiktoken's cl100k_base (the text-embedding-3-small tokenizer). If the
+encoding can't be loaded (no tiktoken, or no network to fetch it) counts fall back to an
+estimate of 4 characters per token.
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKENS = 400
+DEFAULT_OVERLAP_TOKENS = 50
+
+# Streamed text is split once this much is buffered (keeps the boundary scan linear)
+FLUSH_CHARS = 20_000
+
+# A blank line, or whitespace after sentence-ending punctuation (optionally followed by
+# a closing quote or bracket)
+SENTENCE_BOUNDARY = re.compile(r'\n\s*\n|(?<=[.!?]["\'”’)\]])\s+|(?<=[.!?])\s+')
+WHITESPACE = re.compile(r'\s+')
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+    return _encoding
+
+
+def count_tokens(texts):
+    """Token counts for a list of texts, in one batched tokenizer call."""
+    encoding = _get_encoding()
+    if encoding is None:
+        return [len(text) // 4 + 1 for text in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
+
+
+def split_sentences(text):
+    sentences = (WHITESPACE.sub(' ', s).strip() for s in SENTENCE_BOUNDARY.split(text))
+    return [s for s in sentences if s]
+
+
+class Chunker:
+    def __init__(self, max_tokens=DEFAULT_MAX_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, count_tokens=count_tokens):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        # A final chunk with fewer new tokens than this is merged into the previous one (which
+        # it overflowed, so the merged chunk is up to min_tokens - 1 over max_tokens)
+        self.min_tokens = max_tokens // 20
+        self.count_tokens = count_tokens
+
+    @property
+    def version(self):
+        """Identifies the chunking output, for content hashes of stored chunks."""
+        return f"sentences-{self.max_tokens}-{self.overlap_tokens}-v1"
+
+    def _split_long(self, sentence):
+        # Only for a single sentence longer than max_tokens: pack its words instead
+        words = sentence.split(' ')
+        piece, piece_tokens = [], 0
+        for word, n in zip(words, self.count_tokens(words)):
+            if piece and piece_tokens + n > self.max_tokens:
+                yield ' '.join(piece), piece_tokens
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += n
+        if piece:
+            yield ' '.join(piece), piece_tokens
+
+    def chunks(self, pieces):
+        """
+        Yield chunks for a stream of text pieces (e.g. one per PDF page). Only the text since
+        the last complete sentence and the chunk being built are held in memory.
+        """
+        current, current_tokens = [], 0   # (sentence, tokens) of the chunk being built
+        carried = 0                        # leading sentences of current repeated as overlap
+        pending = None                     # last finished chunk, held back in case the tail is tiny
+
+        def add(sentences):
+            nonlocal current, current_tokens, carried, pending
+            for sentence, n in zip(sentences, self.count_tokens(sentences)):
+                for part, part_tokens in (self._split_long(sentence) if n > self.max_tokens else [(sentence, n)]):
+                    if current and current_tokens + part_tokens > self.max_tokens:
+                        if pending is not None:
+                            yield pending
+                        pending = ' '.join(s for s, _ in current)
+                        # Carry trailing sentences over as overlap, if they leave room for this one
+                        overlap, overlap_tokens = [], 0
+                        for s, t in reversed(current):
+                            if overlap_tokens + t > self.overlap_tokens:
+                                break
+                            overlap.insert(0, (s, t))
+                            overlap_tokens += t
+                        if overlap_tokens + part_tokens > self.max_tokens:
+                            overlap, overlap_tokens = [], 0
+                        current, current_tokens, carried = overlap, overlap_tokens, len(overlap)
+                    current.append((part, part_tokens))
+                    current_tokens += part_tokens
+
+        buffer = ""
+        for piece in pieces:
+            buffer += piece
+            if len(buffer) >= FLUSH_CHARS:
+                # Text after the last boundary may continue in the next piece
+                last = None
+                for last in SENTENCE_BOUNDARY.finditer(buffer):
+                    pass
+                if last is not None:
+                    yield from add(split_sentences(buffer[:last.start()]))
+                    buffer = buffer[last.end():]
+        yield from add(split_sentences(buffer))
+
+        new = current[carried:]
+        if new and pending is not None and sum(t for _, t in new) < self.min_tokens:
+            # Overlap sentences are already at the end of pending
+            pending = f"{pending} {' '.join(s for s, _ in new)}"
+        elif new:
+            if pending is not None:
+                yield pending
+            pending = ' '.join(s for s, _ in current)
+        if pending is not None:
+            yield pending
@@ -0,0 +1,206 @@
+"""
+Process-wide registry of Azure Speech and Azure OpenAI clients.
+
+Clients are built once per worker process and shared by every request thread:
+
+- AzureOpenAI clients keep an httpx connection pool, so reusing them keeps TLS connections
+  alive instead of handshaking on every request.
+- SpeechConfig objects are shared read-only (one per purpose, never mutated after creation).
+- SpeechSynthesizers hold their websocket open between calls, so idle ones are kept in a small
+  pool and handed to one request at a time.
+
+With AI_SPEECH_BACKEND=standin the speech factories hand out the local stand-ins from
+standin.py instead, for benchmarking without network access (see that module).
+
+timed() records per-client call latency. The first call on a new client includes connection
+setup, so comparing cold vs warm latency in stats() shows the handshake overhead saved.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+import azure.cognitiveservices.speech as speechsdk
+import httpx
+from openai import AzureOpenAI, DefaultHttpxClient
+from . import standin
+from .audio import pcm_audio_config
+
+AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
+AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION", "australiaeast")
+AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
+AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
+AZURE_OPENAI_EMB_ENDPOINT = os.getenv("AZURE_OPENAI_EMB_ENDPOINT")
+AZURE_OPENAI_API_VERSION = "2024-12-01-preview"
+
+# "azure" (default) or "standin" (seeded local fakes, see standin.py)
+AI_SPEECH_BACKEND = os.getenv("AI_SPEECH_BACKEND", "azure")
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", 30))
+SPEECH_SYNTHESIZER_POOL_SIZE = int(os.getenv("SPEECH_SYNTHESIZER_POOL_SIZE", 4))
+
+_lock = threading.Lock()
+_clients = {}
+_stats = {}
+
+
+def _client_stats(name):
+    return _stats.setdefault(name, {
+        'created': 0, 'create_ms': 0.0, 'reused': 0,
+        'calls': 0, 'cold_call_ms': None, 'warm_calls': 0, 'warm_total_ms': 0.0,
+    })
+
+
+def _get(name, factory):
+    client = _clients.get(name)
+    if client is not None:
+        with _lock:
+            _client_stats(name)['reused'] += 1
+        return client
+    with _lock:
+        client = _clients.get(name)  # another thread may have built it while we waited
+        if client is None:
+            start = time.perf_counter()
+            client = factory()
+            stats = _client_stats(name)
+            stats['created'] += 1
+            stats['create_ms'] += (time.perf_counter() - start) * 1000
+            _clients[name] = client
+        else:
+            _client_stats(name)['reused'] += 1
+        return client
+
+
+@contextmanager
+def timed(name):
+    """Time one call made with the named client."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            stats = _client_stats(name)
+            stats['calls'] += 1
+            if stats['cold_call_ms'] is None:
+                stats['cold_call_ms'] = elapsed_ms
+            else:
+                stats['warm_calls'] += 1
+                stats['warm_total_ms'] += elapsed_ms
+
+
+def _openai_client(endpoint):
+    return AzureOpenAI(
+        api_version=AZURE_OPENAI_API_VERSION,
+        azure_endpoint=endpoint,
+        api_key=AZURE_OPENAI_KEY,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        http_client=DefaultHttpxClient(limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+        )),
+    )
+
+
+def chat_client():
+    return _get('chat', lambda: _openai_client(AZURE_OPENAI_ENDPOINT))
+
+
+def embeddings_client():
+    return _get('embeddings', lambda: _openai_client(AZURE_OPENAI_EMB_ENDPOINT))
+
+
+def speech_available():
+    return AI_SPEECH_BACKEND == 'standin' or bool(AZURE_SPEECH_KEY)
+
+
+def speech_config():
+    """Shared SpeechConfig for recognition (None with the stand-in backend). Treat as read-only."""
+    if AI_SPEECH_BACKEND == 'standin':
+        return None
+    return _get('speech_recognition', lambda: speechsdk.SpeechConfig(
+        subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION
+    ))
+
+
+def synthesis_config(output_format):
+    """Shared SpeechConfig for synthesis in the given output format. Treat as read-only."""
+    def build():
+        config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_SPEECH_REGION)
+        config.set_speech_synthesis_output_format(output_format)
+        return config
+    return _get(f'speech_synthesis:{output_format.name}', build)
+
+
+def speech_recognizer(speech_config, pcm, pronunciation_config=None):
+    """Recognizer fed from 16 kHz mono PCM, with pronunciation assessment applied when a config is given."""
+    if AI_SPEECH_BACKEND == 'standin':
+        return standin.SpeechRecognizer(pcm, pronunciation_config)
+    recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=pcm_audio_config(pcm))
+    if pronunciation_config is not None:
+        pronunciation_config.apply_to(recognizer)
+    return recognizer
+
+
+def audio_data_stream(result):
+    """Pull stream over a started synthesis result."""
+    if AI_SPEECH_BACKEND == 'standin':
+        return standin.AudioDataStream(result)
+    return speechsdk.AudioDataStream(result)
+
+
+_synthesizer_pools = {}  # output format name -> LifoQueue of idle synthesizers
+
+
+def _synthesizer_pool(output_format):
+    with _lock:
+        return _synthesizer_pools.setdefault(output_format.name, queue.LifoQueue(maxsize=SPEECH_SYNTHESIZER_POOL_SIZE))
+
+
+def acquire_synthesizer(output_format):
+    """
+    Take an idle SpeechSynthesizer (its connection is likely still open) or build a new one.
+    Hand it back with release_synthesizer() once the synthesis has fully finished.
+    """
+    try:
+        synthesizer = _synthesizer_pool(output_format).get_nowait()
+        with _lock:
+            _client_stats('speech_synthesizer')['reused'] += 1
+        return synthesizer
+    except queue.Empty:
+        pass
+    start = time.perf_counter()
+    if AI_SPEECH_BACKEND == 'standin':
+        synthesizer = standin.SpeechSynthesizer()
+    else:
+        # audio_config=None keeps the output in memory instead of a file or speaker
+        synthesizer = speechsdk.SpeechSynthesizer(speech_config=synthesis_config(output_format), audio_config=None)
+    with _lock:
+        stats = _client_stats('speech_synthesizer')
+        stats['created'] += 1
+        stats['create_ms'] += (time.perf_counter() - start) * 1000
+    return synthesizer
+
+
+def release_synthesizer(synthesizer, output_format):
+    try:
+        _synthesizer_pool(output_format).put_nowait(synthesizer)
+    except queue.Full:
+        pass  # pool is full, let this one be garbage collected
+
+
+def stats():
+    with _lock:
+        report = {}
+        for name, s in _stats.items():
+            report[name] = {
+                'created': s['created'],
+                'reused': s['reused'],
+                'create_ms': round(s['create_ms'], 1),
+                'calls': s['calls'],
+                'cold_call_ms': round(s['cold_call_ms'], 1) if s['cold_call_ms'] is not None else None,
+                'warm_avg_ms': round(s['warm_total_ms'] / s['warm_calls'], 1) if s['warm_calls'] else None,
+            }
+        report['idle_synthesizers'] = {name: pool.qsize() for name, pool in _synthesizer_pools.items()}
+        return report
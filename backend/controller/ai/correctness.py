@@ -0,0 +1,84 @@
+"""
+Answer-correctness check for speech attempts against the question's expected answers.
+
+A transcript that contains an expected answer word-for-word is marked correct without any
+API call. Otherwise the (cached) transcript embedding is compared with the question's
+Question_Embedding rows. A question only has a handful of expected answers, so they are
+ranked here exactly rather than through the HNSW index on Question_Embedding.embedding
+(migration 0021): an ANN scan applies the question filter after the search and can come
+back empty when the question's answers are not among the ef_search candidates. Both sides are embedded in the same
+normalised form (normalise_transcript: lowercase, no punctuation) - populate_question_embeddings
+normalises the expected answers before embedding them.
+
+    CORRECTNESS_CHECK_ENABLED   "1" (default) or "0"
+    CORRECTNESS_THRESHOLD       cosine similarity counted as correct (default 0.7)
+"""
+import logging
+import os
+import re
+import numpy as np
+from django.core.exceptions import ValidationError
+from ..models import Question_Embedding
+from .embeddings import embed_text
+from .feedback import normalise_transcript
+
+logger = logging.getLogger(__name__)
+
+CORRECTNESS_CHECK_ENABLED = os.getenv("CORRECTNESS_CHECK_ENABLED", "1") == "1"
+CORRECTNESS_THRESHOLD = float(os.getenv("CORRECTNESS_THRESHOLD", 0.7))
+
+
+def nearest_answer(vector, answers):
+    """(expected_answer_text, cosine similarity) of the answer nearest to vector, or None."""
+    texts = [text for text, _ in answers]
+    matrix = np.asarray([embedding for _, embedding in answers], dtype=np.float32)
+    query = np.asarray(vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    if not norms.any():
+        return None
+    similarities = np.divide(matrix @ query, norms, out=np.zeros(len(texts), dtype=np.float32), where=norms > 0)
+    best = int(np.argmax(similarities))
+    return texts[best], float(similarities[best])
+
+
+def check_answer(question_id, transcript):
+    """
+    Returns {"is_correct", "similarity", "matched_answer", "method"}, or None when the check is
+    disabled, the question has no expected answers, or the embedding call fails.
+    """
+    if not CORRECTNESS_CHECK_ENABLED or not question_id or not transcript:
+        return None
+
+    try:
+        answers = list(Question_Embedding.objects.filter(
+            question_id=question_id
+        ).values_list('expected_answer_text', 'embedding'))
+    except (ValidationError, ValueError):
+        return None
+    if not answers:
+        return None
+
+    spoken = normalise_transcript(transcript)
+    for answer, _ in answers:
+        expected = normalise_transcript(answer)
+        if expected and re.search(rf'\b{re.escape(expected)}\b', spoken):
+            return {'is_correct': True, 'similarity': 1.0, 'matched_answer': answer, 'method': 'exact'}
+
+    try:
+        vector = embed_text(spoken)
+    except Exception as e:
+        logger.warning(f"Correctness check skipped, embedding failed: {e}")
+        return None
+
+    nearest = nearest_answer(vector, answers)
+    if nearest is None:
+        return None
+
+    matched_answer, similarity = nearest
+    similarity = round(similarity, 4)
+    return {
+        'is_correct': similarity >= CORRECTNESS_THRESHOLD,
+        'similarity': similarity,
+        'matched_answer': matched_answer,
+        'method': 'embedding',
+    }
@@ -0,0 +1,63 @@
+"""
+Text embeddings (Azure OpenAI text-embedding-3-small) with an in-process cache.
+
+Transcripts are normalised before lookup, so a child repeating the same answer - or many
+children giving the same short answer - costs one embedding API call per worker.
+"""
+import os
+from . import clients
+from .cache import LRUCache
+from .feedback import normalise_transcript
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+
+# Azure OpenAI embedding request limits: 2048 inputs and ~300k tokens per request.
+# Token counts are estimated at 4 characters per token, with headroom.
+EMBEDDING_MAX_BATCH_INPUTS = 2048
+EMBEDDING_MAX_BATCH_TOKENS = 250_000
+
+embedding_cache = LRUCache(max_items=EMBEDDING_CACHE_SIZE)
+
+
+def embed_text(text):
+    """Embedding vector for text, served from the cache when the normalised text was seen before."""
+    key = normalise_transcript(text)
+    vector = embedding_cache.get(key)
+    if vector is None:
+        with clients.timed('embeddings'):
+            response = clients.embeddings_client().embeddings.create(model=EMBEDDING_MODEL, input=key)
+        vector = response.data[0].embedding
+        embedding_cache.set(key, vector)
+    return vector
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def iter_batches(texts, batch_size=EMBEDDING_MAX_BATCH_INPUTS, max_tokens=EMBEDDING_MAX_BATCH_TOKENS):
+    """Split texts into consecutive batches that fit one embeddings request."""
+    batch_size = min(batch_size, EMBEDDING_MAX_BATCH_INPUTS)
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def embed_batch(texts):
+    """Embed a list of texts with one API call. Returns vectors in input order (not cached)."""
+    with clients.timed('embeddings'):
+        response = clients.embeddings_client().embeddings.create(model=EMBEDDING_MODEL, input=list(texts))
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def stats():
+    return embedding_cache.stats()
@@ -0,0 +1,207 @@
+"""
+Feedback engine for speech attempts.
+
+Feedback for an attempt is looked up in this order:
+
+1. an in-process cache keyed on (question, normalised transcript, feedback band - the
+   pronunciation score band, or "incorrect" when the answer check failed),
+   so the same answer to the same question gets instant feedback;
+2. GPT, bounded by a latency budget - if the budget runs out the child gets a template instead,
+   and the GPT answer is cached when it arrives so the next identical attempt gets it;
+3. the pre-written templates in phrases.FEEDBACK_TEMPLATES.
+
+Configured with environment variables:
+
+    FEEDBACK_MODE             "gpt" (default) or "template" (never call GPT)
+    FEEDBACK_LATENCY_BUDGET_MS  longest we wait for GPT before using a template (default 1500)
+    FEEDBACK_CACHE_SIZE       cached feedback entries (default 2048)
+    FEEDBACK_CACHE_TTL        seconds a cached entry is reused (default 1 day)
+    FEEDBACK_GPT_WORKERS      concurrent GPT feedback calls (default 8)
+    FEEDBACK_GPT_MAX_PENDING  GPT calls running or queued at once; past it attempts go straight
+                              to a template (default 2 x FEEDBACK_GPT_WORKERS)
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from . import clients
+from .cache import LRUCache
+from .phrases import FEEDBACK_TEMPLATES
+
+logger = logging.getLogger(__name__)
+
+FEEDBACK_MODE = os.getenv("FEEDBACK_MODE", "gpt")
+FEEDBACK_LATENCY_BUDGET_MS = int(os.getenv("FEEDBACK_LATENCY_BUDGET_MS", 1500))
+FEEDBACK_CACHE_SIZE = int(os.getenv("FEEDBACK_CACHE_SIZE", 2048))
+FEEDBACK_CACHE_TTL = int(os.getenv("FEEDBACK_CACHE_TTL", 24 * 60 * 60))
+FEEDBACK_GPT_WORKERS = int(os.getenv("FEEDBACK_GPT_WORKERS", 8))
+FEEDBACK_GPT_MAX_PENDING = int(os.getenv("FEEDBACK_GPT_MAX_PENDING", 2 * FEEDBACK_GPT_WORKERS))
+
+FEEDBACK_MODEL = "gpt-4o-mini"
+
+SYSTEM_PROMPT = """
+You are an encouraging, friendly speech therapist helping children practice pronunciation and speaking skills.
+Provide constructive feedback on their pronunciation and how well they answered the question.
+If the child's response deviates from the question, gently redirect them.
+Follow professional speech pathologist guidelines when interacting with the child.
+"""
+
+feedback_cache = LRUCache(max_items=FEEDBACK_CACHE_SIZE, ttl=FEEDBACK_CACHE_TTL)
+_gpt_pool = ThreadPoolExecutor(max_workers=FEEDBACK_GPT_WORKERS, thread_name_prefix='feedback-gpt')
+# The pool's own queue is unbounded, and calls that outlive the latency budget keep running,
+# so this caps how many can pile up behind a slow GPT deployment
+_gpt_slots = threading.BoundedSemaphore(FEEDBACK_GPT_MAX_PENDING)
+
+_stats_lock = threading.Lock()
+_stats = {'cache_hits': 0, 'gpt': 0, 'gpt_timeouts': 0, 'gpt_errors': 0, 'gpt_saturated': 0, 'templates': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def normalise_transcript(text):
+    text = re.sub(r"[^\w\s']", ' ', (text or '').lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def score_band(pronunciation_score):
+    if pronunciation_score is None:
+        return 'mid'
+    if pronunciation_score >= 80:
+        return 'high'
+    if pronunciation_score >= 60:
+        return 'mid'
+    return 'low'
+
+
+def feedback_band(pron_data, correctness=None):
+    # A wrong answer never gets the praise templates, however clearly it was spoken
+    if correctness is not None and not correctness['is_correct']:
+        return 'incorrect'
+    return score_band(pron_data.get('pronunciation_score'))
+
+
+def template_feedback(band, transcript):
+    # Pick deterministically so a retried attempt hears the same thing
+    templates = FEEDBACK_TEMPLATES[band]
+    digest = hashlib.sha256(normalise_transcript(transcript).encode('utf-8')).digest()
+    return templates[digest[0] % len(templates)]
+
+
+def clean_feedback(feedback_text):
+    labels_to_remove = [
+        r'Encouraging Summary\s*:\s*',
+        r'Area to Improve\s*:\s*',
+        r'Motivational Line\s*:\s*'
+    ]
+
+    for label in labels_to_remove:
+        feedback_text = re.sub(label, '', feedback_text, flags=re.IGNORECASE)
+
+    # clean up gpt feedback
+    feedback_text = re.sub(r'^\s*(?:\d+[\.\)]\s*|[-*•]\s*|[#*]+)\s*', '', feedback_text, flags=re.MULTILINE)
+    feedback_text = re.sub(r'[^\w\s.,!?\'"]+', '', feedback_text)
+    return re.sub(r'\s+', ' ', feedback_text).strip()
+
+
+def user_prompt(question_text, transcript, pron_data, correctness=None, guidance=None):
+    answer_check = ""
+    if correctness is not None:
+        verdict = "answered the question correctly" if correctness['is_correct'] else "did not give an expected answer"
+        answer_check = f'Answer check: the child {verdict} (closest expected answer: "{correctness["matched_answer"]}").'
+    guidance_text = ""
+    if guidance:
+        excerpts = "\n".join(f"- {chunk}" for chunk in guidance)
+        guidance_text = f"Relevant clinical guidance (use it to shape the feedback, do not quote it):\n{excerpts}"
+    return f"""
+    {guidance_text}
+    Question asked: "{question_text}"
+    Child's speech: "{transcript}"
+
+    Pronunciation Assessment Results: {json.dumps(pron_data, indent=2)}
+    {answer_check}
+
+    Generate exactly three sentences giving feedback:
+    - First sentence: encouraging and positive about their effort
+    - Second sentence: constructive feedback on pronunciation or clarity
+    - Third sentence: fun motivational line
+    DO NOT include any headings, labels, numbers, bullets, markdown symbols, or emojis.
+    Output ONLY the sentences themselves, nothing else.
+    """
+
+
+def gpt_feedback(question_text, transcript, pron_data, correctness=None, guidance=None):
+    with clients.timed('chat'):
+        response_gpt = clients.chat_client().chat.completions.create(
+            model=FEEDBACK_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt(question_text, transcript, pron_data, correctness, guidance)}
+            ],
+            max_tokens=300,
+            temperature=0.8,
+        )
+    return clean_feedback(response_gpt.choices[0].message.content or "")
+
+
+def generate_feedback(question_id, question_text, transcript, pron_data, correctness=None, guidance=None):
+    """
+    Return (feedback_text, source) where source is "cache", "gpt" or "template".
+    guidance is a list of clinical guidance excerpts added to the GPT prompt.
+    """
+    band = feedback_band(pron_data, correctness)
+    key = (question_id or question_text, normalise_transcript(transcript), band)
+
+    cached = feedback_cache.get(key)
+    if cached is not None:
+        _count('cache_hits')
+        return cached, 'cache'
+
+    if FEEDBACK_MODE == 'template' or not clients.AZURE_OPENAI_ENDPOINT:
+        _count('templates')
+        return template_feedback(band, transcript), 'template'
+
+    if not _gpt_slots.acquire(blocking=False):
+        _count('gpt_saturated')
+        _count('templates')
+        return template_feedback(band, transcript), 'template'
+    future = _gpt_pool.submit(gpt_feedback, question_text, transcript, pron_data, correctness, guidance)
+
+    def store(done):
+        _gpt_slots.release()
+        if not done.cancelled() and done.exception() is None and done.result():
+            feedback_cache.set(key, done.result())
+    future.add_done_callback(store)
+
+    try:
+        text = future.result(timeout=FEEDBACK_LATENCY_BUDGET_MS / 1000)
+    except FutureTimeoutError:
+        # Still queued: nobody is waiting for it any more, so free the slot now
+        future.cancel()
+        _count('gpt_timeouts')
+        logger.info(f"GPT feedback exceeded {FEEDBACK_LATENCY_BUDGET_MS}ms budget, using template")
+    except Exception as e:
+        _count('gpt_errors')
+        logger.warning(f"GPT feedback failed, using template: {e}")
+    else:
+        if text:
+            _count('gpt')
+            return text, 'gpt'
+
+    _count('templates')
+    return template_feedback(band, transcript), 'template'
+
+
+def stats():
+    with _stats_lock:
+        report = dict(_stats)
+    report['cache'] = feedback_cache.stats()
+    report['mode'] = FEEDBACK_MODE
+    report['latency_budget_ms'] = FEEDBACK_LATENCY_BUDGET_MS
+    report['gpt_max_pending'] = FEEDBACK_GPT_MAX_PENDING
+    return report
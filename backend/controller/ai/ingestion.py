@@ -0,0 +1,162 @@
+"""
+Incremental ingestion of documents into Rag_Context (used by ai-pipeline/populate_documents.py).
+
+Every stored chunk carries a content hash of (chunker version, source name, chunk text), so a
+re-run only embeds chunks it has not stored before:
+
+- unchanged chunks are skipped without an embeddings call;
+- chunks a document no longer produces (edited document, new chunker version, rows from
+  before content hashing) are deleted once the document has been fully ingested, and
+  remove_deleted_sources drops the chunks of documents that are gone;
+- each embedded batch commits on its own, so an interrupted run resumes after the last
+  committed batch.
+
+ingest_in_processes spreads documents over worker processes (extraction is CPU bound) and
+splits the embeddings in-flight budget between them, so the deployment never sees more than
+max_in_flight requests from one run.
+"""
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from django.db import connections, transaction
+from django.utils import timezone
+from ..models import Rag_Context
+from .chunking import Chunker
+from .embeddings import embed_batch, iter_batches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 64     # chunks per embeddings request
+DEFAULT_MAX_IN_FLIGHT = 4   # embeddings requests running at once (across all processes)
+
+# Sentence-aware chunks of at most ~400 tokens with ~50 tokens of sentence overlap
+chunker = Chunker()
+
+
+def content_hash(source_name, chunk):
+    # The chunker version changes whenever the chunking output does, so all documents are
+    # re-chunked and re-embedded on the next run
+    return hashlib.sha256(f"{chunker.version}\0{source_name}\0{chunk}".encode("utf-8")).hexdigest()
+
+
+def save_batch(chunks, embeddings, source_name, source_url):
+    now = timezone.now()
+    with transaction.atomic():
+        Rag_Context.objects.bulk_create([
+            Rag_Context(
+                id=uuid.uuid4(),
+                source_name=source_name,
+                source_url=source_url,
+                content_chunk=chunk,
+                content_hash=content_hash(source_name, chunk),
+                embedding=embedding,
+                created_at=now,
+            )
+            for chunk, embedding in zip(chunks, embeddings)
+        ], ignore_conflicts=True)
+
+
+def remove_deleted_sources(source_names):
+    """Delete chunks of documents not in source_names. Returns the number of chunks deleted."""
+    deleted, _ = Rag_Context.objects.exclude(source_name__in=source_names).delete()
+    if deleted:
+        logger.info(f"Removed {deleted} chunks from deleted documents")
+    return deleted
+
+
+def ingest_document(source_name, source_url, page_texts, batch_size=DEFAULT_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Embed and store the new chunks of one document, given as a stream of page texts.
+    Returns the number of chunks stored.
+
+    Pages are chunked, hashed and embedded as a stream: besides the set of chunk hashes,
+    memory holds at most max_in_flight batches of chunk text at a time.
+    """
+    start = time.perf_counter()
+
+    existing = set(Rag_Context.objects.filter(source_name=source_name).exclude(
+        content_hash=""
+    ).values_list("content_hash", flat=True))
+    seen = set()
+
+    def new_chunks():
+        for chunk in chunker.chunks(page_texts):
+            h = content_hash(source_name, chunk)
+            if h in seen:
+                continue
+            seen.add(h)
+            if h not in existing:
+                yield chunk
+
+    stored = failed = 0
+
+    def finish(future, batch):
+        nonlocal stored, failed
+        try:
+            save_batch(batch, future.result(), source_name, source_url)
+        except Exception as e:
+            failed += len(batch)
+            logger.warning(f"[{source_name}] Error embedding batch of {len(batch)} chunks: {e}")
+            return
+        stored += len(batch)
+        logger.info(f"[{source_name}] {stored} chunks added")
+
+    # At most max_in_flight embedding requests run at once; each finished batch is
+    # written with one bulk insert as soon as it comes back.
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = {}
+        for batch in iter_batches(new_chunks(), batch_size):
+            if len(in_flight) >= max_in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future, in_flight.pop(future))
+            in_flight[pool.submit(embed_batch, batch)] = batch
+        for future in as_completed(in_flight):
+            finish(future, in_flight[future])
+
+    if not seen:
+        logger.info(f"No readable text in {source_name}")
+
+    # Skipped if a batch failed, so the next run can retry it without losing the old rows first
+    stale = 0
+    if not failed:
+        stale, _ = Rag_Context.objects.filter(source_name=source_name).exclude(content_hash__in=list(seen)).delete()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Finished '{source_name}': {len(seen)} chunks, {len(seen & existing)} unchanged, {stale} stale removed, "
+        f"{stored} added in {elapsed:.1f}s ({stored / elapsed if elapsed else 0:.1f} chunks/s)"
+    )
+    return stored
+
+
+def split_in_flight(max_in_flight, processes):
+    """(processes, per-process in-flight limit) that together run at most max_in_flight requests."""
+    processes = max(1, min(processes, max_in_flight))
+    return processes, max(1, max_in_flight // processes)
+
+
+def _init_worker():
+    # Never reuse a database connection inherited from the parent process
+    connections.close_all()
+
+
+def ingest_in_processes(ingest, paths, processes, batch_size=DEFAULT_BATCH_SIZE, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """
+    Run ingest(path, batch_size, per-process max_in_flight) for each path in worker processes;
+    ingest must be a module-level function. Returns the total number of chunks stored.
+    """
+    processes, per_process = split_in_flight(max_in_flight, min(processes, len(paths)))
+    total = 0
+    # Close our connection before the workers start so none of them inherits it
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker) as pool:
+        futures = {pool.submit(ingest, path, batch_size, per_process): path for path in paths}
+        for future in as_completed(futures):
+            try:
+                total += future.result()
+            except Exception as e:
+                logger.warning(f"Failed to process {futures[future]}: {e}")
+    return total
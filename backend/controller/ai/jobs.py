@@ -0,0 +1,256 @@
+"""
+Bounded background job queue for slow AI work (speech assessment).
+
+A request submits a job and gets its ID back at once; a fixed pool of worker threads runs
+the jobs, and the client polls (or long-polls) for the result. When the queue is full,
+submit() raises QueueFull so the view can answer 503 with a Retry-After estimate instead of
+tying up a web worker.
+
+Jobs run on the threads of the web process that accepted them, but their state is written to
+the Django cache alias SPEECH_JOB_CACHE (settings.CACHES), so a poll answered by any other
+gunicorn process sees it. Production points that alias at the database cache; the local
+memory cache used for development and tests is per-process. Finished jobs are kept for
+SPEECH_JOB_RESULT_TTL seconds. Queued and running jobs expire after SPEECH_JOB_STALE_SECONDS, so
+a job lost with a restarted process turns into a 404 (resubmit) instead of polling forever.
+
+    SPEECH_JOB_WORKERS          jobs run at once per web process (default 4)
+    SPEECH_JOB_QUEUE_SIZE       jobs waiting before new ones are rejected (default 16)
+    SPEECH_JOB_RESULT_TTL       seconds a finished job's result can be fetched (default 5 minutes)
+    SPEECH_JOB_STALE_SECONDS    seconds an unfinished job is reported before it counts as lost (default 5 minutes)
+    SPEECH_JOB_CACHE            cache alias holding job state (default "speech_jobs")
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from django.core.cache import caches
+from django.db import close_old_connections
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+SPEECH_JOB_WORKERS = int(os.getenv("SPEECH_JOB_WORKERS", 4))
+SPEECH_JOB_QUEUE_SIZE = int(os.getenv("SPEECH_JOB_QUEUE_SIZE", 16))
+SPEECH_JOB_RESULT_TTL = int(os.getenv("SPEECH_JOB_RESULT_TTL", 5 * 60))
+SPEECH_JOB_STALE_SECONDS = int(os.getenv("SPEECH_JOB_STALE_SECONDS", 5 * 60))
+SPEECH_JOB_CACHE = os.getenv("SPEECH_JOB_CACHE", "speech_jobs")
+# Jobs of this process that can still be waited on without polling the shared store
+SPEECH_JOB_STORE_SIZE = int(os.getenv("SPEECH_JOB_STORE_SIZE", 1024))
+# How often wait() re-reads the shared store for a job running in another process
+SPEECH_JOB_POLL_SECONDS = 0.25
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Job queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    """One queued call. fn returns (payload, http_status)."""
+
+    def __init__(self, fn, args):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.args = args
+        self.state = 'queued'  # queued -> running -> done | failed
+        self.payload = None
+        self.status_code = None
+        self.submitted_at = time.monotonic()
+        self.submitted_ts = time.time()
+        self.started_ts = None
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @property
+    def queue_ms(self):
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return int((end - self.submitted_at) * 1000)
+
+    @property
+    def run_ms(self):
+        if self.started_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return int((end - self.started_at) * 1000)
+
+    def snapshot(self):
+        """The job's state as stored in the shared cache (wall-clock times, so any process can read it)."""
+        return {'job_id': self.id, 'status': self.state, 'submitted_at': self.submitted_ts,
+                'started_at': self.started_ts, 'queue_ms': self.queue_ms,
+                'run_ms': self.run_ms if self.finished_at is not None else None,
+                'payload': self.payload, 'status_code': self.status_code}
+
+
+def is_finished(snapshot):
+    return snapshot['status'] in ('done', 'failed')
+
+
+def describe(snapshot):
+    """Public fields of a stored job; times of unfinished jobs are measured up to now."""
+    now = time.time()
+    queue_ms, run_ms = snapshot['queue_ms'], snapshot['run_ms']
+    if snapshot['started_at'] is None:
+        queue_ms = int((now - snapshot['submitted_at']) * 1000)
+    elif run_ms is None:
+        run_ms = int((now - snapshot['started_at']) * 1000)
+    return {'job_id': snapshot['job_id'], 'status': snapshot['status'], 'queue_ms': queue_ms, 'run_ms': run_ms}
+
+
+class JobQueue:
+    def __init__(self, workers=SPEECH_JOB_WORKERS, queue_size=SPEECH_JOB_QUEUE_SIZE,
+                 result_ttl=SPEECH_JOB_RESULT_TTL, name='jobs', store=SPEECH_JOB_CACHE):
+        self.workers = workers
+        self.name = name
+        self.result_ttl = result_ttl
+        self.store = store
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = LRUCache(max_items=SPEECH_JOB_STORE_SIZE, ttl=max(result_ttl, SPEECH_JOB_STALE_SECONDS))
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0,
+                       'queue_ms_total': 0, 'run_ms_total': 0}
+        self._stage_ms = {}  # stage -> [calls, total ms], from the "timings" of job payloads
+
+    def _start_workers(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'{self.name}-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up."""
+        with self._lock:
+            finished = self._stats['completed'] + self._stats['failed']
+            avg_run_s = self._stats['run_ms_total'] / finished / 1000 if finished else 1.0
+        return max(1, round(self._queue.qsize() * avg_run_s / max(self.workers, 1)))
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) and return the Job. Raises QueueFull when there is no room."""
+        self._start_workers()
+        job = Job(fn, args)
+        # Published before a worker can see the job, so this "queued" snapshot can never land
+        # after (and overwrite) the worker's "running" or "done" one
+        self._jobs.set(job.id, job)
+        self._publish(job)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self._jobs.delete(job.id)
+            self._unpublish(job)
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise QueueFull(self.retry_after())
+        with self._lock:
+            self._stats['submitted'] += 1
+        return job
+
+    def _key(self, job_id):
+        return f'{self.name}:{job_id}'
+
+    def _publish(self, job):
+        timeout = self.result_ttl if job.finished_at is not None else SPEECH_JOB_STALE_SECONDS
+        try:
+            caches[self.store].set(self._key(job.id), job.snapshot(), timeout)
+        except Exception:
+            # Polls answered by this process still see the job through self._jobs
+            logger.exception(f"Could not store the state of job {job.id}")
+
+    def _unpublish(self, job):
+        try:
+            caches[self.store].delete(self._key(job.id))
+        except Exception:
+            logger.exception(f"Could not remove the state of job {job.id}")
+
+    def get(self, job_id):
+        """The stored state of a job (see Job.snapshot), or None if unknown, expired or lost."""
+        if not job_id:
+            return None
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        try:
+            return caches[self.store].get(self._key(job_id))
+        except Exception:
+            logger.exception(f"Could not read the state of job {job_id}")
+            return None
+
+    def wait(self, job_id, timeout):
+        """The job's state after waiting up to timeout seconds for it to finish (None if unknown)."""
+        job = self._jobs.get(job_id) if job_id else None
+        if job is not None:
+            if timeout > 0:
+                job.done.wait(timeout)
+            return job.snapshot()
+        # Running in another process: re-read the shared store until it finishes or time runs out
+        deadline = time.monotonic() + max(timeout, 0)
+        snapshot = self.get(job_id)
+        while snapshot is not None and not is_finished(snapshot) and time.monotonic() < deadline:
+            time.sleep(min(SPEECH_JOB_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+            snapshot = self.get(job_id)
+        return snapshot
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.monotonic()
+            job.started_ts = time.time()
+            job.state = 'running'
+            self._publish(job)
+            with self._lock:
+                self._running += 1
+            close_old_connections()
+            try:
+                job.payload, job.status_code = job.fn(*job.args)
+                job.state = 'done'
+            except Exception as e:
+                logger.exception(f"Job {job.id} failed")
+                job.payload, job.status_code = {'error': f'Job failed: {e}'}, 500
+                job.state = 'failed'
+            finally:
+                close_old_connections()
+                job.finished_at = time.monotonic()
+                # Re-store so the result TTL counts from completion
+                self._jobs.set(job.id, job)
+                self._publish(job)
+                self._record(job)
+                job.done.set()
+                self._queue.task_done()
+
+    def _record(self, job):
+        timings = job.payload.get('timings') if isinstance(job.payload, dict) else None
+        with self._lock:
+            self._running -= 1
+            self._stats['completed' if job.state == 'done' else 'failed'] += 1
+            self._stats['queue_ms_total'] += job.queue_ms
+            self._stats['run_ms_total'] += job.run_ms
+            for stage, ms in (timings or {}).items():
+                if isinstance(ms, (int, float)):
+                    totals = self._stage_ms.setdefault(stage, [0, 0])
+                    totals[0] += 1
+                    totals[1] += ms
+
+    def stats(self):
+        with self._lock:
+            finished = self._stats['completed'] + self._stats['failed']
+            return {
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'running': self._running,
+                'submitted': self._stats['submitted'],
+                'rejected': self._stats['rejected'],
+                'completed': self._stats['completed'],
+                'failed': self._stats['failed'],
+                'avg_queue_ms': round(self._stats['queue_ms_total'] / finished, 1) if finished else None,
+                'avg_run_ms': round(self._stats['run_ms_total'] / finished, 1) if finished else None,
+                'avg_stage_ms': {stage: round(total / calls, 1) for stage, (calls, total) in self._stage_ms.items()},
+            }
+
+
+speech_jobs = JobQueue(name='speech-job')
@@ -0,0 +1,43 @@
+"""
+Standard lines the app speaks to children. Kept in one place so the TTS pre-synthesis
+command (presynthesize_tts) can render them ahead of time.
+"""
+
+ENCOURAGEMENT_PHRASES = [
+    "Great job!",
+    "Good job!",
+    "Excellent!",
+    "Well done!",
+    "Amazing work!",
+    "You did it!",
+    "Keep going, you're doing great!",
+    "Nice try! Let's try again.",
+    "Try again",
+    "Take your time and have another go.",
+]
+
+# Ready-made three-sentence feedback (encouragement, pronunciation tip, motivational line),
+# grouped by pronunciation score band, plus "incorrect" for answers the correctness check
+# rejected (so a clearly spoken wrong answer is not praised as right). Used when GPT feedback
+# is disabled, fails, or is too slow.
+FEEDBACK_TEMPLATES = {
+    'high': [
+        "Wow, you did a fantastic job answering that question! Your words were clear and easy to understand. Keep shining like a superstar!",
+        "That was a brilliant answer, well done! You said every sound really clearly. You are becoming an amazing talker!",
+        "Great work, I loved listening to you! Your speaking was smooth and clear. Let's see what you can do next!",
+    ],
+    'mid': [
+        "Good job, you gave that a really great try! Try saying each word a little more slowly so every sound comes out clearly. You're getting better every time!",
+        "Nice work answering the question! Remember to open your mouth wide and say the sounds nice and clearly. Keep practising and you'll be a speaking star!",
+        "Well done for having a go! Take a big breath and say your words slowly so I can hear every sound. You're doing wonderfully, keep going!",
+    ],
+    'low': [
+        "Thank you for trying, that was very brave! Let's try saying it again slowly, one word at a time. Every try makes you stronger!",
+        "Great effort, I'm proud of you for giving it a go! Listen carefully to the question and say your answer nice and slowly. You can do it, let's try once more!",
+        "You're doing so well by practising! Try speaking a little louder and slower so every sound can shine. Let's have another go together!",
+    ],    'incorrect': [
+        "Good try, I love how you spoke up! That wasn't quite the answer, so listen to the question once more and think about what it asks. Let's have another go together!",
+        "Thank you for answering so bravely! Your words came out nicely, but the answer is something different, so take another look at the question. You can do it, let's try again!",
+        "Nice speaking, well done for having a go! That answer doesn't quite fit the question, so think carefully and try once more. Every try helps you learn!",
+    ],
+}
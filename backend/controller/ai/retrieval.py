@@ -0,0 +1,77 @@
+"""
+Retrieval of clinical guidance (Rag_Context chunks) for the GPT feedback prompt.
+
+The top-k chunks nearest to the question text are found with the HNSW index on
+Rag_Context.embedding (migration 0023). The chunk IDs are memoised per question for
+RAG_CACHE_TTL seconds, so each question costs at most one vector query per TTL window;
+later attempts only fetch the cached chunks by primary key.
+
+    RAG_RETRIEVAL_ENABLED   "1" or "0" (default - feedback prompts carry no guidance)
+    RAG_TOP_K               guidance chunks per prompt (default 3)
+    RAG_CACHE_SIZE          questions whose chunk IDs are memoised (default 1024)
+    RAG_CACHE_TTL           seconds memoised chunk IDs are reused (default 1 hour)
+"""
+import logging
+import os
+import threading
+from pgvector.django import CosineDistance
+from ..models import Rag_Context
+from .cache import LRUCache
+from .embeddings import embed_text
+
+logger = logging.getLogger(__name__)
+
+RAG_RETRIEVAL_ENABLED = os.getenv("RAG_RETRIEVAL_ENABLED", "0") == "1"
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", 3))
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", 1024))
+RAG_CACHE_TTL = int(os.getenv("RAG_CACHE_TTL", 60 * 60))
+
+retrieval_cache = LRUCache(max_items=RAG_CACHE_SIZE, ttl=RAG_CACHE_TTL)
+
+_stats_lock = threading.Lock()
+_stats = {'vector_queries': 0, 'errors': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def nearest_chunks(query_text, k=RAG_TOP_K):
+    """[(id, content_chunk)] of the k chunks nearest to query_text."""
+    vector = embed_text(query_text)
+    _count('vector_queries')
+    return list(Rag_Context.objects.annotate(
+        distance=CosineDistance('embedding', vector)
+    ).order_by('distance').values_list('id', 'content_chunk')[:k])
+
+
+def retrieve_guidance(question_id, question_text):
+    """Guidance chunk texts for the question, nearest first ([] when disabled or on failure)."""
+    if not RAG_RETRIEVAL_ENABLED or not question_text:
+        return []
+    key = question_id or question_text
+
+    try:
+        chunk_ids = retrieval_cache.get(key)
+        if chunk_ids is None:
+            chunks = nearest_chunks(question_text)
+            retrieval_cache.set(key, [chunk_id for chunk_id, _ in chunks])
+            return [text for _, text in chunks]
+
+        texts = dict(Rag_Context.objects.filter(id__in=chunk_ids).values_list('id', 'content_chunk'))
+    except Exception as e:
+        _count('errors')
+        logger.warning(f"Guidance retrieval skipped: {e}")
+        return []
+    # Chunks deleted by re-ingestion since they were cached are simply left out
+    return [texts[chunk_id] for chunk_id in chunk_ids if chunk_id in texts]
+
+
+def stats():
+    with _stats_lock:
+        report = dict(_stats)
+    report['cache'] = retrieval_cache.stats()
+    report['enabled'] = RAG_RETRIEVAL_ENABLED
+    report['top_k'] = RAG_TOP_K
+    return report
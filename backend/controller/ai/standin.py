@@ -0,0 +1,315 @@
+"""
+Local stand-ins for Azure Speech and Azure OpenAI, for benchmarking the speech pipeline
+without network access.
+
+- Speech recognition / pronunciation assessment and synthesis are replaced in-process:
+  with AI_SPEECH_BACKEND=standin, clients.speech_recognizer() and clients.acquire_synthesizer()
+  hand out the SpeechRecognizer / SpeechSynthesizer classes below, which answer with the same
+  result shapes as the Speech SDK (the SDK's websocket protocol can't be pointed at a local server).
+- Chat completions and embeddings are served over HTTP by make_server() (`manage.py run_ai_standin`);
+  point AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_EMB_ENDPOINT at it and the normal AzureOpenAI
+  clients talk to it unchanged.
+
+Every service sleeps for a latency drawn from a normal distribution and fails with a given
+probability. Draws come from a per-service random.Random seeded with AI_STANDIN_SEED, and
+transcripts, scores and embeddings are derived from hashes of their input, so runs repeat.
+
+    AI_STANDIN_SEED                     seed for latency and error draws (default 0)
+    AI_STANDIN_<SERVICE>_LATENCY_MS     "mean" or "mean:stddev" in ms
+    AI_STANDIN_<SERVICE>_ERROR_RATE     probability of a failed call (default 0)
+
+where SERVICE is RECOGNITION, SYNTHESIS, CHAT or EMBEDDINGS.
+"""
+import ctypes
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import azure.cognitiveservices.speech as speechsdk
+
+logger = logging.getLogger(__name__)
+
+AI_STANDIN_SEED = int(os.getenv("AI_STANDIN_SEED", 0))
+
+# (mean ms, stddev ms) roughly matching what the Azure services take from australiaeast
+DEFAULT_LATENCY_MS = {
+    'recognition': (800, 200),
+    'synthesis': (300, 100),
+    'chat': (900, 300),
+    'embeddings': (80, 20),
+}
+
+EMBEDDING_DIMENSIONS = 1536
+
+TRANSCRIPTS = [
+    "the cake is big", "there are balloons", "the friends are dancing", "i can see a dog",
+    "we are at the beach", "the boy is eating", "it is a red car", "she has a present",
+]
+
+FEEDBACK_SENTENCES = [
+    "What a great try, you spoke nice and clearly!",
+    "Try saying each sound slowly, especially at the end of the words.",
+    "Keep practising and you will be a speaking superstar!",
+]
+
+
+def _digest(*parts):
+    return hashlib.sha256("\0".join(str(p) for p in parts).encode('utf-8')).digest()
+
+
+class LatencyModel:
+    """Seeded latency and error draws for one stand-in service."""
+
+    def __init__(self, name, mean_ms, stddev_ms=0.0, error_rate=0.0, seed=AI_STANDIN_SEED):
+        self.name = name
+        self.mean_ms = mean_ms
+        self.stddev_ms = stddev_ms
+        self.error_rate = error_rate
+        self._random = random.Random(f"{seed}:{name}")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name):
+        mean_ms, stddev_ms = DEFAULT_LATENCY_MS[name]
+        latency = os.getenv(f"AI_STANDIN_{name.upper()}_LATENCY_MS")
+        if latency:
+            mean, _, stddev = latency.partition(':')
+            mean_ms, stddev_ms = float(mean), float(stddev or 0)
+        error_rate = float(os.getenv(f"AI_STANDIN_{name.upper()}_ERROR_RATE", 0))
+        return cls(name, mean_ms, stddev_ms, error_rate)
+
+    def draw(self):
+        """(seconds to sleep, whether the call fails)"""
+        with self._lock:
+            latency_ms = max(0.0, self._random.gauss(self.mean_ms, self.stddev_ms))
+            failed = self._random.random() < self.error_rate
+        return latency_ms / 1000, failed
+
+    def wait(self):
+        """Sleep for one latency draw and return whether the call should fail."""
+        delay, failed = self.draw()
+        time.sleep(delay)
+        return failed
+
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+def latency_model(name):
+    with _models_lock:
+        if name not in _models:
+            _models[name] = LatencyModel.from_env(name)
+        return _models[name]
+
+
+# Speech SDK stand-ins
+
+class _Result:
+    def __init__(self, reason, **fields):
+        self.reason = reason
+        self.cancellation_details = None
+        self.__dict__.update(fields)
+
+
+class _Future:
+    def __init__(self, result):
+        self._result = result
+
+    def get(self):
+        return self._result
+
+
+def pronunciation_json(text, seed):
+    """Detailed recognition JSON in the shape speechsdk.PronunciationAssessmentResult parses."""
+    rng = random.Random(seed)
+    words = text.split()
+    word_scores = [round(rng.uniform(55, 100), 1) for _ in words]
+    accuracy = round(sum(word_scores) / len(word_scores), 1) if words else 0.0
+    fluency = round(rng.uniform(60, 100), 1)
+    completeness = round(rng.uniform(80, 100), 1)
+    return json.dumps({
+        'RecognitionStatus': 'Success',
+        'DisplayText': text,
+        'NBest': [{
+            'Lexical': text,
+            'Display': text,
+            'PronunciationAssessment': {
+                'AccuracyScore': accuracy,
+                'FluencyScore': fluency,
+                'CompletenessScore': completeness,
+                'PronScore': round(0.6 * accuracy + 0.2 * fluency + 0.2 * completeness, 1),
+            },
+            'Words': [
+                {'Word': word, 'PronunciationAssessment': {'AccuracyScore': score, 'ErrorType': 'None'}}
+                for word, score in zip(words, word_scores)
+            ],
+        }],
+    })
+
+
+class SpeechRecognizer:
+    """
+    Stands in for speechsdk.SpeechRecognizer over an in-memory PCM buffer. The transcript is
+    the reference text when one is given, otherwise a canned phrase picked by the audio's hash.
+    """
+
+    def __init__(self, pcm, pronunciation_config=None):
+        self.pcm = pcm
+        self.pronunciation_config = pronunciation_config
+        self.model = latency_model('recognition')
+
+    def recognize_once(self):
+        if self.model.wait():
+            return _Result(speechsdk.ResultReason.Canceled, text='', properties={})
+        if not self.pcm:
+            return _Result(speechsdk.ResultReason.NoMatch, text='', properties={})
+        digest = _digest(len(self.pcm), self.pcm[:4096])
+        reference = self.pronunciation_config.reference_text if self.pronunciation_config is not None else ''
+        text = reference or TRANSCRIPTS[digest[0] % len(TRANSCRIPTS)]
+        properties = {}
+        if self.pronunciation_config is not None:
+            properties[speechsdk.PropertyId.SpeechServiceResponse_JsonResult] = pronunciation_json(text, digest)
+        return _Result(speechsdk.ResultReason.RecognizedSpeech, text=text, properties=properties)
+
+
+def fake_mp3(ssml):
+    """Deterministic placeholder audio, about as long as real 32 kbit/s MP3 of the text would be."""
+    text = re.sub(r'<[^>]+>', '', ssml)
+    size = max(1024, len(text) * 300)
+    seed = _digest(ssml)
+    return (b'ID3\x03\x00\x00\x00\x00\x00\x00' + seed * (size // len(seed) + 1))[:size]
+
+
+class AudioDataStream:
+    """Stands in for speechsdk.AudioDataStream over a finished synthesis result."""
+
+    def __init__(self, result):
+        self._data = result.audio_data
+        self._pos = 0
+        self.status = speechsdk.StreamStatus.PartialData
+
+    def read_data(self, audio_buffer):
+        # Same contract as the SDK: fill the caller's bytes buffer in place, return bytes filled
+        chunk = self._data[self._pos:self._pos + len(audio_buffer)]
+        ctypes.memmove(audio_buffer, chunk, len(chunk))
+        self._pos += len(chunk)
+        if not chunk:
+            self.status = speechsdk.StreamStatus.AllData
+        return len(chunk)
+
+
+class SpeechSynthesizer:
+    """Stands in for speechsdk.SpeechSynthesizer with in-memory output."""
+
+    def __init__(self):
+        self.model = latency_model('synthesis')
+
+    def _synthesize(self, ssml, done_reason):
+        if self.model.wait():
+            return _Result(speechsdk.ResultReason.Canceled, audio_data=b'')
+        return _Result(done_reason, audio_data=fake_mp3(ssml))
+
+    def speak_ssml_async(self, ssml):
+        return _Future(self._synthesize(ssml, speechsdk.ResultReason.SynthesizingAudioCompleted))
+
+    def start_speaking_ssml_async(self, ssml):
+        return _Future(self._synthesize(ssml, speechsdk.ResultReason.SynthesizingAudioStarted))
+
+
+# Azure OpenAI stand-in server
+
+def fake_embedding(text):
+    """Deterministic unit vector for text, so identical inputs embed identically."""
+    rng = random.Random(_digest('embedding', text))
+    vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
+
+
+def chat_completion(body):
+    messages = body.get('messages') or []
+    prompt = messages[-1].get('content', '') if messages else ''
+    content = ' '.join(FEEDBACK_SENTENCES)
+    return {
+        'id': f"chatcmpl-standin-{_digest(prompt).hex()[:12]}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model', 'standin'),
+        'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+        'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4,
+                  'total_tokens': (len(prompt) + len(content)) // 4},
+    }
+
+
+def embeddings_response(body):
+    inputs = body.get('input') or []
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    tokens = sum(len(text) // 4 + 1 for text in inputs)
+    return {
+        'object': 'list',
+        'model': body.get('model', 'standin'),
+        'data': [{'object': 'embedding', 'index': i, 'embedding': fake_embedding(text)} for i, text in enumerate(inputs)],
+        'usage': {'prompt_tokens': tokens, 'total_tokens': tokens},
+    }
+
+
+# path suffix -> (latency model name, response builder)
+ROUTES = {
+    '/chat/completions': ('chat', chat_completion),
+    '/embeddings': ('embeddings', embeddings_response),
+}
+
+
+class OpenAIStandinHandler(BaseHTTPRequestHandler):
+    """Answers /openai/deployments/<model>/{chat/completions,embeddings} like Azure OpenAI."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        route = next((r for suffix, r in ROUTES.items() if path.startswith('/openai/deployments/') and path.endswith(suffix)), None)
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if route is None:
+            self._send_json(404, {'error': {'code': 'NotFound', 'message': f'No stand-in for {path}'}})
+            return
+        try:
+            body = json.loads(raw or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'code': 'BadRequest', 'message': 'Request body is not JSON'}})
+            return
+
+        name, build = route
+        if latency_model(name).wait():
+            self._send_json(429, {'error': {'code': '429', 'message': 'Rate limit reached (stand-in)'}},
+                            headers={'Retry-After': '1'})
+            return
+        self._send_json(200, build(body))
+
+    def log_message(self, format, *args):
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(host='127.0.0.1', port=8765):
+    """HTTP server for the Azure OpenAI stand-in; call serve_forever() on it."""
+    server = ThreadingHTTPServer((host, port), OpenAIStandinHandler)
+    server.daemon_threads = True
+    return server
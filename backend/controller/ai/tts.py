@@ -0,0 +1,284 @@
+"""
+Text-to-speech synthesis with a content-addressed audio cache.
+
+Synthesised MP3s are keyed by a hash of (text, voice, style, output format). Lookups go to
+an in-process LRU first, then to a directory on local disk, and only a miss in both reaches
+Azure. Limits are configured with environment variables:
+
+    TTS_CACHE_MEMORY_BYTES  size of the in-process LRU (default 32 MB, 0 disables it)
+    TTS_CACHE_DIR           directory for cached MP3s (default <backend>/tts_cache, "" disables it)
+    TTS_CACHE_DISK_BYTES    size the cache directory is trimmed back to (default 512 MB)
+
+stream_synthesis() is the streaming variant: it yields MP3 chunks as Azure produces them,
+and still writes the finished audio into the cache when it is small enough.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from xml.sax.saxutils import escape, quoteattr
+import azure.cognitiveservices.speech as speechsdk
+from django.conf import settings
+from . import clients
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VOICE = "en-AU-NatashaNeural"
+DEFAULT_STYLE = "cheerful"
+OUTPUT_FORMAT = speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3
+
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(settings.BASE_DIR, "tts_cache"))
+TTS_CACHE_DISK_BYTES = int(os.getenv("TTS_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+
+STREAM_CHUNK_BYTES = 4096  # ~1 s of 32 kbit/s MP3
+# Streamed audio larger than this is sent to the client but not kept for the cache
+STREAM_CACHE_MAX_BYTES = int(os.getenv("TTS_STREAM_CACHE_MAX_BYTES", 1024 * 1024))
+
+
+class SynthesisError(Exception):
+    pass
+
+
+def cache_key(text, voice=DEFAULT_VOICE, style=DEFAULT_STYLE, output_format=OUTPUT_FORMAT):
+    payload = json.dumps([text, voice, style, getattr(output_format, 'name', str(output_format))])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """Two-level (memory LRU, then disk) store of synthesised audio keyed by cache_key()."""
+
+    def __init__(self, memory_bytes=TTS_CACHE_MEMORY_BYTES, disk_dir=TTS_CACHE_DIR, disk_bytes=TTS_CACHE_DISK_BYTES):
+        self.memory = LRUCache(max_bytes=memory_bytes) if memory_bytes > 0 else None
+        self.disk_dir = disk_dir or None
+        self.disk_bytes = disk_bytes
+        self._disk_lock = threading.Lock()
+        self._disk_usage = None  # computed lazily from the directory on first write
+        # Counters are bumped from request and pre-synthesis worker threads at once
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.disk_evictions = 0
+
+    def _count(self, *names):
+        with self._stats_lock:
+            for name in names:
+                setattr(self, name, getattr(self, name) + 1)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.mp3")
+
+    def contains(self, key):
+        if self.memory is not None and key in self.memory:
+            return True
+        return self.disk_dir is not None and os.path.exists(self._path(key))
+
+    def get(self, key):
+        if self.memory is not None:
+            audio = self.memory.get(key)
+            if audio is not None:
+                self._count('hits', 'memory_hits')
+                return audio
+
+        if self.disk_dir is not None:
+            try:
+                with open(self._path(key), "rb") as f:
+                    audio = f.read()
+            except FileNotFoundError:
+                audio = None
+            if audio is not None:
+                if self.memory is not None:
+                    self.memory.set(key, audio)
+                self._count('hits', 'disk_hits')
+                return audio
+
+        self._count('misses')
+        return None
+
+    def put(self, key, audio):
+        if self.memory is not None:
+            self.memory.set(key, audio)
+        if self.disk_dir is not None:
+            self._write_disk(key, audio)
+        self._count('stores')
+
+    def _write_disk(self, key, audio):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            existed = os.path.exists(path)
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)  # atomic, so readers never see a partial file
+        except OSError as e:
+            logger.warning(f"TTS cache: could not write {path}: {e}")
+            return
+
+        with self._disk_lock:
+            if self._disk_usage is None:
+                self._disk_usage = self._scan_disk_usage()
+            elif not existed:
+                self._disk_usage += len(audio)
+            if self._disk_usage > self.disk_bytes:
+                self._trim_disk()
+
+    def _scan_disk_usage(self):
+        total = 0
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".mp3"):
+                    total += entry.stat().st_size
+        return total
+
+    def _trim_disk(self):
+        # Oldest-modified first, back down to 90% of the limit so we don't trim on every write
+        with os.scandir(self.disk_dir) as entries:
+            files = sorted(
+                ((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries if e.name.endswith(".mp3")),
+            )
+        target = int(self.disk_bytes * 0.9)
+        for _, size, path in files:
+            if self._disk_usage <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._disk_usage -= size
+            self.disk_evictions += 1
+
+    def stats(self):
+        with self._stats_lock:
+            counters = {
+                'hits': self.hits,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+            }
+        return {
+            **counters,
+            'memory': self.memory.stats() if self.memory is not None else None,
+            'disk': {
+                'dir': self.disk_dir,
+                'max_bytes': self.disk_bytes,
+                'bytes': self._disk_usage,
+                'evictions': self.disk_evictions,
+            } if self.disk_dir is not None else None,
+        }
+
+
+tts_cache = TTSCache()
+
+
+def build_ssml(text, voice=DEFAULT_VOICE, style=DEFAULT_STYLE):
+    # SSML — Expressive voice style
+    return f"""
+    <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis"
+           xmlns:mstts="https://www.w3.org/2001/mstts"
+           xml:lang="en-AU">
+        <voice name={quoteattr(voice)}>
+            <prosody volume="150%">
+                <mstts:express-as style={quoteattr(style)} styledegree="1.2">
+                    {escape(text)}
+                </mstts:express-as>
+            </prosody>
+        </voice>
+    </speak>
+    """
+
+
+def synthesis_error_message(result):
+    if result.reason == speechsdk.ResultReason.Canceled:
+        cancellation = result.cancellation_details  # type: ignore[attr-defined]
+        if not cancellation:
+            return "Speech synthesis canceled"
+        error_msg = f"Speech synthesis canceled. Reason: {cancellation.reason}"  # type: ignore[union-attr]
+        if cancellation.reason == speechsdk.CancellationReason.Error:  # type: ignore[union-attr]
+            error_msg += f", Error details: {cancellation.error_details}"  # type: ignore[union-attr]
+        return error_msg
+    error_details = result.cancellation_details if hasattr(result, 'cancellation_details') else 'Unknown error'  # type: ignore[attr-defined]
+    return f"Speech synthesis failed: {error_details}"
+
+
+def _acquire_synthesizer():
+    if not clients.speech_available():
+        raise SynthesisError("Azure Speech credentials not configured")
+    return clients.acquire_synthesizer(OUTPUT_FORMAT)
+
+
+def synthesize(text, voice=DEFAULT_VOICE, style=DEFAULT_STYLE):
+    """Synthesise text with Azure and return the MP3 bytes. Raises SynthesisError on failure."""
+    synthesizer = _acquire_synthesizer()
+    try:
+        with clients.timed('speech_synthesizer'):
+            result = synthesizer.speak_ssml_async(build_ssml(text, voice, style)).get()
+    finally:
+        clients.release_synthesizer(synthesizer, OUTPUT_FORMAT)
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
+        raise SynthesisError(synthesis_error_message(result))
+    return result.audio_data
+
+
+def get_or_synthesize(text, voice=DEFAULT_VOICE, style=DEFAULT_STYLE):
+    """Return (mp3_bytes, cache_hit). Cache hits never call Azure."""
+    key = cache_key(text, voice, style)
+    audio = tts_cache.get(key)
+    if audio is not None:
+        return audio, True
+    audio = synthesize(text, voice, style)
+    tts_cache.put(key, audio)
+    return audio, False
+
+
+def stream_synthesis(text, voice=DEFAULT_VOICE, style=DEFAULT_STYLE):
+    """
+    Start synthesis and return an iterator of MP3 chunks, read from the SDK's pull-based
+    AudioDataStream as Azure produces them. Errors before the first byte raise SynthesisError
+    here, so callers can still answer with an error status; later failures end the stream early.
+    """
+    synthesizer = _acquire_synthesizer()
+    with clients.timed('speech_synthesizer_first_audio'):
+        result = synthesizer.start_speaking_ssml_async(build_ssml(text, voice, style)).get()
+    if result.reason not in (speechsdk.ResultReason.SynthesizingAudioStarted,
+                             speechsdk.ResultReason.SynthesizingAudioCompleted):
+        clients.release_synthesizer(synthesizer, OUTPUT_FORMAT)
+        raise SynthesisError(synthesis_error_message(result))
+
+    audio_stream = clients.audio_data_stream(result)
+    key = cache_key(text, voice, style)
+
+    def chunks():
+        held, size, cacheable = [], 0, True
+        while True:
+            # read_data() fills the buffer in place, and a full read makes buffer[:filled]
+            # the buffer itself, so each read needs a fresh one or yielded chunks get overwritten
+            buffer = bytes(STREAM_CHUNK_BYTES)
+            filled = audio_stream.read_data(buffer)
+            if filled == 0:
+                break
+            chunk = buffer[:filled]
+            size += filled
+            if cacheable:
+                if size <= STREAM_CACHE_MAX_BYTES:
+                    held.append(chunk)
+                else:
+                    cacheable, held = False, []
+            yield chunk
+
+        if audio_stream.status != speechsdk.StreamStatus.AllData:
+            logger.warning(f"TTS stream for voice={voice} ended early: {audio_stream.status}")
+            return
+        # Only a synthesizer that finished cleanly goes back to the pool; one abandoned
+        # mid-stream (client disconnected) is dropped along with its generator.
+        clients.release_synthesizer(synthesizer, OUTPUT_FORMAT)
+        if cacheable:
+            tts_cache.put(key, b''.join(held))
+
+    return chunks()
@@ -0,0 +1,106 @@
+import json
+import os
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from controller.models import Question, Question_Embedding
+from controller.ai import embeddings
+from controller.ai.feedback import normalise_transcript
+
+DEFAULT_ANSWERS_FILE = os.path.join(settings.BASE_DIR, 'backend', 'ai-pipeline', 'expted-answers-final-demo.json')
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed the expected answers in a JSON file ([{question_id, question_text, expected_answers}, ...]) "
+        "into Question_Embedding for the answer correctness check. Answers already stored for their question "
+        "are skipped, and the rest are embedded in batched requests and bulk-inserted. Answers are embedded "
+        "normalised the way transcripts are (lowercase, no punctuation); --reembed refreshes the vectors of "
+        "answers stored before that."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('answers_file', nargs='?', default=DEFAULT_ANSWERS_FILE,
+                            help='Expected answers JSON (default ai-pipeline/expted-answers-final-demo.json)')
+        parser.add_argument('--batch-size', type=int, default=embeddings.EMBEDDING_MAX_BATCH_INPUTS,
+                            help='Answers per embeddings request')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be embedded')
+        parser.add_argument('--reembed', action='store_true', help='Also re-embed every answer already stored')
+
+    def load_entries(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+    def plan(self, entries):
+        """(question_id, answer) pairs to embed, in file order, excluding stored and repeated ones."""
+        answers = {}
+        for entry in entries:
+            try:
+                question_id = uuid.UUID(str(entry['question_id']))
+            except (KeyError, ValueError):
+                self.stderr.write(f"Skipping entry without a valid question_id: {entry!r}")
+                continue
+            answers.setdefault(question_id, []).extend(
+                a.strip() for a in entry.get('expected_answers') or [] if isinstance(a, str) and normalise_transcript(a)
+            )
+
+        found = set(Question.objects.filter(id__in=answers).values_list('id', flat=True))
+        for question_id in answers.keys() - found:
+            self.stderr.write(f"Question not found: {question_id}")
+
+        stored = set(Question_Embedding.objects.filter(question_id__in=found).values_list('question_id', 'expected_answer_text'))
+        pending = [(question_id, answer) for question_id, question_answers in answers.items() if question_id in found
+                   for answer in question_answers]
+        return [pair for pair in dict.fromkeys(pending) if pair not in stored], len(stored)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        entries = self.load_entries(options['answers_file'])
+        pending, stored = self.plan(entries)
+        self.stdout.write(f"{len(entries)} question entries, {stored} answers already embedded, {len(pending)} to embed")
+
+        if options['dry_run']:
+            for question_id, answer in pending:
+                self.stdout.write(f"  {question_id}: {answer}")
+            return
+        if options['reembed']:
+            self.reembed_stored(options['batch_size'])
+        if not pending:
+            return
+
+        created = 0
+        for batch in embeddings.iter_batches([answer for _, answer in pending], batch_size=options['batch_size']):
+            pairs = pending[created:created + len(batch)]
+            try:
+                vectors = embeddings.embed_batch([normalise_transcript(answer) for answer in batch])
+            except Exception as e:
+                raise CommandError(f"Embedding failed after {created} answers: {e}")
+            # Stored batch by batch, so a re-run after a failure only embeds what's left
+            Question_Embedding.objects.bulk_create([
+                Question_Embedding(question_id=question_id, expected_answer_text=answer, embedding=vector)
+                for (question_id, answer), vector in zip(pairs, vectors)
+            ])
+            created += len(batch)
+            self.stdout.write(f"[{created}/{len(pending)}] embedded")
+
+        self.stdout.write(self.style.SUCCESS(f"Added {created} answer embeddings"))
+
+    def reembed_stored(self, batch_size):
+        rows = list(Question_Embedding.objects.only('id', 'expected_answer_text').order_by('id'))
+        updated = 0
+        for batch in embeddings.iter_batches([row.expected_answer_text for row in rows], batch_size=batch_size):
+            batch_rows = rows[updated:updated + len(batch)]
+            try:
+                vectors = embeddings.embed_batch([normalise_transcript(answer) for answer in batch])
+            except Exception as e:
+                raise CommandError(f"Embedding failed after re-embedding {updated} stored answers: {e}")
+            for row, vector in zip(batch_rows, vectors):
+                row.embedding = vector
+            Question_Embedding.objects.bulk_update(batch_rows, ['embedding'])
+            updated += len(batch)
+        self.stdout.write(f"Re-embedded {updated} stored answers")
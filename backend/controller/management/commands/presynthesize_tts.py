@@ -0,0 +1,82 @@
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from controller.models import Learning_Unit
+from controller.ai import tts
+from controller.ai.phrases import ENCOURAGEMENT_PHRASES, FEEDBACK_TEMPLATES
+
+# question_data keys (and option fields) that hold text read out to the child
+SPEAKABLE_KEYS = ('question', 'prompt', 'instruction')
+
+
+def speakable_strings(question_data):
+    # Some questions were imported with question_data stored as a JSON-encoded string
+    if isinstance(question_data, str):
+        try:
+            question_data = json.loads(question_data)
+        except ValueError:
+            return []
+    if not isinstance(question_data, dict):
+        return []
+    strings = [question_data[key] for key in SPEAKABLE_KEYS if isinstance(question_data.get(key), str)]
+    for option in question_data.get('options') or []:
+        if isinstance(option, str):
+            strings.append(option)
+        elif isinstance(option, dict) and isinstance(option.get('text'), str):
+            strings.append(option['text'])
+    return [s.strip() for s in strings if s and s.strip()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Pre-render text-to-speech audio for every question prompt, the standard encouragement lines "
+        "and the feedback templates into the TTS cache, so /api/AI/text_to_speech/ can serve them without calling Azure. "
+        "Text that is already cached is skipped, so re-runs only synthesise new or changed strings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent synthesis requests (default 4)')
+        parser.add_argument('--voice', default=tts.DEFAULT_VOICE)
+        parser.add_argument('--style', default=tts.DEFAULT_STYLE)
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be synthesised')
+
+    def collect_texts(self):
+        texts = list(ENCOURAGEMENT_PHRASES)
+        for templates in FEEDBACK_TEMPLATES.values():
+            texts.extend(templates)
+        units = Learning_Unit.objects.prefetch_related('exercises__questions').order_by('created_at')
+        for unit in units:
+            for exercise in sorted(unit.exercises.all(), key=lambda e: e.order):
+                for question in sorted(exercise.questions.all(), key=lambda q: q.order):
+                    texts.extend(speakable_strings(question.question_data))
+        # De-duplicate while keeping walk order
+        return list(dict.fromkeys(texts))
+
+    def handle(self, *args, **options):
+        if tts.tts_cache.disk_dir is None:
+            raise CommandError('TTS_CACHE_DIR is disabled; pre-synthesised audio would not outlive this command')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        voice, style = options['voice'], options['style']
+        texts = self.collect_texts()
+        pending = [t for t in texts if not tts.tts_cache.contains(tts.cache_key(t, voice, style))]
+        self.stdout.write(f"{len(texts)} speakable strings, {len(texts) - len(pending)} already cached, {len(pending)} to synthesise")
+
+        if options['dry_run'] or not pending:
+            return
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {pool.submit(tts.get_or_synthesize, text, voice, style): text for text in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                text = futures[future]
+                try:
+                    future.result()
+                except tts.SynthesisError as e:
+                    failed += 1
+                    self.stderr.write(f"Failed on '{text}': {e}")
+                    continue
+                self.stdout.write(f"[{done}/{len(pending)}] {text}")
+
+        self.stdout.write(self.style.SUCCESS(f"Synthesised {len(pending) - failed} strings ({failed} failed)"))
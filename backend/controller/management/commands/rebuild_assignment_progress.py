@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from controller.models import Assignment
+from controller.progress import COUNTER_FIELDS, rebuild_counters, stale_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the progress counters on Assignment (completed exercises, time spent, correct and "
+        "incorrect totals) from their Exercise_Result rows. Use after editing results by hand or to "
+        "check the counters against the source rows with --dry-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--child', help='Only the assignments of this child profile ID')
+        parser.add_argument('--assignment', help='Only this assignment ID')
+        parser.add_argument('--dry-run', action='store_true', help='Only report assignments whose counters are stale')
+
+    def handle(self, *args, **options):
+        assignments = Assignment.objects.all()
+        if options['child']:
+            assignments = assignments.filter(assigned_to_id=options['child'])
+        if options['assignment']:
+            assignments = assignments.filter(id=options['assignment'])
+
+        stale = list(stale_counters(assignments))
+        for assignment in stale:
+            changes = ', '.join(
+                f"{name} {getattr(assignment, name)} -> {getattr(assignment, f'expected_{name}')}"
+                for name in COUNTER_FIELDS if getattr(assignment, name) != getattr(assignment, f'expected_{name}')
+            )
+            self.stdout.write(f"Assignment {assignment.id}: {changes}")
+
+        if options['dry_run']:
+            self.stdout.write(f"{len(stale)} of {assignments.count()} assignments have stale counters")
+            return
+
+        updated = rebuild_counters(assignments)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt counters of {updated} assignments ({len(stale)} were stale)"))
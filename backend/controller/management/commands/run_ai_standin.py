@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from controller.ai import standin
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Azure OpenAI chat completion and embedding endpoints, with seeded "
+        "latency and error rates (AI_STANDIN_* environment variables). Point AZURE_OPENAI_ENDPOINT and "
+        "AZURE_OPENAI_EMB_ENDPOINT at it, and set AI_SPEECH_BACKEND=standin for the speech stand-ins."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        server = standin.make_server(options['host'], options['port'])
+        host, port = server.server_address[:2]
+        self.stdout.write(f"Azure OpenAI stand-in listening on http://{host}:{port}")
+        for name in standin.DEFAULT_LATENCY_MS:
+            model = standin.latency_model(name)
+            self.stdout.write(f"  {name}: {model.mean_ms:g}±{model.stddev_ms:g} ms, error rate {model.error_rate:g}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
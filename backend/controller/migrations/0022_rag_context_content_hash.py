@@ -0,0 +1,22 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controller', '0021_question_embedding_hnsw_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rag_context',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='rag_context',
+            constraint=models.UniqueConstraint(condition=models.Q(('content_hash', ''), _negated=True), fields=('content_hash',), name='unique_rag_context_content_hash'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+# pgvector HNSW index for the top-k guidance lookups in controller/ai/retrieval.py.
+# Only created on PostgreSQL; the SQLite test database has no vector support.
+
+INDEX_NAME = 'rag_context_embedding_hnsw'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS "{INDEX_NAME}" ON "Rag_Context" '
+        'USING hnsw (embedding vector_cosine_ops)'
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS "{INDEX_NAME}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controller', '0022_rag_context_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
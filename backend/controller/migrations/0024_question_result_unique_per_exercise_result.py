@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_question_results(apps, schema_editor):
+    # Keep the most recently completed row of each (exercise_result, question) pair
+    Question_Result = apps.get_model('controller', 'Question_Result')
+    duplicates = Question_Result.objects.values('exercise_result_id', 'question_id').annotate(
+        rows=Count('id')
+    ).filter(rows__gt=1)
+    for pair in duplicates.iterator():
+        ids = list(Question_Result.objects.filter(
+            exercise_result_id=pair['exercise_result_id'], question_id=pair['question_id']
+        ).order_by(models.F('completed_at').desc(nulls_last=True)).values_list('id', flat=True))
+        Question_Result.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controller', '0023_rag_context_hnsw_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_question_results, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='question_result',
+            constraint=models.UniqueConstraint(fields=('exercise_result', 'question'), name='unique_question_result_per_exercise_result'),
+        ),
+    ]
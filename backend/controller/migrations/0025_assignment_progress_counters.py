@@ -0,0 +1,55 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:51
+
+from django.db import migrations, models
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Assignment = apps.get_model('controller', 'Assignment')
+    Exercise_Result = apps.get_model('controller', 'Exercise_Result')
+
+    def result_value(function, field, **filters):
+        return Coalesce(Subquery(
+            Exercise_Result.objects.filter(assignment=OuterRef('pk'), **filters).order_by().annotate(
+                value=Func(F(field), function=function, output_field=IntegerField())
+            ).values('value')
+        ), 0)
+
+    Assignment.objects.update(
+        completed_exercises=result_value('COUNT', 'id', completed_at__isnull=False),
+        total_time_spent=result_value('SUM', 'time_spent'),
+        total_correct=result_value('SUM', 'num_correct'),
+        total_incorrect=result_value('SUM', 'num_incorrect'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controller', '0024_question_result_unique_per_exercise_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='completed_exercises',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='total_correct',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='total_incorrect',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='total_time_spent',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-17 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controller', '0025_assignment_progress_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exercise_result',
+            index=models.Index(fields=['assignment', 'completed_at'], name='exercise_result_feed_idx'),
+        ),
+    ]
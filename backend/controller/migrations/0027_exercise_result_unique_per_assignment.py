@@ -0,0 +1,69 @@
+from django.db import migrations, models
+from django.db.models import Count, F, Func, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_exercise_results(apps, schema_editor):
+    # Fold every (assignment, exercise) pair into its most recently completed row: totals are
+    # added up, and of the question results the latest one per question is kept
+    Assignment = apps.get_model('controller', 'Assignment')
+    Exercise_Result = apps.get_model('controller', 'Exercise_Result')
+    Question_Result = apps.get_model('controller', 'Question_Result')
+    latest_first = (F('completed_at').desc(nulls_last=True), 'id')
+
+    duplicates = Exercise_Result.objects.values('assignment_id', 'exercise_id').annotate(
+        rows=Count('id')
+    ).filter(rows__gt=1)
+    touched = set()
+    for pair in duplicates.iterator():
+        results = list(Exercise_Result.objects.filter(
+            assignment_id=pair['assignment_id'], exercise_id=pair['exercise_id']
+        ).order_by(*latest_first))
+        keep, extra = results[0], results[1:]
+
+        latest, stale = {}, []
+        for question_result in Question_Result.objects.filter(exercise_result__in=results).order_by(*latest_first):
+            if question_result.question_id in latest:
+                stale.append(question_result.id)
+            else:
+                latest[question_result.question_id] = question_result.id
+        Question_Result.objects.filter(id__in=stale).delete()
+        Question_Result.objects.filter(id__in=latest.values()).update(exercise_result_id=keep.id)
+
+        keep.num_correct = sum(r.num_correct for r in results)
+        keep.num_incorrect = sum(r.num_incorrect for r in results)
+        keep.time_spent = sum(r.time_spent for r in results)
+        answers = keep.num_correct + keep.num_incorrect
+        keep.accuracy = keep.num_correct * 100.0 / answers if answers else 0.0
+        keep.save(update_fields=['num_correct', 'num_incorrect', 'time_spent', 'accuracy'])
+        Exercise_Result.objects.filter(id__in=[r.id for r in extra]).delete()
+        touched.add(pair['assignment_id'])
+
+    def result_value(function, field, **filters):
+        return Coalesce(Subquery(
+            Exercise_Result.objects.filter(assignment=OuterRef('pk'), **filters).order_by().annotate(
+                value=Func(F(field), function=function, output_field=IntegerField())
+            ).values('value')
+        ), 0)
+
+    Assignment.objects.filter(id__in=touched).update(
+        completed_exercises=result_value('COUNT', 'id', completed_at__isnull=False),
+        total_time_spent=result_value('SUM', 'time_spent'),
+        total_correct=result_value('SUM', 'num_correct'),
+        total_incorrect=result_value('SUM', 'num_incorrect'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controller', '0026_exercise_result_feed_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_exercise_results, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='exercise_result',
+            constraint=models.UniqueConstraint(fields=('assignment', 'exercise'), name='unique_exercise_result_per_assignment'),
+        ),
+    ]
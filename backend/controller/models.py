@@ -109,6 +109,11 @@ class Assignment(models.Model):
     assigned_at = models.DateTimeField(auto_now_add=True)
     due_date = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Progress counters mirroring this assignment's Exercise_Results (see controller/progress.py)
+    completed_exercises = models.IntegerField(default=0)
+    total_time_spent = models.IntegerField(default=0)
+    total_correct = models.IntegerField(default=0)
+    total_incorrect = models.IntegerField(default=0)
 
     class Meta:
         db_table = 'Assignment'
@@ -129,6 +134,14 @@ class Exercise_Result(models.Model):
 
     class Meta:
         db_table = 'Exercise_Result'
+        indexes = [
+            # Results feed: a child's assignments' results in completed_at order
+            models.Index(fields=['assignment', 'completed_at'], name='exercise_result_feed_idx'),
+        ]
+        constraints = [
+            # One result per exercise of an assignment; parallel first submissions can't both insert
+            models.UniqueConstraint(fields=['assignment', 'exercise'], name='unique_exercise_result_per_assignment'),
+        ]
 
     def __str__(self):
         return f"learning_unit={self.assignment.learning_unit.title}, exercise={self.exercise.title}, child={self.assignment.assigned_to.name}"
@@ -145,6 +158,10 @@ class Question_Result(models.Model):
 
     class Meta:
         db_table = 'Question_Result'
+        constraints = [
+            # One row per question in an exercise attempt; lets results be upserted in bulk
+            models.UniqueConstraint(fields=['exercise_result', 'question'], name='unique_question_result_per_exercise_result'),
+        ]
 
     def __str__(self):
         return f"exercise_result_id={self.exercise_result.id}, question_id={self.question.id}"
@@ -184,11 +201,17 @@ class Rag_Context(models.Model):
     source_name = models.TextField()
     source_url = models.TextField()
     content_chunk = models.TextField()
+    # sha256 of (chunker version, source, chunk text) - lets ingestion skip unchanged chunks
+    content_hash = models.CharField(max_length=64, blank=True, default='')
     embedding = VectorField(dimensions=1536)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'Rag_Context'
+        constraints = [
+            # Rows ingested before content hashing have an empty hash
+            models.UniqueConstraint(fields=['content_hash'], condition=~models.Q(content_hash=''), name='unique_rag_context_content_hash'),
+        ]
 
     def __str__(self):
         return f"source_name={self.source_name}, context_id={self.id}"
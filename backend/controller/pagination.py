@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ExerciseResultCursorPagination(CursorPagination):
+    """
+    Newest completed results first. The cursor encodes a position in (completed_at, id) rather
+    than an offset, so any page costs the same however much history precedes it.
+    """
+    ordering = ('-completed_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class CaseloadPagination(PageNumberPagination):
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
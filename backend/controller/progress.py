@@ -0,0 +1,97 @@
+"""
+Denormalised progress counters on Assignment.
+
+completed_exercises, total_time_spent, total_correct and total_incorrect mirror the
+assignment's Exercise_Result rows, so dashboards read them instead of aggregating results.
+The result views keep them up to date inside the same transaction as the result writes;
+`manage.py rebuild_assignment_progress` recomputes them from the source rows.
+"""
+from datetime import datetime, time, timedelta
+from django.db.models import Case, F, FloatField, Func, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, TruncDate
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+from .models import Assignment, Exercise_Result
+
+COUNTER_FIELDS = ('completed_exercises', 'total_time_spent', 'total_correct', 'total_incorrect')
+
+# How far back streaks() looks; longer streaks are reported as this many days
+STREAK_LOOKBACK_DAYS = 366
+
+
+def accuracy_expression(correct, total):
+    """SQL for correct / total as a percentage, 0 when there were no answers."""
+    return Case(
+        When(GreaterThan(total, 0), then=Cast(correct, FloatField()) * 100.0 / total),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def subquery_value(queryset, function, field='id'):
+    """Scalar subquery computing function(field) over queryset (0 when there are no rows)."""
+    return Coalesce(Subquery(
+        queryset.order_by().annotate(value=Func(F(field), function=function, output_field=IntegerField())).values('value')
+    ), 0)
+
+
+def _result_value(function, field, **filters):
+    return subquery_value(Exercise_Result.objects.filter(assignment=OuterRef('pk'), **filters), function, field)
+
+
+def counter_expressions():
+    """Each counter computed from the assignment's Exercise_Result rows."""
+    return {
+        'completed_exercises': _result_value('COUNT', 'id', completed_at__isnull=False),
+        'total_time_spent': _result_value('SUM', 'time_spent'),
+        'total_correct': _result_value('SUM', 'num_correct'),
+        'total_incorrect': _result_value('SUM', 'num_incorrect'),
+    }
+
+
+def rebuild_counters(assignments):
+    """Recompute the counters of a queryset of assignments in one UPDATE. Returns rows updated."""
+    return assignments.update(**counter_expressions())
+
+
+def stale_counters(assignments):
+    """Assignments in the queryset whose stored counters differ from their results."""
+    expected = {f'expected_{name}': expression for name, expression in counter_expressions().items()}
+    mismatch = Q()
+    for name in COUNTER_FIELDS:
+        mismatch |= ~Q(**{name: F(f'expected_{name}')})
+    return assignments.annotate(**expected).filter(mismatch)
+
+
+def add_to_counters(assignment_id, completed=0, time_spent=0, num_correct=0, num_incorrect=0):
+    """Atomically add deltas to one assignment's counters (call inside the result write's transaction)."""
+    deltas = dict(zip(COUNTER_FIELDS, (completed, time_spent, num_correct, num_incorrect)))
+    updates = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if updates:
+        Assignment.objects.filter(pk=assignment_id).update(**updates)
+
+
+def streaks(child_ids, today=None):
+    """
+    {child ID: current streak} - the number of consecutive days, ending today (or yesterday
+    when nothing has been completed yet today), on which the child completed an exercise.
+    One grouped query for any number of children.
+    """
+    today = today or timezone.localdate()
+    since = timezone.make_aware(datetime.combine(today - timedelta(days=STREAK_LOOKBACK_DAYS), time.min))
+    active_days = {}
+    for child_id, day in Exercise_Result.objects.filter(
+        assignment__assigned_to__in=child_ids, completed_at__gte=since
+    ).annotate(child=F('assignment__assigned_to'), day=TruncDate('completed_at')).values_list('child', 'day').distinct():
+        active_days.setdefault(child_id, set()).add(day)
+
+    result = {}
+    for child_id in child_ids:
+        days = active_days.get(child_id, set())
+        day = today if today in days else today - timedelta(days=1)
+        streak = 0
+        while day in days:
+            streak += 1
+            day -= timedelta(days=1)
+        result[child_id] = streak
+    return result
@@ -34,25 +34,102 @@ class QuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = '__all__'
 
-class AssignmentSerializer(serializers.ModelSerializer):
-    learning_unit = LearningUnitSerializer(read_only=True)
-    assigned_to = ProfileSerializer(read_only=True)
-    assigned_by = UserSerializer(read_only=True)
+def expansion_options(request):
+    """The ?fields= and ?expand= query parameters as serializer kwargs (comma-separated lists)."""
+    def names(param):
+        value = request.query_params.get(param)
+        return {name.strip() for name in value.split(',') if name.strip()} if value else None
+    return {'fields': names('fields'), 'expand': names('expand') or set()}
+
+class ExpandableFieldsSerializer(serializers.ModelSerializer):
+    """
+    Relations are rendered as flat primary keys unless named in `expand`, in which case the
+    nested serializer from `expandable_fields` is used; `fields` limits the output to the named
+    fields. Nested relations are expanded with dots ("exercise_result.exercise"). Querysets
+    should go through select_expanded() so expanded relations are joined, not fetched per row.
+    """
+    # field name -> (nested serializer class, source, or None for the field name)
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, nested in self._split_expand(expand).items():
+            serializer_class, source = self.expandable_fields[name]
+            options = {'read_only': True}
+            if source:
+                options['source'] = source
+            if issubclass(serializer_class, ExpandableFieldsSerializer):
+                options['expand'] = nested
+            self.fields[name] = serializer_class(**options)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def _split_expand(cls, expand):
+        """{expandable field: its own nested expand paths} for the known fields in expand."""
+        split = {}
+        for path in expand:
+            name, _, rest = path.partition('.')
+            if name in cls.expandable_fields:
+                split.setdefault(name, set())
+                if rest:
+                    split[name].add(rest)
+        return split
+
+    @classmethod
+    def related_paths(cls, expand, prefix=''):
+        """select_related() lookups covering the relations named in expand."""
+        paths = []
+        for name, nested in cls._split_expand(expand).items():
+            serializer_class, source = cls.expandable_fields[name]
+            path = prefix + (source or name).replace('.', '__')
+            paths.append(path)
+            if issubclass(serializer_class, ExpandableFieldsSerializer):
+                paths.extend(serializer_class.related_paths(nested, prefix=path + '__'))
+        return paths
+
+    @classmethod
+    def select_expanded(cls, queryset, expand):
+        paths = cls.related_paths(expand)
+        return queryset.select_related(*paths) if paths else queryset
+
+class AssignmentSerializer(ExpandableFieldsSerializer):
+    expandable_fields = {
+        'learning_unit': (LearningUnitSerializer, None),
+        'assigned_to': (ProfileSerializer, None),
+        'assigned_by': (UserSerializer, None),
+    }
 
     class Meta:
         model = Assignment
         fields = '__all__'
 
-class ExerciseResultSerializer(serializers.ModelSerializer):
-    exercise = ExerciseSerializer(read_only=True)
+class ExerciseResultSerializer(ExpandableFieldsSerializer):
+    expandable_fields = {
+        'exercise': (ExerciseSerializer, None),
+        'assignment': (AssignmentSerializer, None),
+    }
 
     class Meta:
         model = Exercise_Result
         fields = '__all__'
 
-class QuestionResultSerializer(serializers.ModelSerializer):
-    exercise_result = ExerciseResultSerializer(read_only=True)
-    question = QuestionSerializer(read_only=True)
+class ExerciseResultFeedSerializer(ExerciseResultSerializer):
+    """Exercise result with its assignment's learning unit and participation type (select_related 'assignment')."""
+    learning_unit = serializers.PrimaryKeyRelatedField(source='assignment.learning_unit', read_only=True)
+    participation_type = serializers.CharField(source='assignment.participation_type', read_only=True)
+
+    expandable_fields = {
+        **ExerciseResultSerializer.expandable_fields,
+        'learning_unit': (LearningUnitSerializer, 'assignment.learning_unit'),
+    }
+
+class QuestionResultSerializer(ExpandableFieldsSerializer):
+    expandable_fields = {
+        'exercise_result': (ExerciseResultSerializer, None),
+        'question': (QuestionSerializer, None),
+    }
 
     class Meta:
         model = Question_Result
@@ -0,0 +1,897 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework import status
+from unittest import mock
+from io import StringIO
+import azure.cognitiveservices.speech as speechsdk
+import json
+import numpy as np
+import openai
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from controller.views import azureAIViews
+
+from controller.models import Learning_Unit, Exercise, Question, Question_Embedding, Rag_Context
+
+from controller.ai import clients, correctness, embeddings, feedback, ingestion, jobs, retrieval, standin, tts
+from controller.ai.chunking import Chunker
+from controller.ai import audio
+from controller.ai.cache import LRUCache, SharedCache, SingleFlight
+
+# AI view tests (Azure calls are patched out)
+
+class TextToSpeechCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache = tts.TTSCache(memory_bytes=1024, disk_dir=self.cache_dir.name, disk_bytes=4096)
+        patcher = mock.patch.object(tts, 'tts_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.cache_dir.cleanup)
+
+    @mock.patch.object(tts, 'synthesize', return_value=b'mp3-bytes')
+    def test_repeat_request_served_from_cache(self, synthesize):
+        payload = {'text': 'Great job!', 'voice': 'en-AU-NatashaNeural'}
+        r = self.client.post('/api/AI/text_to_speech/', payload, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r['X-TTS-Cache'], 'miss')
+
+        r2 = self.client.post('/api/AI/text_to_speech/', payload, format='json')
+        self.assertEqual(r2.status_code, status.HTTP_200_OK)
+        self.assertEqual(r2['X-TTS-Cache'], 'hit')
+        self.assertEqual(r2.content, b'mp3-bytes')
+        synthesize.assert_called_once()
+
+        # Different style is a different cache entry
+        self.client.post('/api/AI/text_to_speech/', {**payload, 'style': 'calm'}, format='json')
+        self.assertEqual(synthesize.call_count, 2)
+
+    @mock.patch.object(tts, 'stream_synthesis', return_value=iter([b'mp3-', b'bytes']))
+    def test_stream_mode_returns_chunks(self, stream_synthesis):
+        r = self.client.post('/api/AI/text_to_speech/?stream=1', {'text': 'Well done!'}, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertTrue(r.streaming)
+        self.assertEqual(b''.join(r.streaming_content), b'mp3-bytes')
+
+    @mock.patch.object(tts, 'synthesize', return_value=b'mp3-bytes')
+    def test_disk_cache_survives_memory_eviction(self, synthesize):
+        tts.get_or_synthesize('Hello')
+        self.cache.memory.clear()
+        audio, hit = tts.get_or_synthesize('Hello')
+        self.assertTrue(hit)
+        self.assertEqual(audio, b'mp3-bytes')
+        self.assertEqual(self.cache.disk_hits, 1)
+
+    def test_metrics_report_counters(self):
+        self.cache.get('missing')
+        r = self.client.get('/api/AI/metrics/')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.data['tts_cache']['misses'], 1)
+
+    def test_counters_consistent_across_threads(self):
+        self.cache.put('hit', b'mp3')
+
+        def lookups():
+            for _ in range(500):
+                self.cache.get('hit')
+                self.cache.get('missing')
+        threads = [threading.Thread(target=lookups) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((self.cache.stats()['hits'], self.cache.stats()['misses']), (4000, 4000))
+
+    @mock.patch.object(tts, 'synthesize', return_value=b'mp3-bytes')
+    def test_presynthesize_is_incremental(self, synthesize):
+        lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        exercise = Exercise.objects.create(learning_unit=lu, title='E1', description='', order=1, exercise_type='speaking')
+        Question.objects.create(exercise=exercise, question_type='speaking', order=1, question_data={'question': 'Where are we?'})
+        self.cache.disk_bytes = 1024 * 1024
+
+        call_command('presynthesize_tts', '--workers', '2', stdout=StringIO())
+        synthesized = {c.args[0] for c in synthesize.call_args_list}
+        self.assertIn('Where are we?', synthesized)
+
+        synthesize.reset_mock()
+        call_command('presynthesize_tts', stdout=StringIO())
+        synthesize.assert_not_called()
+
+    @mock.patch.object(tts, 'synthesize', return_value=b'mp3-bytes')
+    def test_presynthesize_reads_string_encoded_question_data(self, synthesize):
+        lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        exercise = Exercise.objects.create(learning_unit=lu, title='E1', description='', order=1, exercise_type='speaking')
+        Question.objects.create(exercise=exercise, question_type='multiple_choice', order=1,
+                                question_data=json.dumps({'question': 'Which is red?', 'options': ['An apple', {'text': 'The sky'}]}))
+        Question.objects.create(exercise=exercise, question_type='speaking', order=2, question_data='not json')
+        self.cache.disk_bytes = 1024 * 1024
+
+        call_command('presynthesize_tts', stdout=StringIO())
+        synthesized = {c.args[0] for c in synthesize.call_args_list}
+        self.assertTrue({'Which is red?', 'An apple', 'The sky'} <= synthesized)
+
+
+class FeedbackEngineTests(TestCase):
+    def setUp(self):
+        feedback.feedback_cache.clear()
+        patcher = mock.patch.object(feedback.clients, 'AZURE_OPENAI_ENDPOINT', 'https://example.test')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch.object(feedback, 'gpt_feedback', return_value='Great try. Say it slowly. Keep going!')
+    def test_repeat_attempt_hits_cache(self, gpt_feedback):
+        pron = {'pronunciation_score': 90}
+        text, source = feedback.generate_feedback('q1', 'Where are we?', 'The beach.', pron)
+        self.assertEqual(source, 'gpt')
+        # Same answer with different casing/punctuation and a score in the same band
+        text2, source2 = feedback.generate_feedback('q1', 'Where are we?', 'the beach', {'pronunciation_score': 85})
+        self.assertEqual(source2, 'cache')
+        self.assertEqual(text2, text)
+        gpt_feedback.assert_called_once()
+
+    @mock.patch.object(feedback, 'FEEDBACK_LATENCY_BUDGET_MS', 10)
+    def test_slow_gpt_falls_back_to_template(self):
+        release = threading.Event()
+        with mock.patch.object(feedback, 'gpt_feedback', side_effect=lambda *a: release.wait(5) and 'Late GPT feedback.'):
+            text, source = feedback.generate_feedback('q1', 'Where are we?', 'beach', {'pronunciation_score': 40})
+            self.assertEqual(source, 'template')
+            self.assertIn(text, feedback.FEEDBACK_TEMPLATES['low'])
+            release.set()
+
+    @mock.patch.object(feedback, 'FEEDBACK_LATENCY_BUDGET_MS', 10)
+    @mock.patch.object(feedback, '_gpt_slots', threading.BoundedSemaphore(1))
+    def test_saturated_gpt_pool_uses_template_without_queueing(self):
+        release, finished = threading.Event(), threading.Event()
+
+        def slow_gpt(*args):
+            release.wait(5)
+            finished.set()
+            return 'Late GPT feedback.'
+        saturated_before = feedback.stats()['gpt_saturated']
+        with mock.patch.object(feedback, 'gpt_feedback', side_effect=slow_gpt) as gpt_feedback:
+            _, source = feedback.generate_feedback('q1', 'Where are we?', 'beach', {'pronunciation_score': 40})
+            self.assertEqual(source, 'template')
+            # The timed-out call still holds the only slot, so this attempt is not queued behind it
+            _, source = feedback.generate_feedback('q1', 'Where are we?', 'sand', {'pronunciation_score': 40})
+            self.assertEqual(source, 'template')
+            self.assertEqual(gpt_feedback.call_count, 1)
+            self.assertEqual(feedback.stats()['gpt_saturated'], saturated_before + 1)
+            release.set()
+            finished.wait(5)
+        with mock.patch.object(feedback, 'gpt_feedback', return_value='Lovely answer.'):
+            for _ in range(50):  # the slot is released by the done-callback just after the call returns
+                text, source = feedback.generate_feedback('q1', 'Where are we?', 'sea', {'pronunciation_score': 40})
+                if source == 'gpt':
+                    break
+                time.sleep(0.01)
+        self.assertEqual((text, source), ('Lovely answer.', 'gpt'))
+
+    @mock.patch.object(feedback, 'FEEDBACK_MODE', 'template')
+    def test_wrong_answer_is_not_praised(self):
+        pron = {'pronunciation_score': 95}
+        wrong = {'is_correct': False, 'similarity': 0.3, 'matched_answer': 'beach', 'method': 'embedding'}
+        right = dict(wrong, is_correct=True, similarity=0.9)
+        text, _ = feedback.generate_feedback('q1', 'Where are we?', 'The park.', pron, correctness=wrong)
+        self.assertIn(text, feedback.FEEDBACK_TEMPLATES['incorrect'])
+        text, _ = feedback.generate_feedback('q1', 'Where are we?', 'The park.', pron, correctness=right)
+        self.assertIn(text, feedback.FEEDBACK_TEMPLATES['high'])
+
+
+class CorrectnessCheckTests(TestCase):
+    def setUp(self):
+        lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        exercise = Exercise.objects.create(learning_unit=lu, title='E1', description='', order=1, exercise_type='speaking')
+        self.question = Question.objects.create(exercise=exercise, question_type='speaking', order=1, question_data={'question': 'Where are we?'})
+        Question_Embedding.objects.create(question=self.question, expected_answer_text='beach', embedding=[0.0] * 1536)
+
+    @mock.patch.object(correctness, 'embed_text')
+    def test_exact_answer_skips_embedding(self, embed_text):
+        result = correctness.check_answer(str(self.question.id), 'We are at the Beach!')
+        self.assertTrue(result['is_correct'])
+        self.assertEqual(result['method'], 'exact')
+        embed_text.assert_not_called()
+
+    def test_no_expected_answers(self):
+        self.assertIsNone(correctness.check_answer(str(uuid.uuid4()), 'beach'))
+        self.assertIsNone(correctness.check_answer('not-a-uuid', 'beach'))
+
+    def test_embedding_similarity(self):
+        Question_Embedding.objects.filter(question=self.question).update(embedding=[1.0] + [0.0] * 1535)
+        Question_Embedding.objects.create(question=self.question, expected_answer_text='seaside', embedding=[0.0, 1.0] + [0.0] * 1534)
+        client = mock.Mock()
+        client.embeddings.create.side_effect = [
+            mock.Mock(data=[mock.Mock(embedding=[0.6, 0.8] + [0.0] * 1534)]),
+            mock.Mock(data=[mock.Mock(embedding=[0.0, 0.0, 1.0] + [0.0] * 1533)]),
+        ]
+        with mock.patch.object(clients, 'embeddings_client', return_value=client), \
+                mock.patch.object(embeddings, 'embedding_cache', LRUCache(max_items=8)):
+            result = correctness.check_answer(str(self.question.id), 'The Sea, with SAND!')
+            below_threshold = correctness.check_answer(str(self.question.id), 'A park.')
+        # The transcript is embedded normalised, like the expected answers
+        self.assertEqual([c.kwargs['input'] for c in client.embeddings.create.call_args_list], ['the sea with sand', 'a park'])
+        self.assertEqual(result, {'is_correct': True, 'similarity': 0.8, 'matched_answer': 'seaside', 'method': 'embedding'})
+        self.assertFalse(below_threshold['is_correct'])
+        self.assertEqual(below_threshold['similarity'], 0.0)
+
+    def test_nearest_answer_ranks_the_questions_answers(self):
+        answers = [('beach', [1.0, 0.0]), ('sand', [0.6, 0.8]), ('blank', [0.0, 0.0])]
+        text, similarity = correctness.nearest_answer([0.0, 1.0], answers)
+        self.assertEqual(text, 'sand')
+        self.assertAlmostEqual(similarity, 0.8, places=6)
+        self.assertIsNone(correctness.nearest_answer([0.0, 0.0], answers))
+
+
+class PopulateQuestionEmbeddingsTests(TestCase):
+    def setUp(self):
+        lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        exercise = Exercise.objects.create(learning_unit=lu, title='E1', description='', order=1, exercise_type='speaking')
+        self.question = Question.objects.create(exercise=exercise, question_type='speaking', order=1, question_data={'question': 'Where are we?'})
+        Question_Embedding.objects.create(question=self.question, expected_answer_text='beach', embedding=[0.0] * 1536)
+        answers = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        json.dump([
+            {'question_id': str(self.question.id), 'expected_answers': ['beach', ' sand ', 'sea', 'sand']},
+            {'question_id': str(uuid.uuid4()), 'expected_answers': ['missing question']},
+        ], answers)
+        answers.close()
+        self.answers_file = answers.name
+        self.addCleanup(os.remove, answers.name)
+
+    @mock.patch.object(embeddings, 'embed_batch', side_effect=lambda texts: [[0.1] * 1536 for _ in texts])
+    def test_embeds_only_missing_answers_in_batches(self, embed_batch):
+        with self.assertNumQueries(3):  # questions, stored answers, one insert
+            call_command('populate_question_embeddings', self.answers_file, stdout=StringIO(), stderr=StringIO())
+        embed_batch.assert_called_once_with(['sand', 'sea'])
+        self.assertEqual(set(self.question.question_embeddings.values_list('expected_answer_text', flat=True)), {'beach', 'sand', 'sea'})
+
+        call_command('populate_question_embeddings', self.answers_file, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(embed_batch.call_count, 1)
+
+    @mock.patch.object(embeddings, 'embed_batch', side_effect=lambda texts: [[0.1] * 1536 for _ in texts])
+    def test_answers_embedded_normalised(self, embed_batch):
+        with open(self.answers_file, 'w') as f:
+            json.dump([{'question_id': str(self.question.id), 'expected_answers': [' Sand Castle! ', '?!']}], f)
+        call_command('populate_question_embeddings', self.answers_file, '--reembed', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(embed_batch.call_args_list, [mock.call(['beach']), mock.call(['sand castle'])])
+        # The answer text is stored as written, for display and the pronunciation reference
+        self.assertEqual(set(self.question.question_embeddings.values_list('expected_answer_text', flat=True)), {'beach', 'Sand Castle!'})
+        self.assertTrue(all(v == 0.1 for v in self.question.question_embeddings.get(expected_answer_text='beach').embedding))
+
+    @mock.patch.object(embeddings, 'embed_batch')
+    def test_dry_run_reports_plan(self, embed_batch):
+        out = StringIO()
+        call_command('populate_question_embeddings', self.answers_file, '--dry-run', stdout=out, stderr=StringIO())
+        self.assertIn('1 answers already embedded, 2 to embed', out.getvalue())
+        embed_batch.assert_not_called()
+        self.assertEqual(Question_Embedding.objects.count(), 1)
+
+
+class GuidanceRetrievalTests(TestCase):
+    def setUp(self):
+        self.chunks = [Rag_Context.objects.create(source_name='guide.pdf', source_url='', content_chunk=f'Tip {i}',
+                                                  embedding=[0.0] * 1536) for i in range(3)]
+        for patcher in (mock.patch.object(retrieval, 'RAG_RETRIEVAL_ENABLED', True),
+                        mock.patch.object(retrieval, 'retrieval_cache', LRUCache(max_items=8, ttl=60))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_chunk_ids_memoised_per_question(self):
+        nearest = [(c.id, c.content_chunk) for c in self.chunks[:2]]
+        with mock.patch.object(retrieval, 'nearest_chunks', return_value=nearest) as nearest_chunks:
+            self.assertEqual(retrieval.retrieve_guidance('q1', 'Where are we?'), ['Tip 0', 'Tip 1'])
+            self.chunks[0].delete()
+            with self.assertNumQueries(1):
+                self.assertEqual(retrieval.retrieve_guidance('q1', 'Where are we?'), ['Tip 1'])
+            retrieval.retrieve_guidance('q2', 'What can you see?')
+        self.assertEqual(nearest_chunks.call_count, 2)
+
+    def test_disabled_or_failing_retrieval_returns_nothing(self):
+        with mock.patch.object(retrieval, 'nearest_chunks', side_effect=RuntimeError('no embeddings')):
+            self.assertEqual(retrieval.retrieve_guidance('q1', 'Where are we?'), [])
+        with mock.patch.object(retrieval, 'RAG_RETRIEVAL_ENABLED', False):
+            self.assertEqual(retrieval.retrieve_guidance('q1', 'Where are we?'), [])
+
+    def test_guidance_added_to_prompt(self):
+        prompt = feedback.user_prompt('Where are we?', 'beach', {}, guidance=['Model the target sound slowly.'])
+        self.assertIn('- Model the target sound slowly.', prompt)
+        self.assertNotIn('clinical guidance', feedback.user_prompt('Where are we?', 'beach', {}))
+
+
+class ClientRegistryTests(TestCase):
+    def setUp(self):
+        for patcher in (mock.patch.object(clients, '_clients', {}),
+                        mock.patch.object(clients, '_stats', {}),
+                        mock.patch.object(clients, '_synthesizer_pools', {}),
+                        mock.patch.object(clients, 'AZURE_OPENAI_ENDPOINT', 'https://example.openai.azure.com'),
+                        mock.patch.object(clients, 'AZURE_OPENAI_EMB_ENDPOINT', 'https://example.openai.azure.com'),
+                        mock.patch.object(clients, 'AZURE_OPENAI_KEY', 'key'),
+                        mock.patch.object(clients, 'AZURE_SPEECH_KEY', 'key'),
+                        mock.patch.object(clients, 'AI_SPEECH_BACKEND', 'azure')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_clients_built_on_first_use(self):
+        with mock.patch.object(clients, 'AzureOpenAI') as azure_openai:
+            self.assertEqual(clients._clients, {})
+            clients.speech_config()
+            azure_openai.assert_not_called()
+            client = clients.chat_client()
+        azure_openai.assert_called_once()
+        self.assertEqual(azure_openai.call_args.kwargs['azure_endpoint'], 'https://example.openai.azure.com')
+        self.assertIs(client, azure_openai.return_value)
+        self.assertEqual(set(clients._clients), {'speech_recognition', 'chat'})
+
+    def test_clients_reused(self):
+        chat = clients.chat_client()
+        self.assertIs(clients.chat_client(), chat)
+        self.assertIsNot(clients.embeddings_client(), chat)
+        self.assertIs(clients.speech_config(), clients.speech_config())
+        self.assertEqual({name: (s['created'], s['reused']) for name, s in clients.stats().items() if name != 'idle_synthesizers'},
+                         {'chat': (1, 1), 'embeddings': (1, 0), 'speech_recognition': (1, 1)})
+
+    def test_concurrent_first_use_builds_once(self):
+        def slow_client(endpoint):
+            time.sleep(0.05)
+            return object()
+        results = []
+        with mock.patch.object(clients, '_openai_client', side_effect=slow_client) as factory:
+            threads = [threading.Thread(target=lambda: results.append(clients.chat_client())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        factory.assert_called_once()
+        self.assertEqual(len({id(client) for client in results}), 1)
+
+    def test_idle_synthesizers_reused(self):
+        with mock.patch.object(clients, 'AI_SPEECH_BACKEND', 'standin'):
+            synthesizer = clients.acquire_synthesizer(tts.OUTPUT_FORMAT)
+            clients.release_synthesizer(synthesizer, tts.OUTPUT_FORMAT)
+            self.assertIs(clients.acquire_synthesizer(tts.OUTPUT_FORMAT), synthesizer)
+            self.assertIsNot(clients.acquire_synthesizer(tts.OUTPUT_FORMAT), synthesizer)
+        self.assertEqual(clients.stats()['speech_synthesizer']['created'], 2)
+
+    def test_synthesizer_returned_to_pool_when_synthesis_raises(self):
+        with mock.patch.object(clients, 'AI_SPEECH_BACKEND', 'standin'):
+            synthesizer = clients.acquire_synthesizer(tts.OUTPUT_FORMAT)
+            with mock.patch.object(synthesizer, 'speak_ssml_async', side_effect=RuntimeError('connection reset')):
+                clients.release_synthesizer(synthesizer, tts.OUTPUT_FORMAT)
+                with self.assertRaises(RuntimeError):
+                    tts.synthesize('Hello')
+            self.assertIs(clients.acquire_synthesizer(tts.OUTPUT_FORMAT), synthesizer)
+
+    def test_missing_config(self):
+        with mock.patch.object(clients, 'AZURE_OPENAI_KEY', None), mock.patch.dict(os.environ):
+            os.environ.pop('AZURE_OPENAI_API_KEY', None)
+            os.environ.pop('AZURE_OPENAI_AD_TOKEN', None)
+            with self.assertRaises(openai.OpenAIError):
+                clients.chat_client()
+        # A failed build is not cached: the client is built once the key is configured
+        self.assertNotIn('chat', clients._clients)
+        self.assertIsNotNone(clients.chat_client())
+
+        with mock.patch.object(clients, 'AZURE_SPEECH_KEY', None):
+            self.assertFalse(clients.speech_available())
+            with self.assertRaises(ValueError):
+                clients.speech_config()
+            with mock.patch.object(clients, 'AI_SPEECH_BACKEND', 'standin'):
+                self.assertTrue(clients.speech_available())
+                self.assertIsNone(clients.speech_config())
+
+
+class StandinTests(TestCase):
+    def setUp(self):
+        models = {name: standin.LatencyModel(name, 0) for name in standin.DEFAULT_LATENCY_MS}
+        for patcher in (mock.patch.object(standin, '_models', models),
+                        mock.patch.object(clients, 'AI_SPEECH_BACKEND', 'standin')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_latency_and_errors_are_seeded(self):
+        runs = [[standin.LatencyModel('chat', 100, 30, error_rate=0.2, seed=7).draw() for _ in range(20)] for _ in range(2)]
+        self.assertEqual(runs[0], runs[1])
+        model = standin.LatencyModel('chat', 100, 30, error_rate=0.2, seed=7)
+        failures = sum(model.draw()[1] for _ in range(1000))
+        self.assertTrue(100 < failures < 300)
+
+    def test_recognizer_returns_pronunciation_scores(self):
+        config = speechsdk.PronunciationAssessmentConfig(reference_text='the cake is big')
+        result = clients.speech_recognizer(clients.speech_config(), b'\x01\x00' * 16000, config).recognize_once()
+        self.assertEqual(result.reason, speechsdk.ResultReason.RecognizedSpeech)
+        self.assertEqual(result.text, 'the cake is big')
+        scores = speechsdk.PronunciationAssessmentResult(result)
+        self.assertTrue(0 < scores.pronunciation_score <= 100)
+
+    def test_text_to_speech_stream(self):
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch.object(tts, 'tts_cache', tts.TTSCache(memory_bytes=0, disk_dir=cache_dir, disk_bytes=10 ** 6)):
+            response = APIClient().post('/api/AI/text_to_speech/?stream=1', {'text': 'Great job!'}, format='json')
+            audio = b''.join(response.streaming_content)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(audio, standin.fake_mp3(tts.build_ssml('Great job!', tts.DEFAULT_VOICE, tts.DEFAULT_STYLE)))
+
+    def test_openai_server_answers_sdk_clients(self):
+        server = standin.make_server(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+        with mock.patch.object(clients, 'AZURE_OPENAI_KEY', 'standin'):
+            client = clients._openai_client(endpoint)
+            vectors = [item.embedding for item in client.embeddings.create(model=embeddings.EMBEDDING_MODEL, input=['beach', 'beach']).data]
+            reply = client.chat.completions.create(model=feedback.FEEDBACK_MODEL, messages=[{'role': 'user', 'content': 'hi'}])
+        self.assertEqual(len(vectors[0]), 1536)
+        self.assertEqual(vectors[0], vectors[1])
+        self.assertEqual(reply.choices[0].message.content, ' '.join(standin.FEEDBACK_SENTENCES))
+
+
+class AssessmentModeTests(TestCase):
+    """assess_speech end to end on the stand-in speech backend (decoding is patched: no ffmpeg)."""
+
+    def setUp(self):
+        self.client = APIClient()
+        models = {name: standin.LatencyModel(name, 0) for name in standin.DEFAULT_LATENCY_MS}
+        self.recognizer = mock.Mock(wraps=clients.speech_recognizer)
+        for patcher in (mock.patch.object(standin, '_models', models),
+                        mock.patch.object(clients, 'AI_SPEECH_BACKEND', 'standin'),
+                        mock.patch.object(clients, 'speech_recognizer', self.recognizer),
+                        mock.patch.object(azureAIViews, 'decode_to_pcm', return_value=pcm_clip((1, 8000))),
+                        mock.patch.object(azureAIViews, 'SPEECH_DEDUPE_TTL', 0),
+                        mock.patch.object(feedback, 'FEEDBACK_MODE', 'template')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, **data):
+        return self.client.post('/api/AI/assess_speech/', {'file': SimpleUploadedFile('a.m4a', b'audio'), **data},
+                                format='multipart')
+
+    def pronunciation_configs(self):
+        return [call.args[2] if len(call.args) > 2 else None for call in self.recognizer.call_args_list]
+
+    def test_single_pass_assesses_in_one_recognition(self):
+        with mock.patch.object(azureAIViews, 'get_reference_text', return_value='we are at the beach'):
+            response = self.post(assessmentMode='single_pass')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['assessment_mode'], 'single_pass')
+        configs = self.pronunciation_configs()
+        self.assertEqual(len(configs), 1)
+        self.assertEqual(configs[0].reference_text, 'we are at the beach')
+        # The stand-in echoes the reference, and the scores come from the same recognition
+        self.assertEqual(response.data['transcript'], 'we are at the beach')
+        self.assertEqual(response.data['pronunciation']['recognized_text'], 'we are at the beach')
+        self.assertTrue(0 < response.data['pronunciation']['pronunciation_score'] <= 100)
+
+    def test_two_pass_assesses_against_transcript(self):
+        response = self.post(assessmentMode='two_pass')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['assessment_mode'], 'two_pass')
+        first, second = self.pronunciation_configs()
+        self.assertIsNone(first)
+        self.assertEqual(second.reference_text, response.data['transcript'])
+        self.assertIn(response.data['transcript'], standin.TRANSCRIPTS)
+
+    def test_default_mode_from_setting(self):
+        for mode, recognitions in (('single_pass', 1), ('two_pass', 2)):
+            self.recognizer.reset_mock()
+            with mock.patch.object(azureAIViews, 'AZURE_ASSESSMENT_MODE', mode):
+                response = self.post()
+            self.assertEqual(response.data['assessment_mode'], mode)
+            self.assertEqual(self.recognizer.call_count, recognitions)
+
+    def test_invalid_mode_rejected(self):
+        response = self.post(assessmentMode='three_pass')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('single_pass, two_pass', response.data['error'])
+        self.recognizer.assert_not_called()
+
+
+def pcm_clip(*segments):
+    """16 kHz PCM from (seconds, amplitude) segments: quiet noise for amplitude 0, else a 220 Hz tone."""
+    rng = np.random.default_rng(0)
+    parts = []
+    for seconds, amplitude in segments:
+        t = np.arange(int(seconds * audio.SAMPLE_RATE)) / audio.SAMPLE_RATE
+        parts.append(amplitude * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 30, len(t)))
+    return np.concatenate(parts).astype('<i2').tobytes()
+
+
+class AudioPreprocessingTests(TestCase):
+    def test_trims_leading_and_trailing_silence(self):
+        pcm, info = audio.preprocess_pcm(pcm_clip((2, 0), (1, 8000), (3, 0)))
+        self.assertTrue(info['speech_detected'])
+        self.assertEqual(info['input_ms'], 6000)
+        # one second of speech plus the padding either side
+        self.assertAlmostEqual(info['output_ms'], 1000 + 2 * audio.SPEECH_VAD_PADDING_MS, delta=40)
+        self.assertEqual(len(pcm), info['output_ms'] * audio.BYTES_PER_SECOND // 1000)
+
+    def test_silence_is_passed_on_untrimmed(self):
+        clip = pcm_clip((1, 0))
+        pcm, info = audio.preprocess_pcm(clip)
+        self.assertEqual(pcm, clip)
+        self.assertFalse(info['speech_detected'])
+
+    def test_clip_without_silence_is_kept_whole(self):
+        clip = pcm_clip((0.6, 3000), (0.6, 16000), (0.6, 3000))
+        pcm, info = audio.preprocess_pcm(clip)
+        self.assertTrue(info['speech_detected'])
+        self.assertEqual(info['output_ms'], 1800)
+        self.assertEqual(pcm, clip)
+
+    def test_loud_clip_counts_as_speech(self):
+        pcm, info = audio.preprocess_pcm(pcm_clip((1, 16000)))
+        self.assertTrue(info['speech_detected'])
+        self.assertEqual(info['output_ms'], 1000)
+
+    def test_duration_capped(self):
+        with mock.patch.object(audio, 'SPEECH_MAX_SPEECH_SECONDS', 1):
+            pcm, info = audio.preprocess_pcm(pcm_clip((3, 8000)))
+        self.assertTrue(info['capped'])
+        self.assertEqual(len(pcm), audio.BYTES_PER_SECOND)
+
+
+class DecodeToPcmTests(TestCase):
+    """decode_to_pcm with ffmpeg mocked out: the command it runs and how its result is mapped."""
+
+    def run_ffmpeg(self, returncode=0, stdout=b'\x01\x00' * 160, stderr=b''):
+        def run(command, **kwargs):
+            # The upload is only readable while decode_to_pcm holds the memfd open
+            source = command[command.index('-i') + 1]
+            self.received = open(source, 'rb').read() if source.startswith('/proc/self/fd/') else kwargs.get('input')
+            return subprocess.CompletedProcess(command, returncode, stdout=stdout, stderr=stderr)
+        return mock.patch.object(audio.subprocess, 'run', side_effect=run)
+
+    def test_upload_decoded_through_memfd(self):
+        with self.run_ffmpeg() as run:
+            pcm = audio.decode_to_pcm([b'first ', b'second'], size=12)
+        self.assertEqual(pcm, b'\x01\x00' * 160)
+        self.assertEqual(self.received, b'first second')
+        command, kwargs = run.call_args.args[0], run.call_args.kwargs
+        self.assertEqual(command[:5], ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin'])
+        fd = kwargs['pass_fds'][0]
+        self.assertEqual(command[command.index('-i') + 1], f'/proc/self/fd/{fd}')
+        self.assertEqual(command[command.index('-ar') + 1], str(audio.SAMPLE_RATE))
+        self.assertEqual(command[command.index('-ac') + 1], str(audio.CHANNELS))
+        self.assertEqual(command[command.index('-f') + 1], 's16le')
+        self.assertEqual(command[command.index('-t') + 1], str(audio.MAX_AUDIO_SECONDS))
+        self.assertEqual(command[-1], 'pipe:1')
+        self.assertTrue(kwargs['capture_output'])
+        self.assertEqual(kwargs['timeout'], audio.FFMPEG_TIMEOUT_SECONDS)
+        with self.assertRaises(OSError):
+            os.fstat(fd)  # closed again
+
+    def test_upload_piped_without_memfd(self):
+        with self.run_ffmpeg() as run, mock.patch.object(audio, 'os', SimpleNamespace()):
+            audio.decode_to_pcm([b'first ', b'second'])
+        self.assertEqual(run.call_args.args[0][run.call_args.args[0].index('-i') + 1], 'pipe:0')
+        self.assertEqual(self.received, b'first second')
+
+    def test_ffmpeg_errors_mapped(self):
+        with self.run_ffmpeg(returncode=1, stdout=b'', stderr=b'moov atom not found\n'):
+            with self.assertRaisesRegex(audio.AudioDecodeError, '^Could not decode audio: moov atom not found$'):
+                audio.decode_to_pcm([b'not audio'])
+        with self.run_ffmpeg(stdout=b''):
+            with self.assertRaisesRegex(audio.AudioDecodeError, 'no samples'):
+                audio.decode_to_pcm([b'silence'])
+        with mock.patch.object(audio.subprocess, 'run', side_effect=subprocess.TimeoutExpired('ffmpeg', 30)):
+            with self.assertRaisesRegex(audio.AudioDecodeError, 'Timed out'):
+                audio.decode_to_pcm([b'slow'])
+
+    def test_oversized_upload_rejected_before_ffmpeg(self):
+        with self.run_ffmpeg() as run, mock.patch.object(audio, 'MAX_UPLOAD_BYTES', 8):
+            with self.assertRaisesRegex(audio.AudioDecodeError, 'exceeds 8 bytes'):
+                audio.decode_to_pcm([b'12345', b'67890'])
+        run.assert_not_called()
+
+class AsyncAssessmentTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.release = threading.Event()
+        self.queue = jobs.JobQueue(workers=1, queue_size=1)
+        for patcher in (mock.patch.object(jobs, 'speech_jobs', self.queue),
+                        mock.patch.object(azureAIViews, 'assessment_job_ids', LRUCache(max_items=8, ttl=60))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def run_assessment(self, audio_chunks, size, question_id, question_text, assessment_mode):
+        self.release.wait(5)
+        return {'transcript': b''.join(audio_chunks).decode(), 'timings': {'decode_ms': 3}}, 200
+
+    def submit(self, data=b'beach'):
+        return self.client.post('/api/AI/assess_speech/?async=1', {'file': SimpleUploadedFile('a.m4a', data)}, format='multipart')
+
+    def test_job_result_long_poll(self):
+        with mock.patch.object(azureAIViews, 'run_assessment', self.run_assessment):
+            response = self.submit()
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            result_url = response.data['result_url']
+            self.assertEqual(result_url, f"/api/AI/assess_speech/jobs/{response.data['job_id']}/")
+            self.assertEqual(self.client.get(result_url).status_code, status.HTTP_202_ACCEPTED)
+
+            self.release.set()
+            response = self.client.get(result_url, {'wait': 5}, **{'wsgi.multithread': True})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['transcript'], 'beach')
+        self.assertEqual(response.data['job']['status'], 'done')
+        self.assertEqual(self.queue.stats()['avg_stage_ms'], {'decode_ms': 3.0})
+        self.assertEqual(self.client.get('/api/AI/assess_speech/jobs/unknown/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_job_visible_to_other_processes(self):
+        with mock.patch.object(azureAIViews, 'run_assessment', self.run_assessment):
+            job_id = self.submit().data['job_id']
+            # Another web process has its own queue and threads but reads the shared job store
+            other_process = jobs.JobQueue(workers=1, queue_size=1)
+            self.assertIn(other_process.get(job_id)['status'], ('queued', 'running'))
+            self.release.set()
+            job = other_process.wait(job_id, 5)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['payload']['transcript'], 'beach')
+        self.assertIsNone(other_process.get('unknown'))
+
+    def test_queued_state_published_before_workers_see_the_job(self):
+        put_nowait, published = self.queue._queue.put_nowait, []
+
+        def put(job):
+            # A fast worker could finish the job as soon as it is queued, so a "queued" write
+            # after this point could overwrite its result: the shared store must have it already
+            published.append(jobs.JobQueue(workers=1, queue_size=1).get(job.id))
+            put_nowait(job)
+        with mock.patch.object(azureAIViews, 'run_assessment', self.run_assessment), \
+                mock.patch.object(self.queue._queue, 'put_nowait', put):
+            response = self.submit()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual([snapshot and snapshot['status'] for snapshot in published], ['queued'])
+
+    def test_wait_ignored_by_sync_workers(self):
+        with mock.patch.object(azureAIViews, 'run_assessment', self.run_assessment):
+            result_url = self.submit().data['result_url']
+            started = time.monotonic()
+            response = self.client.get(result_url, {'wait': 5}, **{'wsgi.multithread': False})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_full_queue_rejected_with_retry_after(self):
+        with mock.patch.object(azureAIViews, 'run_assessment', self.run_assessment):
+            self.submit(b'first')
+            while self.queue.stats()['running'] == 0:
+                time.sleep(0.01)
+            # one job running, one waiting: the queue is full
+            self.assertEqual(self.submit(b'second').status_code, status.HTTP_202_ACCEPTED)
+            response = self.submit(b'third')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], str(response.data['retry_after']))
+        self.assertEqual(self.queue.stats()['rejected'], 1)
+
+
+class SpeechDedupeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        caches[jobs.SPEECH_JOB_CACHE].clear()
+        for patcher in (mock.patch.object(azureAIViews, 'assessment_results', self.process_flight()),
+                        mock.patch.object(azureAIViews, 'assessment_job_ids', SharedCache(jobs.SPEECH_JOB_CACHE, 'test-job', 60)),
+                        mock.patch.object(jobs, 'speech_jobs', jobs.JobQueue(workers=1, queue_size=4))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def process_flight(self):
+        # What one web process holds: its own in-flight calls, results in the shared store
+        return SingleFlight(should_store=lambda r: r[1] == 200, results=SharedCache(jobs.SPEECH_JOB_CACHE, 'test-dedupe', 60))
+
+    def post(self, data, question_id='q1', query=''):
+        return self.client.post(f'/api/AI/assess_speech/{query}', {'file': SimpleUploadedFile('a.m4a', data), 'questionId': question_id},
+                                format='multipart')
+
+    @mock.patch.object(azureAIViews, 'run_assessment', return_value=({'transcript': 'beach'}, 200))
+    def test_retry_served_from_store(self, run_assessment):
+        self.assertEqual(self.post(b'audio')['X-Assessment-Dedupe'], 'miss')
+        retry = self.post(b'audio')
+        self.assertEqual(retry['X-Assessment-Dedupe'], 'stored')
+        self.assertEqual(retry.data, {'transcript': 'beach'})
+        self.post(b'audio', question_id='q2')
+        self.post(b'other audio')
+        self.assertEqual(run_assessment.call_count, 3)
+
+    @mock.patch.object(azureAIViews, 'run_assessment', return_value=({'transcript': 'beach'}, 200))
+    def test_retry_reaching_another_process_served_from_shared_store(self, run_assessment):
+        self.post(b'audio')
+        with mock.patch.object(azureAIViews, 'assessment_results', self.process_flight()):
+            retry = self.post(b'audio')
+        self.assertEqual(retry['X-Assessment-Dedupe'], 'stored')
+        self.assertEqual(retry.data, {'transcript': 'beach'})
+        run_assessment.assert_called_once()
+
+    @mock.patch.object(azureAIViews, 'run_assessment', return_value=({'error': 'Speech recognition failed'}, 400))
+    def test_failures_not_stored(self, run_assessment):
+        self.post(b'audio')
+        self.assertEqual(self.post(b'audio')['X-Assessment-Dedupe'], 'miss')
+        self.assertEqual(run_assessment.call_count, 2)
+
+    @mock.patch.object(azureAIViews, 'run_assessment', return_value=({'transcript': 'beach'}, 200))
+    def test_async_retry_gets_same_job(self, run_assessment):
+        first = self.post(b'audio', query='?async=1')
+        self.assertEqual(self.post(b'audio', query='?async=1').data['job_id'], first.data['job_id'])
+
+    def test_concurrent_duplicates_share_one_call(self):
+        flight = SingleFlight(max_items=8, ttl=60)
+        started, release, calls, results = threading.Event(), threading.Event(), [], []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(flight.do('k', slow)))
+        follower.start()
+        while flight.stats()['in_flight_waits'] == 0:
+            time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertCountEqual(results, [('result', None), ('result', 'in_flight')])
+        self.assertEqual(flight.do('k', slow), ('result', 'stored'))
+
+    def test_follower_stops_waiting_for_blocked_leader(self):
+        flight = SingleFlight(max_items=8, ttl=60, wait_timeout=0.05)
+        started, release, results = threading.Event(), threading.Event(), []
+
+        def blocked():
+            started.set()
+            release.wait(5)
+            return 'leader'
+
+        leader = threading.Thread(target=lambda: results.append(flight.do('k', blocked)))
+        leader.start()
+        self.addCleanup(leader.join, 5)
+        self.addCleanup(release.set)
+        started.wait(5)
+        began = time.monotonic()
+        self.assertEqual(flight.do('k', lambda: 'follower'), ('follower', None))
+        self.assertLess(time.monotonic() - began, 1)
+        self.assertEqual(flight.stats()['in_flight_wait_timeouts'], 1)
+        self.assertEqual(flight.do('k', blocked), ('follower', 'stored'))
+        self.assertEqual(results, [])  # the leader is still blocked
+
+
+class LRUCacheTests(TestCase):
+    def test_evicts_least_recently_used_by_size(self):
+        cache = LRUCache(max_bytes=10)
+        cache.set('a', b'12345')
+        cache.set('b', b'12345')
+        cache.get('a')
+        cache.set('c', b'12345')
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.evictions, 1)
+
+
+class EmbeddingBatchTests(TestCase):
+    def test_batches_respect_input_and_token_limits(self):
+        texts = ['x' * 400] * 10  # ~100 tokens each
+        self.assertEqual([len(b) for b in embeddings.iter_batches(texts, batch_size=4)], [4, 4, 2])
+        self.assertEqual([len(b) for b in embeddings.iter_batches(texts, batch_size=10, max_tokens=350)], [3, 3, 3, 1])
+
+
+class ChunkerTests(TestCase):
+    def setUp(self):
+        # One token per word keeps the expected chunks readable
+        self.chunker = Chunker(max_tokens=20, overlap_tokens=10,
+                               count_tokens=lambda texts: [len(t.split()) for t in texts])
+
+    def test_chunks_keep_sentences_whole_with_overlap(self):
+        text = ' '.join(f'Sentence {i} has exactly six words.' for i in range(6))
+        chunks = list(self.chunker.chunks([text]))
+        self.assertEqual(chunks[0], 'Sentence 0 has exactly six words. Sentence 1 has exactly six words. '
+                                    'Sentence 2 has exactly six words.')
+        self.assertTrue(chunks[1].startswith('Sentence 2 has'))  # overlap of one sentence
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk.split()), 20)
+            self.assertTrue(chunk.endswith('.'))
+        self.assertIn('Sentence 5 has exactly six words.', chunks[-1])
+
+    def test_streamed_pieces_match_whole_text(self):
+        text = ' '.join(f'Sentence {i} is here.\n\nNext {i}!' for i in range(50))
+        pieces = [text[i:i + 37] for i in range(0, len(text), 37)]
+        with mock.patch('controller.ai.chunking.FLUSH_CHARS', 100):
+            self.assertEqual(list(self.chunker.chunks(pieces)), list(self.chunker.chunks([text])))
+
+    def test_long_sentence_split_by_words(self):
+        chunks = list(self.chunker.chunks([' '.join(['word'] * 45) + '.']))
+        self.assertEqual([len(c.split()) for c in chunks], [20, 20, 5])
+
+    def test_tiny_tail_merged_into_previous_chunk(self):
+        # min_tokens is 5: the 98 tokens of the first three sentences fill a chunk, the last
+        # sentence overflows it and starts a new one after the 8-token overlap
+        chunker = Chunker(max_tokens=100, overlap_tokens=10, count_tokens=self.chunker.count_tokens)
+        head = ' '.join(' '.join([name] * n) + '.' for name, n in (('alpha', 60), ('beta', 30), ('gamma', 8)))
+
+        split = list(chunker.chunks([f'{head} {" ".join(["tail"] * 5)}.']))
+        self.assertEqual(len(split), 2)
+        self.assertEqual(split[0], head)
+        self.assertTrue(split[1].startswith('gamma'))
+
+        merged = list(chunker.chunks([f'{head} tail tail tail.']))
+        self.assertEqual(merged, [f'{head} tail tail tail.'])  # overlap not repeated
+        self.assertEqual(len(merged[0].split()), 101)
+        self.assertLess(len(merged[0].split()), chunker.max_tokens + chunker.min_tokens)
+
+
+def _ingest_reporting_budget(path, batch_size, max_in_flight):
+    # Stands in for populate_documents.process_pdf in a worker process
+    return max_in_flight
+
+
+class IngestionTests(TestCase):
+    def setUp(self):
+        # Five words per sentence and at most six tokens per chunk: one chunk per sentence
+        patcher = mock.patch.object(ingestion, 'chunker', Chunker(max_tokens=6, overlap_tokens=0,
+                                                                  count_tokens=lambda texts: [len(t.split()) for t in texts]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ingest(self, facts, embed=lambda texts: [[0.1] * 1536 for _ in texts]):
+        pages = [f'Fact number {i} is true.\n' for i in facts]
+        with mock.patch.object(ingestion, 'embed_batch', side_effect=embed) as embed_batch:
+            stored = ingestion.ingest_document('doc.pdf', 'file://doc.pdf', pages, batch_size=1, max_in_flight=1)
+        return stored, [text for call in embed_batch.call_args_list for text in call.args[0]]
+
+    def stored_chunks(self, source_name='doc.pdf'):
+        return set(Rag_Context.objects.filter(source_name=source_name).values_list('content_chunk', flat=True))
+
+    def legacy_row(self, source_name='doc.pdf'):
+        return Rag_Context.objects.create(source_name=source_name, source_url='', content_chunk='Old chunk.', embedding=[0.0] * 1536)
+
+    def test_unchanged_chunks_are_not_embedded_again(self):
+        self.assertEqual(self.ingest([0, 1, 2])[0], 3)
+        stored, embedded = self.ingest([0, 1, 2])
+        self.assertEqual((stored, embedded), (0, []))
+        self.assertEqual(Rag_Context.objects.count(), 3)
+
+    def test_stale_chunks_and_removed_sources_are_deleted(self):
+        self.legacy_row()  # from before content hashing
+        self.ingest([0, 1, 2])
+        stored, embedded = self.ingest([0, 1, 3])
+        self.assertEqual((stored, embedded), (1, ['Fact number 3 is true.']))
+        self.assertEqual(self.stored_chunks(), {f'Fact number {i} is true.' for i in (0, 1, 3)})
+
+        self.legacy_row('removed.pdf')
+        self.assertEqual(ingestion.remove_deleted_sources(['doc.pdf']), 1)
+        self.assertEqual(self.stored_chunks('removed.pdf'), set())
+        self.assertEqual(len(self.stored_chunks()), 3)
+
+    def test_interrupted_run_resumes_with_missing_chunks(self):
+        self.legacy_row()
+
+        def failing_second_batch(texts):
+            if texts == ['Fact number 1 is true.']:
+                raise openai.APIConnectionError(request=mock.Mock())
+            return [[0.1] * 1536 for _ in texts]
+        self.assertEqual(self.ingest([0, 1, 2], embed=failing_second_batch)[0], 2)
+        # A batch failed, so the old rows are kept until the document is complete
+        self.assertIn('Old chunk.', self.stored_chunks())
+
+        stored, embedded = self.ingest([0, 1, 2])
+        self.assertEqual((stored, embedded), (1, ['Fact number 1 is true.']))
+        self.assertEqual(self.stored_chunks(), {f'Fact number {i} is true.' for i in (0, 1, 2)})
+
+    def test_worker_processes_share_the_in_flight_budget(self):
+        self.assertEqual(ingestion.split_in_flight(8, 4), (4, 2))
+        self.assertEqual(ingestion.split_in_flight(2, 16), (2, 1))
+        paths = ['a.pdf', 'b.pdf', 'c.pdf']
+        # Three workers with two requests each, and with a budget of two only two workers
+        self.assertEqual(ingestion.ingest_in_processes(_ingest_reporting_budget, paths, processes=3, max_in_flight=6), 6)
+        with mock.patch.object(ingestion, 'ProcessPoolExecutor', wraps=ingestion.ProcessPoolExecutor) as pool:
+            self.assertEqual(ingestion.ingest_in_processes(_ingest_reporting_budget, paths, processes=8, max_in_flight=2), 3)
+        self.assertEqual(pool.call_args.kwargs['max_workers'], 2)
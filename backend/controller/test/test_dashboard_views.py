@@ -0,0 +1,86 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework import status
+import uuid
+from datetime import timedelta
+from django.utils import timezone
+
+from controller.models import (
+    User, Profile, User_Profile, Learning_Unit, Exercise, Assignment, Exercise_Result
+)
+from controller.progress import rebuild_counters, streaks
+
+# dashboard views test
+
+# therapist, count, page, streaks
+NUM_QUERIES_CASELOAD = 4
+
+
+class TherapistCaseloadTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.therapist = User.objects.create(id=uuid.uuid4(), email='t@test.com', user_type='therapist', subscription_type='paid')
+        self.lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        self.exercises = [Exercise.objects.create(learning_unit=self.lu, title=f'E{i}', description='', order=i, exercise_type='speaking')
+                          for i in range(4)]
+        self.url = f'/api/dashboard/{self.therapist.id}/caseload/'
+
+    def add_child(self, name, completed=0, correct=0, incorrect=0, days_ago=0):
+        child = Profile.objects.create(profile_type='child', name=name)
+        User_Profile.objects.create(user=self.therapist, profile=child)
+        assignment = Assignment.objects.create(learning_unit=self.lu, participation_type='required',
+                                               assigned_to=child, assigned_by=self.therapist)
+        for i, exercise in enumerate(self.exercises[:completed]):
+            Exercise_Result.objects.create(assignment=assignment, exercise=exercise, time_spent=10, num_correct=correct,
+                                           num_incorrect=incorrect, completed_at=timezone.now() - timedelta(days=days_ago + i))
+        rebuild_counters(Assignment.objects.filter(pk=assignment.pk))
+        return child
+
+    def test_caseload_progress(self):
+        self.add_child('Ava', completed=2, correct=3, incorrect=1)
+        self.add_child('Ben')
+        # not linked to this therapist
+        Profile.objects.create(profile_type='child', name='Cal')
+
+        with self.assertNumQueries(NUM_QUERIES_CASELOAD):
+            r = self.client.get(self.url)
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.data['count'], 2)
+        ava, ben = r.data['results']
+        self.assertEqual((ava['name'], ava['total_assignments'], ava['total_exercises'], ava['completed_exercises']), ('Ava', 1, 4, 2))
+        self.assertEqual((ava['completion'], ava['accuracy'], ava['total_time_spent'], ava['streak']), (50.0, 75.0, 20, 2))
+        self.assertIsNotNone(ava['last_activity'])
+        self.assertEqual((ben['completion'], ben['accuracy'], ben['streak'], ben['last_activity']), (0.0, 0.0, 0, None))
+
+    def test_query_count_is_independent_of_caseload_size(self):
+        for i in range(8):
+            self.add_child(f'Child {i}', completed=i % 4, correct=1)
+        with self.assertNumQueries(NUM_QUERIES_CASELOAD):
+            r = self.client.get(self.url, {'sort': '-completion'})
+        self.assertEqual(len(r.data['results']), 8)
+        completion = [row['completion'] for row in r.data['results']]
+        self.assertEqual(completion, sorted(completion, reverse=True))
+
+    def test_sorting_and_pagination(self):
+        self.add_child('Old', completed=1, days_ago=10)
+        self.add_child('New', completed=1)
+        self.add_child('Idle')
+        r = self.client.get(self.url, {'sort': '-last_activity', 'page_size': 2})
+        self.assertEqual([row['name'] for row in r.data['results']], ['New', 'Old'])
+        r = self.client.get(r.data['next'])
+        self.assertEqual([row['name'] for row in r.data['results']], ['Idle'])
+        self.assertEqual(self.client.get(self.url, {'sort': 'age'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_or_non_therapist_user(self):
+        parent = User.objects.create(id=uuid.uuid4(), email='p@test.com', user_type='parent', subscription_type='free_trial')
+        self.assertEqual(self.client.get(f'/api/dashboard/{parent.id}/caseload/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/api/dashboard/{uuid.uuid4()}/caseload/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_streaks(self):
+        today = timezone.localdate()
+        # a streak still counts when nothing is completed yet today, and breaks at the first gap
+        child = self.add_child('Ava', completed=3, days_ago=1)
+        Exercise_Result.objects.create(assignment=Assignment.objects.get(assigned_to=child), exercise=self.exercises[3],
+                                       completed_at=timezone.now() - timedelta(days=5))
+        self.assertEqual(streaks([child.id], today=today), {child.id: 3})
+        self.assertEqual(streaks([child.id], today=today + timedelta(days=2)), {child.id: 0})
@@ -2,8 +2,10 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
 import uuid
+from datetime import timedelta
+from django.utils import timezone
 
-from controller.models import User, Profile, User_Profile
+from controller.models import User, Profile, User_Profile, Learning_Unit, Exercise, Assignment, Exercise_Result
 
 
 class ProfileViewsTests(TestCase):
@@ -28,3 +30,21 @@ class ProfileViewsTests(TestCase):
         r = self.client.get(f'/api/profile/{self.user.id}/list/')
         self.assertEqual(r.status_code, status.HTTP_200_OK)
         self.assertTrue(len(r.data) >= 1)
+
+    def test_child_streak_counts_today(self):
+        child = Profile.objects.create(profile_type='child', name='C1', streak=5)
+        lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        assignment = Assignment.objects.create(learning_unit=lu, participation_type='required',
+                                               assigned_to=child, assigned_by=self.user)
+        for days_ago in (0, 1, 3):
+            exercise = Exercise.objects.create(learning_unit=lu, title=f'E{days_ago}', description='', order=days_ago,
+                                               exercise_type='speaking')
+            Exercise_Result.objects.create(assignment=assignment, exercise=exercise,
+                                           completed_at=timezone.now() - timedelta(days=days_ago))
+
+        # same definition as the therapist caseload: today and yesterday, broken by the gap
+        r = self.client.get(f'/api/profile/{child.id}/data/')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.data['streak'], 2)
+        child.refresh_from_db()
+        self.assertEqual(child.streak, 2)
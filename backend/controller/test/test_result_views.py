@@ -2,15 +2,32 @@ from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
 import uuid
+from datetime import timedelta
 from django.utils import timezone
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.db.models.query import QuerySet
+from io import StringIO
+from unittest import mock
 
 from controller.models import (
     User, Profile, Learning_Unit, Exercise, Assignment,
     Exercise_Result, Question, Question_Result
 )
+from controller.progress import rebuild_counters, stale_counters
 
 # result views test
 
+# child, question + exercise, assignment, exercise result (locked), question result (select + update),
+# one aggregate UPDATE, refresh, plus two savepoints and their releases (resubmitting the same
+# answer leaves the assignment counters alone)
+NUM_QUERIES_QUESTION_POST = 12
+# child, exercises, questions, assignments, result insert, results (locked), question upsert,
+# aggregate update, completion update, new totals, assignment counters update, finished assignments
+# update, response, plus the savepoint and its release - the same for any number of questions
+NUM_QUERIES_BULK_POST = 15
+
 class ResultViewsTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -43,8 +60,278 @@ class ResultViewsTests(TestCase):
         self.assertEqual(er.num_correct, 2)
         self.assertEqual(er.num_incorrect, 1)
 
+    def test_results_for_question_resubmission_replaces_answer(self):
+        second = Question.objects.create(exercise=self.exercise, question_type='speaking', order=2, question_data={})
+        url = f'/api/result/{self.child.id}/question/{self.question.id}/'
+        r = self.client.post(url, {'num_incorrect': 1, 'num_correct': 3, 'time_spent': 30}, format='json')
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        self.client.post(f'/api/result/{self.child.id}/question/{second.id}/', {'num_incorrect': 0, 'num_correct': 2, 'time_spent': 5}, format='json')
+        r = self.client.post(url + '?expand=exercise_result', {'num_incorrect': 3, 'num_correct': 1, 'time_spent': 10}, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+
+        # totals are the sums of the question results: the first answer was replaced
+        er = Exercise_Result.objects.get(assignment=self.assignment, exercise=self.exercise)
+        self.assertEqual((er.num_correct, er.num_incorrect, er.time_spent), (3, 3, 15))
+        self.assertAlmostEqual(er.accuracy, 50.0)
+        self.assertEqual(r.data['exercise_result']['num_correct'], 3)
+        self.assertAlmostEqual(r.data['exercise_result']['accuracy'], 50.0)
+
+    def test_parallel_first_submissions_share_one_result(self):
+        # Another request inserts the Exercise_Result between this request's lookup and its insert
+        real_get, raced = QuerySet.get, []
+
+        def get(queryset, *args, **kwargs):
+            if queryset.model is Exercise_Result and not raced:
+                raced.append(Exercise_Result.objects.create(assignment=self.assignment, exercise=self.exercise))
+                raise Exercise_Result.DoesNotExist
+            return real_get(queryset, *args, **kwargs)
+
+        url = f'/api/result/{self.child.id}/question/{self.question.id}/'
+        with mock.patch.object(QuerySet, 'get', get):
+            r = self.client.post(url, {'num_incorrect': 1, 'num_correct': 2, 'time_spent': 30}, format='json')
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(r.data['exercise_result'], raced[0].id)
+        # Later submissions still find exactly one result
+        r = self.client.post(f'/api/result/{self.child.id}/exercise/{self.exercise.id}/', format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(Exercise_Result.objects.filter(assignment=self.assignment, exercise=self.exercise).count(), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Exercise_Result.objects.create(assignment=self.assignment, exercise=self.exercise)
+
+    def test_result_posts_maintain_assignment_counters(self):
+        url = f'/api/result/{self.child.id}/question/{self.question.id}/'
+        self.client.post(url, {'num_incorrect': 1, 'num_correct': 3, 'time_spent': 30}, format='json')
+        self.client.post(url, {'num_incorrect': 2, 'num_correct': 0, 'time_spent': 10}, format='json')
+        exercise_url = f'/api/result/{self.child.id}/exercise/{self.exercise.id}/'
+        self.client.post(exercise_url, format='json')
+        self.client.post(exercise_url, format='json')  # completing again doesn't count twice
+
+        self.assignment.refresh_from_db()
+        self.assertEqual(
+            (self.assignment.completed_exercises, self.assignment.total_time_spent,
+             self.assignment.total_correct, self.assignment.total_incorrect),
+            (1, 10, 0, 2),
+        )
+        self.assertIsNotNone(self.assignment.completed_at)
+        self.assertFalse(stale_counters(Assignment.objects.all()).exists())
+
+    def test_rebuild_assignment_progress_command(self):
+        Exercise_Result.objects.create(assignment=self.assignment, exercise=self.exercise, time_spent=25,
+                                       num_correct=2, num_incorrect=1, completed_at=timezone.now())
+        out = StringIO()
+        call_command('rebuild_assignment_progress', '--dry-run', stdout=out)
+        self.assertIn('1 of 1 assignments have stale counters', out.getvalue())
+        self.assignment.refresh_from_db()
+        self.assertEqual(self.assignment.completed_exercises, 0)
+
+        call_command('rebuild_assignment_progress', '--child', str(self.child.id), stdout=StringIO())
+        self.assignment.refresh_from_db()
+        self.assertEqual(
+            (self.assignment.completed_exercises, self.assignment.total_time_spent,
+             self.assignment.total_correct, self.assignment.total_incorrect),
+            (1, 25, 2, 1),
+        )
+
+    def test_flat_fields_by_default_and_expand_on_request(self):
+        url = f'/api/result/{self.child.id}/question/{self.question.id}/'
+        self.client.post(url, {'num_incorrect': 1, 'num_correct': 2, 'time_spent': 30}, format='json')
+
+        # child, question, results - foreign keys come back as IDs
+        with self.assertNumQueries(3):
+            r = self.client.get(url)
+        self.assertEqual(r.data[0]['exercise_result'], Exercise_Result.objects.get().id)
+        self.assertEqual(r.data[0]['question'], self.question.id)
+
+        # nested relations are joined into the same results query
+        with self.assertNumQueries(3):
+            r = self.client.get(url, {'expand': 'exercise_result.exercise,question'})
+        self.assertEqual(r.data[0]['exercise_result']['exercise']['title'], 'E1')
+        self.assertEqual(r.data[0]['question']['id'], str(self.question.id))
+
+        r = self.client.get(url, {'fields': 'id,num_correct'})
+        self.assertEqual(set(r.data[0]), {'id', 'num_correct'})
+
+    def test_assignment_endpoints_expand(self):
+        url = f'/api/assignment/{self.child.id}/assigned_to/'
+        r = self.client.get(url)
+        self.assertEqual(r.data[0]['learning_unit'], self.lu.id)
+        with self.assertNumQueries(2):
+            r = self.client.get(url, {'expand': 'learning_unit,assigned_by'})
+        self.assertEqual(r.data[0]['learning_unit']['title'], 'LU')
+        self.assertEqual(r.data[0]['assigned_by']['email'], 'u@test.com')
+        r = self.client.get(f'/api/assignment/{self.user.id}/assigned_by/', {'expand': 'assigned_to', 'fields': 'id,assigned_to'})
+        self.assertEqual(r.data[0]['assigned_to']['name'], 'Child')
+        self.assertEqual(set(r.data[0]), {'id', 'assigned_to'})
+
+    def test_results_for_question_post_query_count(self):
+        url = f'/api/result/{self.child.id}/question/{self.question.id}/'
+        payload = {'num_incorrect': 1, 'num_correct': 2, 'time_spent': 30}
+        self.client.post(url, payload, format='json')
+        with self.assertNumQueries(NUM_QUERIES_QUESTION_POST):
+            r = self.client.post(url, payload, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+
     def test_results_for_learning_unit_overall(self):
         url = f'/api/result/{self.child.id}/learning_unit_overall/total/'
         r = self.client.get(url)
         self.assertEqual(r.status_code, status.HTTP_200_OK)
         self.assertIn('total_exercises', r.data)
+
+    def test_learning_unit_overall_single_query(self):
+        other_lu = Learning_Unit.objects.create(title='LU2', description='', category='articulation')
+        for i in range(2):
+            Exercise.objects.create(learning_unit=other_lu, title=f'R{i}', description='', order=i, exercise_type='speaking')
+        recommended = Assignment.objects.create(learning_unit=other_lu, participation_type='recommended', assigned_to=self.child, assigned_by=self.user)
+        Exercise_Result.objects.create(assignment=self.assignment, exercise=self.exercise, time_spent=30, completed_at=timezone.now())
+        Exercise_Result.objects.create(assignment=recommended, exercise=other_lu.exercises.first(), time_spent=15)
+        rebuild_counters(Assignment.objects.all())  # results were created directly, not through the views
+
+        with self.assertNumQueries(1):
+            r = self.client.get(f'/api/result/{self.child.id}/learning_unit_overall/')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(r.data['total'], {'total_exercises': 3, 'completed_exercises': 1, 'total_time_spent': 45})
+        self.assertEqual(r.data['required'], {'total_exercises': 1, 'completed_exercises': 1, 'total_time_spent': 30})
+        self.assertEqual(r.data['recommended'], {'total_exercises': 2, 'completed_exercises': 0, 'total_time_spent': 15})
+
+        with self.assertNumQueries(1):
+            r = self.client.get(f'/api/result/{self.child.id}/learning_unit_overall/recommended/')
+        self.assertEqual(r.data, {'total_exercises': 2, 'completed_exercises': 0, 'total_time_spent': 15})
+        self.assertEqual(self.client.get(f'/api/result/{uuid.uuid4()}/learning_unit_overall/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ExerciseResultsFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(id=uuid.uuid4(), email='u@test.com', user_type='parent', subscription_type='free_trial')
+        self.child = Profile.objects.create(profile_type='child', name='Child')
+        self.units = [Learning_Unit.objects.create(title=f'LU{i}', description='', category='articulation') for i in range(2)]
+        self.assignments = [
+            Assignment.objects.create(learning_unit=lu, participation_type=kind, assigned_to=self.child, assigned_by=self.user)
+            for lu, kind in zip(self.units, ('required', 'recommended'))
+        ]
+        start = timezone.now() - timedelta(days=30)
+        for i in range(30):
+            assignment = self.assignments[i % 2]
+            exercise = Exercise.objects.create(learning_unit=assignment.learning_unit, title=f'E{i}', description='', order=i, exercise_type='speaking')
+            Exercise_Result.objects.create(assignment=assignment, exercise=exercise, completed_at=start + timedelta(days=i))
+        Exercise_Result.objects.create(assignment=self.assignments[0], exercise=exercise)  # not completed
+        self.url = f'/api/result/{self.child.id}/all/'
+
+    def test_pages_newest_first_with_constant_queries(self):
+        seen = []
+        url = self.url + '?page_size=8&expand=exercise,learning_unit'
+        while url:
+            # child, page of results with exercise and learning unit joined
+            with self.assertNumQueries(2):
+                r = self.client.get(url)
+            self.assertEqual(r.status_code, status.HTTP_200_OK)
+            seen.extend(r.data['results'])
+            url = r.data['next']
+        self.assertEqual(len(seen), 30)
+        completed = [row['completed_at'] for row in seen]
+        self.assertEqual(completed, sorted(completed, reverse=True))
+        self.assertIn('title', seen[0]['exercise'])
+        self.assertIn('title', seen[0]['learning_unit'])
+
+    def test_filters(self):
+        r = self.client.get(self.url, {'learning_unit': str(self.units[0].id)})
+        self.assertEqual(len(r.data['results']), 15)
+        r = self.client.get(self.url, {'participation_type': 'recommended', 'page_size': 100})
+        self.assertEqual({row['participation_type'] for row in r.data['results']}, {'recommended'})
+        self.assertEqual(len(r.data['results']), 15)
+        today = timezone.localdate()
+        r = self.client.get(self.url, {'from': (today - timedelta(days=5)).isoformat(), 'to': today.isoformat()})
+        self.assertEqual(len(r.data['results']), 5)
+
+    def test_invalid_filters(self):
+        for params in ({'learning_unit': 'nope'}, {'participation_type': 'optional'}, {'from': 'last week'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f'/api/result/{uuid.uuid4()}/all/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BulkResultsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(id=uuid.uuid4(), email='u@test.com', user_type='parent', subscription_type='free_trial')
+        self.child = Profile.objects.create(profile_type='child', name='Child')
+        self.lu = Learning_Unit.objects.create(title='LU', description='', category='articulation')
+        self.exercises = [Exercise.objects.create(learning_unit=self.lu, title=f'E{i}', description='', order=i, exercise_type='speaking')
+                          for i in range(2)]
+        self.questions = [[Question.objects.create(exercise=e, question_type='speaking', order=i, question_data={}) for i in range(3)]
+                          for e in self.exercises]
+        self.assignment = Assignment.objects.create(learning_unit=self.lu, participation_type='required', assigned_to=self.child, assigned_by=self.user)
+        self.url = f'/api/result/{self.child.id}/bulk/'
+
+    def payload(self, exercise_index, correct=1, complete=False):
+        return {'exercise_id': str(self.exercises[exercise_index].id), 'complete': complete, 'questions': [
+            {'question_id': str(q.id), 'num_correct': correct, 'num_incorrect': 1, 'time_spent': 10}
+            for q in self.questions[exercise_index]
+        ]}
+
+    def test_bulk_upsert_recomputes_aggregates(self):
+        r = self.client.post(self.url, self.payload(0), format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        # resubmitting replaces the question results instead of adding to them
+        r = self.client.post(self.url, self.payload(0, correct=3), format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(Question_Result.objects.count(), 3)
+        er = Exercise_Result.objects.get(exercise=self.exercises[0])
+        self.assertEqual((er.num_correct, er.num_incorrect, er.time_spent), (9, 3, 30))
+        self.assertAlmostEqual(er.accuracy, 75.0)
+        self.assertIsNone(er.completed_at)
+        self.assertEqual(r.data[0]['exercise'], self.exercises[0].id)
+
+    def test_completing_every_exercise_completes_assignment(self):
+        payload = {'exercises': [self.payload(0, complete=True), self.payload(1, complete=True)]}
+        with self.assertNumQueries(NUM_QUERIES_BULK_POST):
+            r = self.client.post(self.url, payload, format='json')
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(r.data), 2)
+        self.assertEqual(Exercise_Result.objects.filter(completed_at__isnull=False).count(), 2)
+        self.assertEqual(Question_Result.objects.count(), 6)
+        self.assignment.refresh_from_db()
+        self.assertIsNotNone(self.assignment.completed_at)
+        self.assertEqual((self.assignment.completed_exercises, self.assignment.total_time_spent), (2, 60))
+
+    def test_single_and_bulk_submissions_follow_one_rule(self):
+        def single(question, correct, incorrect, time_spent):
+            r = self.client.post(f'/api/result/{self.child.id}/question/{question.id}/',
+                                 {'num_correct': correct, 'num_incorrect': incorrect, 'time_spent': time_spent}, format='json')
+            self.assertIn(r.status_code, (status.HTTP_200_OK, status.HTTP_201_CREATED))
+
+        first, second, third = self.questions[0]
+        single(first, 2, 1, 10)
+        # bulk answers the other two questions; the single submission still counts
+        payload = self.payload(0)
+        payload['questions'] = payload['questions'][1:]
+        self.client.post(self.url, payload, format='json')
+        single(first, 0, 4, 20)       # replaces the first answer
+        single(second, 5, 0, 10)      # replaces the bulk answer
+        payload['questions'] = payload['questions'][1:]
+        self.client.post(self.url, payload, format='json')  # resubmits the third answer unchanged
+
+        er = Exercise_Result.objects.get(exercise=self.exercises[0])
+        totals = Question_Result.objects.filter(exercise_result=er).aggregate(
+            num_correct=Sum('num_correct'), num_incorrect=Sum('num_incorrect'), time_spent=Sum('time_spent'))
+        self.assertEqual((er.num_correct, er.num_incorrect, er.time_spent), (6, 5, 40))
+        self.assertEqual((er.num_correct, er.num_incorrect, er.time_spent),
+                         (totals['num_correct'], totals['num_incorrect'], totals['time_spent']))
+        self.assignment.refresh_from_db()
+        self.assertEqual((self.assignment.total_correct, self.assignment.total_incorrect, self.assignment.total_time_spent), (6, 5, 40))
+        self.assertFalse(stale_counters(Assignment.objects.all()).exists())
+
+    def test_partial_completion_leaves_assignment_open(self):
+        self.client.post(self.url, self.payload(0, complete=True), format='json')
+        self.assignment.refresh_from_db()
+        self.assertIsNone(self.assignment.completed_at)
+
+    def test_invalid_payloads(self):
+        self.assertEqual(self.client.post(self.url, {'exercises': []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        bad = self.payload(0)
+        bad['questions'][0]['num_correct'] = 'many'
+        self.assertEqual(self.client.post(self.url, bad, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        mixed = self.payload(0)
+        mixed['questions'].append({'question_id': str(self.questions[1][0].id), 'num_correct': 1, 'num_incorrect': 0, 'time_spent': 1})
+        self.assertEqual(self.client.post(self.url, mixed, format='json').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Question_Result.objects.exists())
@@ -7,6 +7,7 @@ from .views.resultViews import *
 from .views.azureAIViews import *
 from .views.chatViews import *
 from .views.gamifyViews import *
+from .views.dashboardViews import *
 
 urlpatterns = [
     # User Routes
@@ -46,13 +47,20 @@ urlpatterns = [
 
     # Child Results Routes
     path('result/<str:child_id>/all/', get_exercise_results, name='get_exercise_results'), # GET
+    path('result/<str:child_id>/learning_unit_overall/', results_for_learning_unit_overall, name='results_for_learning_unit_overall_all'), # GET
     path('result/<str:child_id>/learning_unit_overall/<str:participation_type>/', results_for_learning_unit_overall, name='results_for_learning_unit_overall'), # GET
     path('result/<str:child_id>/exercise/<str:exercise_id>/', results_for_exercise, name='results_for_exercise'), # POST, GET
     path('result/<str:child_id>/question/<str:question_id>/', results_for_question, name='results_for_question'), # POST, GET
+    path('result/<str:child_id>/bulk/', bulk_results, name='bulk_results'), # POST
+
+    # Dashboard Routes
+    path('dashboard/<str:user_id>/caseload/', therapist_caseload, name='therapist_caseload'), # GET
 
     # Azure AI Routes
     path("AI/assess_speech/", assess_speech, name="assess_speech"), # POST
+    path("AI/assess_speech/jobs/<str:job_id>/", assess_speech_result, name="assess_speech_result"), # GET
     path('AI/text_to_speech/', text_to_speech), # POST
+    path('AI/metrics/', ai_metrics, name='ai_metrics'), # GET
 
     # Chat Routes
     path('chat/<str:profile_id>/rooms/', get_chat_rooms, name='get_chat_rooms'), # GET
@@ -88,8 +88,9 @@ def assigned_by_assignments(request, user_id):
     except User.DoesNotExist:
         return Response({'error': 'User not found'}, status=404)
 
-    assigned_learning_units = Assignment.objects.filter(assigned_by=user)
-    serializer = AssignmentSerializer(assigned_learning_units, many=True)
+    options = expansion_options(request)
+    assigned_learning_units = AssignmentSerializer.select_expanded(Assignment.objects.filter(assigned_by=user), options['expand'])
+    serializer = AssignmentSerializer(assigned_learning_units, many=True, **options)
     return Response(serializer.data, status=200)
 
 
@@ -99,8 +100,9 @@ def assigned_to_assignments(request, child_id):
     if not child_profile:
         return Response({'error': 'Child profile not found'}, status=404)
 
-    assignments = Assignment.objects.filter(assigned_to=child_profile)
-    serializer = AssignmentSerializer(assignments, many=True)
+    options = expansion_options(request)
+    assignments = AssignmentSerializer.select_expanded(Assignment.objects.filter(assigned_to=child_profile), options['expand'])
+    serializer = AssignmentSerializer(assignments, many=True, **options)
     return Response(serializer.data)
 
 
@@ -3,27 +3,106 @@ from rest_framework.response import Response
 from ..models import *
 from ..serializers import *
 import os
-import tempfile
-import json
-from pydub import AudioSegment
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 import azure.cognitiveservices.speech as speechsdk
-from openai import AzureOpenAI
-from django.http import HttpResponse
-import re
-from pgvector.django import CosineDistance
-
-AZURE_SPEECH_KEY = os.getenv("AZURE_SPEECH_KEY")
-AZURE_SPEECH_REGION = os.getenv("AZURE_SPEECH_REGION", "australiaeast")
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
-AZURE_OPENAI_EMB_ENDPOINT = os.getenv("AZURE_OPENAI_EMB_ENDPOINT")
+from django.http import HttpResponse, StreamingHttpResponse
+import time
+import hashlib
+from django.core.exceptions import ValidationError
+from ..ai import clients, correctness, embeddings, feedback, jobs, retrieval, tts
+from ..ai.audio import MAX_UPLOAD_BYTES, AudioDecodeError, decode_to_pcm, preprocess_pcm, preprocess_stats
+from ..ai.cache import SharedCache, SingleFlight
+from ..ai.clients import AZURE_SPEECH_KEY, AZURE_SPEECH_REGION, AZURE_OPENAI_ENDPOINT
+
+# "single_pass" gets the transcript and pronunciation scores from one recognition,
+# "two_pass" is the original recognise-then-assess flow (kept to compare latency under load).
+# Can be overridden per request with the "assessmentMode" form field.
+ASSESSMENT_MODES = ('single_pass', 'two_pass')
+AZURE_ASSESSMENT_MODE = os.getenv("AZURE_ASSESSMENT_MODE", "single_pass")
+# "unscripted" assesses whatever the child said, "expected_answer" scores the
+# utterance against the question's expected answer (falls back to unscripted).
+AZURE_ASSESSMENT_REFERENCE = os.getenv("AZURE_ASSESSMENT_REFERENCE", "unscripted")
+# With "async" set, assess_speech queues the work and answers 202 with a job ID; the result is
+# fetched from assess_speech/jobs/<id>/. A long-poll holds a worker thread, so ?wait= is capped
+# and only honoured by threaded servers (gunicorn gthread, runserver); sync workers answer at once.
+SPEECH_JOB_MAX_WAIT_SECONDS = float(os.getenv("SPEECH_JOB_MAX_WAIT_SECONDS", 5))
+ASYNC_TRUE = ('1', 'true', 'True')
+# Retried uploads (same audio and question within SPEECH_DEDUPE_TTL seconds) get the first
+# attempt's response, or wait for it while it is still running. 0 disables this. Finished
+# responses and async job IDs are kept in the shared job cache, so a retry that reaches
+# another web process is deduplicated too; waiting for a running attempt is per process.
+SPEECH_DEDUPE_TTL = int(os.getenv("SPEECH_DEDUPE_TTL", 120))
+# A retry stops waiting for the first attempt after this many seconds and assesses the audio itself
+SPEECH_DEDUPE_WAIT_SECONDS = float(os.getenv("SPEECH_DEDUPE_WAIT_SECONDS", 20))
+assessment_results = SingleFlight(should_store=lambda result: result[1] == 200, wait_timeout=SPEECH_DEDUPE_WAIT_SECONDS,
+                                  results=SharedCache(jobs.SPEECH_JOB_CACHE, 'speech-dedupe', SPEECH_DEDUPE_TTL))
+assessment_job_ids = SharedCache(jobs.SPEECH_JOB_CACHE, 'speech-dedupe-job', SPEECH_DEDUPE_TTL)
 
 # Log Azure credentials status at module load
 print(f"Azure Speech Key configured: {'Yes' if AZURE_SPEECH_KEY else 'No'}")
 print(f"Azure Speech Region: {AZURE_SPEECH_REGION}")
 print(f"Azure OpenAI Endpoint configured: {'Yes' if AZURE_OPENAI_ENDPOINT else 'No'}")
+print(f"Speech assessment mode: {AZURE_ASSESSMENT_MODE} (reference: {AZURE_ASSESSMENT_REFERENCE})")
+if clients.AI_SPEECH_BACKEND == 'standin':
+    print("Speech backend: local stand-in (no Azure Speech calls)")
+
+
+def get_reference_text(question_id):
+    """Expected answer used as the pronunciation reference, or "" for unscripted assessment."""
+    if AZURE_ASSESSMENT_REFERENCE != 'expected_answer' or not question_id:
+        return ""
+    try:
+        answer = Question_Embedding.objects.filter(
+            question_id=question_id
+        ).order_by('created_at').values_list('expected_answer_text', flat=True).first()
+    except (ValidationError, ValueError):
+        return ""
+    return answer or ""
+
+
+def audio_fingerprint(audio_chunks, question_id, question_text, assessment_mode):
+    digest = hashlib.sha256(f"{question_id}\0{question_text}\0{assessment_mode}\0".encode('utf-8'))
+    for chunk in audio_chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pronunciation_config(reference_text, enable_miscue):
+    return speechsdk.PronunciationAssessmentConfig(
+        reference_text=reference_text,
+        grading_system=speechsdk.PronunciationAssessmentGradingSystem.HundredMark,
+        granularity=speechsdk.PronunciationAssessmentGranularity.Phoneme,
+        enable_miscue=enable_miscue
+    )
+
+
+def recognize_single_pass(speech_config, pcm, reference_text):
+    """
+    One recognition with pronunciation assessment applied, so the transcript and the
+    scores come back from the same Azure round trip. An empty reference text runs
+    unscripted assessment (miscue detection needs a reference, so it is only enabled then).
+    """
+    recognizer = clients.speech_recognizer(
+        speech_config, pcm, pronunciation_config(reference_text, enable_miscue=bool(reference_text))
+    )
+    with clients.timed('speech_recognition'):
+        result = recognizer.recognize_once()
+    return result, result
+
+
+def recognize_two_pass(speech_config, pcm):
+    """Original flow: transcribe first, then assess again using the transcript as the reference."""
+    recognizer = clients.speech_recognizer(speech_config, pcm)
+    with clients.timed('speech_recognition'):
+        result = recognizer.recognize_once()
+    if result.reason != speechsdk.ResultReason.RecognizedSpeech:
+        return result, None
+
+    recognizer = clients.speech_recognizer(speech_config, pcm, pronunciation_config(result.text, enable_miscue=True))
+    with clients.timed('speech_recognition'):
+        return result, recognizer.recognize_once()
+
 
 @api_view(['POST'])
 def assess_speech(request):
@@ -34,196 +113,197 @@ def assess_speech(request):
     audio_file = request.FILES.get('file')
     question_id = request.data.get('questionId')
     question_text = request.data.get('questionText')
+    assessment_mode = request.data.get('assessmentMode') or AZURE_ASSESSMENT_MODE
 
     if not audio_file:
         print("ERROR: No audio file found in request")
         return Response({'error': 'audio file is required'}, status=400)
 
-    temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=".m4a")
-    for chunk in audio_file.chunks():
-        temp_input.write(chunk)
-    temp_input.close()
-
-    temp_output_path = tempfile.NamedTemporaryFile(delete=False, suffix=".wav").name
-    try:
-        sound = AudioSegment.from_file(temp_input.name)
-        sound.export(temp_output_path, format="wav")
+    if assessment_mode not in ASSESSMENT_MODES:
+        return Response({'error': f'assessmentMode must be one of {", ".join(ASSESSMENT_MODES)}'}, status=400)
+
+    fingerprint = None
+    if SPEECH_DEDUPE_TTL > 0 and audio_file.size <= MAX_UPLOAD_BYTES:
+        fingerprint = audio_fingerprint(audio_file.chunks(), question_id, question_text, assessment_mode)
+
+    if request.data.get('async') in ASYNC_TRUE or request.query_params.get('async') in ASYNC_TRUE:
+        if audio_file.size > MAX_UPLOAD_BYTES:
+            return Response({'error': f'Audio upload exceeds {MAX_UPLOAD_BYTES} bytes'}, status=400)
+        # A retry of a queued, running or recently finished upload gets that job back
+        job = jobs.speech_jobs.get(assessment_job_ids.get(fingerprint)) if fingerprint else None
+        if job is None:
+            # The upload is read now (it is gone once this request ends); decoding happens in the job
+            audio_bytes = b''.join(audio_file.chunks())
+            try:
+                job = jobs.speech_jobs.submit(run_assessment, [audio_bytes], len(audio_bytes),
+                                              question_id, question_text, assessment_mode).snapshot()
+            except jobs.QueueFull as e:
+                response = Response({'error': 'Speech assessment is busy, please retry', 'retry_after': e.retry_after}, status=503)
+                response['Retry-After'] = str(e.retry_after)
+                return response
+            if fingerprint:
+                assessment_job_ids.set(fingerprint, job['job_id'])
+        return Response({**jobs.describe(job), 'result_url': f"{request.path.rstrip('/')}/jobs/{job['job_id']}/"}, status=202)
+
+    def assess():
+        return run_assessment(audio_file.chunks(), audio_file.size, question_id, question_text, assessment_mode)
+
+    if fingerprint is None:
+        payload, status_code = assess()
+        shared = None
+    else:
+        (payload, status_code), shared = assessment_results.do(fingerprint, assess)
+    response = Response(payload, status=status_code)
+    # "stored": answered from an earlier identical upload, "in_flight": waited for one still running
+    response['X-Assessment-Dedupe'] = shared or 'miss'
+    return response
 
-        # Azure Speech config
-        speech_config = speechsdk.SpeechConfig(
-            subscription=AZURE_SPEECH_KEY,
-            region=AZURE_SPEECH_REGION
-        )
-        audio_input = speechsdk.AudioConfig(filename=temp_output_path)
-        recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_input)
 
-        result = recognizer.recognize_once()
-        if result.reason != speechsdk.ResultReason.RecognizedSpeech:
-            return Response({'error': 'Speech recognition failed'}, status=400)
-
-        # Pronunciation assessment
-        pron_config = speechsdk.PronunciationAssessmentConfig(
-            reference_text=result.text,
-            grading_system=speechsdk.PronunciationAssessmentGradingSystem.HundredMark,
-            granularity=speechsdk.PronunciationAssessmentGranularity.Phoneme,
-            enable_miscue=True
-        )
-        audio_input = speechsdk.AudioConfig(filename=temp_output_path)
-        recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_input)
-        pron_config.apply_to(recognizer)
-        pron_result_raw = recognizer.recognize_once()
-
-        pron_result = speechsdk.PronunciationAssessmentResult(pron_result_raw)
-        pron_data = {
-            "recognized_text": pron_result_raw.text,
-            "accuracy_score": pron_result.accuracy_score,
-            "fluency_score": pron_result.fluency_score,
-            "completeness_score": pron_result.completeness_score,
-            "pronunciation_score": pron_result.pronunciation_score,
-        }
-
-        # Skip embedding comparison for now - just use speech recognition and pronunciation
-        # Simplified feedback without correctness checking
-
-        # GPT Feedback
-        if not AZURE_OPENAI_ENDPOINT:
-            return Response({'error': 'Azure OpenAI endpoint not configured'}, status=500)
-
-        gpt_client = AzureOpenAI(
-            api_version="2024-12-01-preview",
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-        )
-
-        system_prompt = """
-        You are an encouraging, friendly speech therapist helping children practice pronunciation and speaking skills.
-        Provide constructive feedback on their pronunciation and how well they answered the question.
-        If the child's response deviates from the question, gently redirect them.
-        Follow professional speech pathologist guidelines when interacting with the child.
-        """
-
-        user_prompt = f"""
-        Question asked: "{question_text}"
-        Child's speech: "{result.text}"
-
-        Pronunciation Assessment Results: {json.dumps(pron_data, indent=2)}
-        
-        Generate exactly three sentences giving feedback:
-        - First sentence: encouraging and positive about their effort
-        - Second sentence: constructive feedback on pronunciation or clarity
-        - Third sentence: fun motivational line
-        DO NOT include any headings, labels, numbers, bullets, markdown symbols, or emojis.
-        Output ONLY the sentences themselves, nothing else.
-        """
-
-        response_gpt = gpt_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=300,
-            temperature=0.8,
-        )
-
-        feedback_text = response_gpt.choices[0].message.content or ""
-
-        labels_to_remove = [
-            r'Encouraging Summary\s*:\s*',
-            r'Area to Improve\s*:\s*',
-            r'Motivational Line\s*:\s*'
-        ]
-
-        for label in labels_to_remove:
-            feedback_text = re.sub(label, '', feedback_text, flags=re.IGNORECASE)
-
-        # clean up gpt feedback
-        feedback_text = re.sub(r'^\s*(?:\d+[\.\)]\s*|[-*•]\s*|[#*]+)\s*', '', feedback_text, flags=re.MULTILINE)
-        feedback_text = re.sub(r'[^\w\s.,!?\'"]+', '', feedback_text)
-        feedback_text = re.sub(r'\s+', ' ', feedback_text).strip()
-
-        return Response({
-            "transcript": result.text,
-            "pronunciation": pron_data,
-            "feedback": feedback_text,
-        }, status=200)
-
-    finally:
-        os.remove(temp_input.name)
-        os.remove(temp_output_path)
+def run_assessment(audio_chunks, size, question_id, question_text, assessment_mode):
+    """
+    Decode, recognise, check and give feedback on one speech attempt.
+    Returns (payload, http_status); used directly by assess_speech and by async jobs.
+    """
+    decode_start = time.perf_counter()
+    try:
+        pcm = decode_to_pcm(audio_chunks, size=size)
+    except AudioDecodeError as e:
+        print(f"ERROR: {e}")
+        return {'error': str(e)}, 400
+    decode_ms = int((time.perf_counter() - decode_start) * 1000)
+
+    preprocess_start = time.perf_counter()
+    pcm, audio_info = preprocess_pcm(pcm)
+    preprocess_ms = int((time.perf_counter() - preprocess_start) * 1000)
+
+    speech_config = clients.speech_config()
+    reference_text = get_reference_text(question_id) if assessment_mode == 'single_pass' else ""
+
+    recognition_start = time.perf_counter()
+    if assessment_mode == 'single_pass':
+        result, pron_result_raw = recognize_single_pass(speech_config, pcm, reference_text)
+    else:
+        result, pron_result_raw = recognize_two_pass(speech_config, pcm)
+    recognition_ms = int((time.perf_counter() - recognition_start) * 1000)
+    print(f"assess_speech mode={assessment_mode} audio_ms={audio_info['input_ms']} sent_ms={audio_info['output_ms']} decode_ms={decode_ms} recognition_ms={recognition_ms}")
+
+    if result.reason != speechsdk.ResultReason.RecognizedSpeech:
+        return {'error': 'Speech recognition failed'}, 400
+
+    pron_result = speechsdk.PronunciationAssessmentResult(pron_result_raw)
+    pron_data = {
+        "recognized_text": pron_result_raw.text,
+        "accuracy_score": pron_result.accuracy_score,
+        "fluency_score": pron_result.fluency_score,
+        "completeness_score": pron_result.completeness_score,
+        "pronunciation_score": pron_result.pronunciation_score,
+    }
+
+    correctness_start = time.perf_counter()
+    answer_check = correctness.check_answer(question_id, result.text)
+    correctness_ms = int((time.perf_counter() - correctness_start) * 1000)
+
+    retrieval_start = time.perf_counter()
+    guidance = retrieval.retrieve_guidance(question_id, question_text)
+    retrieval_ms = int((time.perf_counter() - retrieval_start) * 1000)
+
+    feedback_start = time.perf_counter()
+    feedback_text, feedback_source = feedback.generate_feedback(
+        question_id, question_text, result.text, pron_data, answer_check, guidance
+    )
+    feedback_ms = int((time.perf_counter() - feedback_start) * 1000)
+
+    return {
+        "transcript": result.text,
+        "pronunciation": pron_data,
+        "correctness": answer_check,
+        "feedback": feedback_text,
+        "feedback_source": feedback_source,
+        "assessment_mode": assessment_mode,
+        "audio": audio_info,
+        "timings": {"decode_ms": decode_ms, "preprocess_ms": preprocess_ms, "recognition_ms": recognition_ms,
+                    "correctness_ms": correctness_ms, "retrieval_ms": retrieval_ms,
+                    "feedback_ms": feedback_ms},
+    }, 200
+
+@api_view(['GET'])
+def assess_speech_result(request, job_id):
+    """
+    Result of an async speech assessment. ?wait=<seconds> long-polls for up to
+    SPEECH_JOB_MAX_WAIT_SECONDS on threaded servers. Returns 202 while the job is queued or
+    running, the assessment (with its own status code) once finished, and 404 for unknown,
+    expired or lost jobs (resubmit the audio).
+    """
+    try:
+        wait = min(max(float(request.query_params.get('wait', 0)), 0), SPEECH_JOB_MAX_WAIT_SECONDS)
+    except ValueError:
+        return Response({'error': 'wait must be a number of seconds'}, status=400)
+    if not request.META.get('wsgi.multithread'):
+        # A sync worker serves one request at a time; holding it would stall every other client
+        wait = 0
+
+    job = jobs.speech_jobs.wait(job_id, wait)
+    if job is None:
+        return Response({'error': 'Job not found, expired or lost, please resubmit'}, status=404)
+    if not jobs.is_finished(job):
+        return Response(jobs.describe(job), status=202)
+    return Response({**job['payload'], 'job': jobs.describe(job)}, status=job['status_code'])
 
 @api_view(['POST'])
 def text_to_speech(request):
     """
     Convert text to speech using Azure Speech with SSML for expressive style.
-    Request body: {"text": "Great job!", "voice": "en-AU-NatashaNeural", "style": "cheerful"}
+    Request body: {"text": "Great job!", "voice": "en-AU-NatashaNeural", "style": "cheerful", "stream": false}
+    Audio is served from the TTS cache when the same text/voice/style was synthesised before.
+    With "stream": true (or ?stream=1) a cache miss is sent back in chunks as Azure produces them.
     """
     text = request.data.get("text")
-    voice = request.data.get("voice", "en-AU-NatashaNeural")
-    style = request.data.get("style", "cheerful")
+    voice = request.data.get("voice", tts.DEFAULT_VOICE)
+    style = request.data.get("style", tts.DEFAULT_STYLE)
+    stream = str(request.data.get("stream", request.query_params.get("stream", ""))).lower() in ("1", "true")
 
     if not text:
         return HttpResponse("Missing 'text' field", status=400)
 
-    # Check if Azure credentials are configured
-    if not AZURE_SPEECH_KEY:
-        print("ERROR: AZURE_SPEECH_KEY environment variable is not set")
-        return HttpResponse("Azure Speech credentials not configured", status=500)
-
-    # Azure Speech configuration
-    speech_config = speechsdk.SpeechConfig(
-        subscription=AZURE_SPEECH_KEY,
-        region=AZURE_SPEECH_REGION
-    )
-    speech_config.set_speech_synthesis_output_format(
-        speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3
-    )
+    if stream:
+        audio_data = tts.tts_cache.get(tts.cache_key(text, voice, style))
+        if audio_data is not None:
+            return audio_response(audio_data, cache_hit=True)
+        try:
+            chunks = tts.stream_synthesis(text, voice, style)
+        except tts.SynthesisError as e:
+            print(f"ERROR: {e}")
+            return HttpResponse(str(e), status=500)
+        return audio_response(chunks, cache_hit=False, streaming=True)
 
-    #　SSML — Expressive voice style
-    ssml_text = f"""
-    <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis"
-           xmlns:mstts="https://www.w3.org/2001/mstts"
-           xml:lang="en-AU">
-        <voice name="{voice}">
-            <prosody volume="150%">
-                <mstts:express-as style="{style}" styledegree="1.2">
-                    {text}
-                </mstts:express-as>
-            </prosody>
-        </voice>
-    </speak>
-    """
-
-    # Generate audio from SSML
-    temp_output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-    audio_output = speechsdk.audio.AudioOutputConfig(filename=temp_output.name)
-    synthesizer = speechsdk.SpeechSynthesizer(
-        speech_config=speech_config, audio_config=audio_output
-    )
-
-    result = synthesizer.speak_ssml_async(ssml_text).get()
-
-    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-        if result.reason == speechsdk.ResultReason.Canceled:
-            cancellation = result.cancellation_details  # type: ignore[attr-defined]
-            if cancellation:
-                error_msg = f"Speech synthesis canceled. Reason: {cancellation.reason}"  # type: ignore[union-attr]
-                if cancellation.reason == speechsdk.CancellationReason.Error:  # type: ignore[union-attr]
-                    error_msg += f", Error details: {cancellation.error_details}"  # type: ignore[union-attr]
-                print(f"ERROR: {error_msg}")
-                return HttpResponse(error_msg, status=500)
-            else:
-                return HttpResponse("Speech synthesis canceled", status=500)
-        else:
-            error_details = result.cancellation_details if hasattr(result, 'cancellation_details') else 'Unknown error'  # type: ignore[attr-defined]
-            print(f"Speech synthesis failed. Reason: {result.reason}, Details: {error_details}")
-            return HttpResponse(f"Speech synthesis failed: {error_details}", status=500)
-
-    with open(temp_output.name, "rb") as f:
-        audio_data = f.read()
-
-    os.remove(temp_output.name)
-
-    response = HttpResponse(audio_data, content_type="audio/mpeg")
+    try:
+        audio_data, cache_hit = tts.get_or_synthesize(text, voice, style)
+    except tts.SynthesisError as e:
+        print(f"ERROR: {e}")
+        return HttpResponse(str(e), status=500)
+    return audio_response(audio_data, cache_hit)
+
+
+def audio_response(audio, cache_hit, streaming=False):
+    if streaming:
+        response = StreamingHttpResponse(audio, content_type="audio/mpeg")
+    else:
+        response = HttpResponse(audio, content_type="audio/mpeg")
     response["Content-Disposition"] = "inline; filename=tts.mp3"
+    response["X-TTS-Cache"] = "hit" if cache_hit else "miss"
     return response
+
+
+@api_view(['GET'])
+def ai_metrics(request):
+    """Counters for the AI endpoints' caches and shared clients, for checking hit rates and latency in production."""
+    return Response({
+        'tts_cache': tts.tts_cache.stats(),
+        'clients': clients.stats(),
+        'feedback': feedback.stats(),
+        'embedding_cache': embeddings.stats(),
+        'audio_preprocessing': preprocess_stats(),
+        'speech_jobs': jobs.speech_jobs.stats(),
+        'speech_dedupe': assessment_results.stats(),
+        'retrieval': retrieval.stats(),
+    }, status=200)
@@ -2,3 +2,87 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from ..models import *
 from ..serializers import *
+from ..pagination import CaseloadPagination
+from ..progress import accuracy_expression, streaks, subquery_value
+from django.db.models import F, OuterRef, Subquery
+
+
+# ?sort= value -> annotation (prefix with "-" for descending)
+CASELOAD_SORTS = {
+    'name': 'name',
+    'assignments': 'total_assignments',
+    'completion': 'completion',
+    'accuracy': 'accuracy',
+    'time_spent': 'total_time_spent',
+    'last_activity': 'last_activity',
+}
+
+
+def caseload_annotations():
+    """
+    Annotations for a child Profile queryset with their assignment counts and progress. They
+    read the assignments' progress counters, so each child costs a few index lookups however
+    long their history is, and the whole page is one query.
+    """
+    assignments = Assignment.objects.filter(assigned_to=OuterRef('pk'))
+    unit_assignments = Assignment.objects.filter(assigned_to=OuterRef(OuterRef('pk')))
+    return {
+        'total_assignments': subquery_value(assignments, 'COUNT'),
+        'completed_assignments': subquery_value(assignments.filter(completed_at__isnull=False), 'COUNT'),
+        'total_exercises': subquery_value(
+            Exercise.objects.filter(learning_unit_id__in=Subquery(unit_assignments.values('learning_unit_id'))), 'COUNT'
+        ),
+        'completed_exercises': subquery_value(assignments, 'SUM', 'completed_exercises'),
+        'total_time_spent': subquery_value(assignments, 'SUM', 'total_time_spent'),
+        'total_correct': subquery_value(assignments, 'SUM', 'total_correct'),
+        'total_answers': subquery_value(assignments.annotate(answers=F('total_correct') + F('total_incorrect')), 'SUM', 'answers'),
+        'last_activity': Subquery(
+            Exercise_Result.objects.filter(assignment__assigned_to=OuterRef('pk'), completed_at__isnull=False)
+            .order_by('-completed_at').values('completed_at')[:1]
+        ),
+    }
+
+
+@api_view(['GET'])
+def therapist_caseload(request, user_id):
+    """
+    Progress of every child linked to a therapist through User_Profile, paginated and sorted by
+    ?sort= (name, assignments, completion, accuracy, time_spent or last_activity, "-" for
+    descending). The same four queries however many children there are: the therapist, the
+    count, the page, and the page's streaks.
+    """
+    therapist = User.objects.filter(id=user_id, user_type='therapist').first()
+    if not therapist:
+        return Response({'error': 'Therapist not found'}, status=404)
+
+    sort = request.query_params.get('sort', 'name')
+    field = CASELOAD_SORTS.get(sort.lstrip('-'))
+    if field is None:
+        return Response({'error': f'sort must be one of {", ".join(CASELOAD_SORTS)}, optionally prefixed with "-"'}, status=400)
+    order = F(field).desc(nulls_last=True) if sort.startswith('-') else F(field).asc(nulls_last=True)
+
+    children = Profile.objects.filter(
+        profile_type='child',
+        id__in=Subquery(User_Profile.objects.filter(user=therapist).values('profile_id')),
+    ).annotate(**caseload_annotations()).annotate(
+        completion=accuracy_expression(F('completed_exercises'), F('total_exercises')),
+        accuracy=accuracy_expression(F('total_correct'), F('total_answers')),
+    ).order_by(order, 'id')
+
+    paginator = CaseloadPagination()
+    page = paginator.paginate_queryset(children, request)
+    child_streaks = streaks([child.id for child in page])
+    return paginator.get_paginated_response([{
+        'id': child.id,
+        'name': child.name,
+        'profile_picture': child.profile_picture,
+        'total_assignments': child.total_assignments,
+        'completed_assignments': child.completed_assignments,
+        'total_exercises': child.total_exercises,
+        'completed_exercises': child.completed_exercises,
+        'completion': round(child.completion, 1),
+        'accuracy': round(child.accuracy, 1),
+        'total_time_spent': child.total_time_spent,
+        'streak': child_streaks[child.id],
+        'last_activity': child.last_activity,
+    } for child in page])
@@ -3,8 +3,8 @@ from rest_framework.response import Response
 from django.views.decorators.csrf import csrf_exempt
 from ..models import *
 from ..serializers import *
-from datetime import datetime
 from .chatViews import create_chats
+from ..progress import streaks
 import requests
 
 SUPABASE_URL = 'https://cvchwjconynpzhktnuxn.supabase.co'
@@ -163,25 +163,9 @@ def get_profile_by_email(request, email):
 
 
 def calc_streak(profile):
-	completed_units = Exercise_Result.objects.filter(
-		assignment__assigned_to=profile,
-		completed_at__isnull=False
-	).order_by('-completed_at')
-	if not completed_units.exists():
-		profile.streak = 0
-		profile.save()
-		return
-	now = datetime.now()
-	streak = 0
-	for result in completed_units:
-		completion_date = result.completed_at
-		delta_days = (now.date() - completion_date.date()).days
-		if delta_days == streak + 1:
-			streak += 1
-		else:
-			break
-	profile.streak = streak
-	profile.save()
+	"""Store the child's current streak, as shown on the therapist caseload (progress.streaks)."""
+	profile.streak = streaks([profile.id])[profile.id]
+	profile.save(update_fields=['streak'])
 
 
 @api_view(['GET'])
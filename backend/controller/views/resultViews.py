@@ -2,60 +2,128 @@ from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from ..models import *
 from ..serializers import *
+from ..pagination import ExerciseResultCursorPagination
+from ..progress import accuracy_expression, add_to_counters, subquery_value
 from django.utils import timezone
-from django.db.models import Sum
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from django.db import transaction
+import uuid
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 
 
-@api_view(['GET'])
-def results_for_learning_unit_overall(request, child_id, participation_type):
-    child_profile = Profile.objects.filter(id=child_id, profile_type='child').first()
-    if not child_profile:
-        return Response({'error': 'Child profile not found'}, status=404)
+PARTICIPATION_TYPES = ('total', 'required', 'recommended')
 
-    if participation_type not in ['total', 'required', 'recommended']:
-        return Response({'error': 'participation_type must be "total", "required", or "recommended"'}, status=400)
 
-    if participation_type == 'total':
-        assignments = Assignment.objects.filter(
-            assigned_to=child_profile
-        )
-    else:
-        assignments = Assignment.objects.filter(
-            assigned_to=child_profile,
-            participation_type=participation_type
-        )
+def progress_annotations(participation_type):
+    """
+    Annotations for a child Profile queryset with the child's progress over their assignments
+    ("total" = all of them): exercises in the assigned units, completed exercises and time
+    spent. Completion and time come from the assignments' progress counters, so the cost
+    doesn't grow with result history. Each is a correlated subquery, so any number of them
+    costs one query.
+    """
+    filters = {} if participation_type == 'total' else {'participation_type': participation_type}
+    assignments = Assignment.objects.filter(assigned_to=OuterRef('pk'), **filters)
+    # Nested one level deeper, inside the Exercise subquery
+    unit_assignments = Assignment.objects.filter(assigned_to=OuterRef(OuterRef('pk')), **filters)
+    return {
+        f'{participation_type}_total_exercises': subquery_value(
+            Exercise.objects.filter(learning_unit_id__in=Subquery(unit_assignments.values('learning_unit_id'))), 'COUNT'
+        ),
+        f'{participation_type}_completed_exercises': subquery_value(assignments, 'SUM', 'completed_exercises'),
+        f'{participation_type}_total_time_spent': subquery_value(assignments, 'SUM', 'total_time_spent'),
+    }
+
+
+def _progress(child_profile, participation_type):
+    return {
+        key: getattr(child_profile, f'{participation_type}_{key}')
+        for key in ('total_exercises', 'completed_exercises', 'total_time_spent')
+    }
+
+
+@api_view(['GET'])
+def results_for_learning_unit_overall(request, child_id, participation_type=None):
+    """
+    Progress over a child's assignments of one participation type, or - without a type -
+    the total, required and recommended breakdowns together. Always a single query.
+    """
+    if participation_type is not None and participation_type not in PARTICIPATION_TYPES:
+        return Response({'error': 'participation_type must be "total", "required", or "recommended"'}, status=400)
 
-    # Total exercises
-    learning_unit_ids = assignments.values_list('learning_unit_id', flat=True)
-    total_exercises = Exercise.objects.filter(learning_unit_id__in=learning_unit_ids).count()
+    types = [participation_type] if participation_type else PARTICIPATION_TYPES
+    annotations = {}
+    for name in types:
+        annotations.update(progress_annotations(name))
+    child_profile = Profile.objects.filter(id=child_id, profile_type='child').annotate(**annotations).first()
+    if not child_profile:
+        return Response({'error': 'Child profile not found'}, status=404)
 
-    # Completed exercises
-    completed_exercises = Exercise_Result.objects.filter(
-        assignment__in=assignments,
-        completed_at__isnull=False
-    ).count()
+    if participation_type:
+        return Response(_progress(child_profile, participation_type), status=200)
+    return Response({name: _progress(child_profile, name) for name in types}, status=200)
 
-    # Total time spent
-    total_time_spent = Exercise_Result.objects.filter(
-        assignment__in=assignments
-    ).aggregate(total_time=Sum('time_spent'))['total_time'] or 0
 
-    return Response({
-        'total_exercises': total_exercises,
-        'completed_exercises': completed_exercises,
-        'total_time_spent': total_time_spent
-    }, status=200)
+def _parse_bound(value, end_of_day=False):
+    """Aware datetime from an ISO date or datetime query parameter. A bare date for an upper
+    bound means the start of the next day. Raises ValueError."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
 
 
 @api_view(['GET'])
 def get_exercise_results(request, child_id):
+    """
+    Cursor-paginated feed of a child's completed exercise results, newest first, with each
+    result's learning unit and participation type (?expand=exercise,learning_unit nests them
+    in the same query). Optional filters: learning_unit, participation_type, and from / to
+    (ISO dates or datetimes, "to" inclusive) on completed_at.
+    """
     child_profile = Profile.objects.filter(id=child_id, profile_type='child').first()
     if not child_profile:
         return Response({'error': 'Child profile not found'}, status=404)
 
-    results = Exercise_Result.objects.filter(profile=child_profile)
-    serializer = ExerciseResultSerializer(results, many=True)
-    return Response(serializer.data, status=200)
+    results = Exercise_Result.objects.filter(
+        assignment__assigned_to=child_profile,
+        completed_at__isnull=False,
+    ).select_related('assignment')
+    options = expansion_options(request)
+    results = ExerciseResultFeedSerializer.select_expanded(results, options['expand'])
+
+    learning_unit = request.query_params.get('learning_unit')
+    if learning_unit:
+        try:
+            results = results.filter(assignment__learning_unit_id=uuid.UUID(learning_unit))
+        except ValueError:
+            return Response({'error': 'learning_unit must be a learning unit ID'}, status=400)
+
+    participation_type = request.query_params.get('participation_type')
+    if participation_type:
+        if participation_type not in ('required', 'recommended'):
+            return Response({'error': 'participation_type must be "required" or "recommended"'}, status=400)
+        results = results.filter(assignment__participation_type=participation_type)
+
+    try:
+        if request.query_params.get('from'):
+            results = results.filter(completed_at__gte=_parse_bound(request.query_params['from']))
+        if request.query_params.get('to'):
+            results = results.filter(completed_at__lt=_parse_bound(request.query_params['to'], end_of_day=True))
+    except ValueError:
+        return Response({'error': 'from and to must be ISO dates or datetimes'}, status=400)
+
+    paginator = ExerciseResultCursorPagination()
+    page = paginator.paginate_queryset(results, request)
+    serializer = ExerciseResultFeedSerializer(page, many=True, **options)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET', 'POST'])
@@ -73,7 +141,9 @@ def results_for_exercise(request, child_id, exercise_id):
             assignment__assigned_to=child_profile,
             exercise=exercise
         )
-        serializer = ExerciseResultSerializer(results, many=True)
+        options = expansion_options(request)
+        results = ExerciseResultSerializer.select_expanded(results, options['expand'])
+        serializer = ExerciseResultSerializer(results, many=True, **options)
         return Response(serializer.data, status=200)
 
     elif request.method == 'POST': # This post call is used to complete exercise
@@ -83,25 +153,23 @@ def results_for_exercise(request, child_id, exercise_id):
         ).first()
         if not assignment:
             return Response({'error': 'Assignment not found for this exercise and child'}, status=404)
-        # Ensure we either update an existing result or create it and mark completed
-        exercise_result, created = Exercise_Result.objects.update_or_create(
-            assignment=assignment,
-            exercise=exercise,
-            defaults={
-                'completed_at': timezone.now()
-            }
-        )
+        now = timezone.now()
+        with transaction.atomic():
+            exercise_result, _ = Exercise_Result.objects.get_or_create(assignment=assignment, exercise=exercise)
+            # Only the request that moves the result from incomplete to completed counts it
+            newly_completed = Exercise_Result.objects.filter(
+                pk=exercise_result.pk, completed_at__isnull=True
+            ).update(completed_at=now)
+            if newly_completed:
+                add_to_counters(assignment.id, completed=1)
+            else:
+                Exercise_Result.objects.filter(pk=exercise_result.pk).update(completed_at=now)
 
-        # If all exercises for the learning unit are completed, mark assignment as completed
-        total_exercises = Exercise.objects.filter(learning_unit=exercise.learning_unit).count()
-        completed_exercises = Exercise_Result.objects.filter(
-            assignment=assignment,
-            completed_at__isnull=False
-        ).count()
-
-        if completed_exercises == total_exercises:
-            assignment.completed_at = timezone.now()
-            assignment.save()
+            # If all exercises for the learning unit are completed, mark assignment as completed
+            total_exercises = Exercise.objects.filter(learning_unit_id=exercise.learning_unit_id).count()
+            Assignment.objects.filter(
+                pk=assignment.pk, completed_exercises__gte=total_exercises
+            ).update(completed_at=now)
 
         return Response({'message': 'Exercise marked as completed'}, status=200)
 
@@ -112,7 +180,7 @@ def results_for_question(request, child_id, question_id):
     if not child_profile:
         return Response({'error': 'Child profile not found'}, status=404)
 
-    question = Question.objects.filter(id=question_id).first()
+    question = Question.objects.select_related('exercise').filter(id=question_id).first()
     if not question:
         return Response({'error': 'Question not found'}, status=404)
 
@@ -121,7 +189,9 @@ def results_for_question(request, child_id, question_id):
             exercise_result__assignment__assigned_to=child_profile,
             question=question
         )
-        serializer = QuestionResultSerializer(results, many=True)
+        options = expansion_options(request)
+        results = QuestionResultSerializer.select_expanded(results, options['expand'])
+        serializer = QuestionResultSerializer(results, many=True, **options)
         return Response(serializer.data, status=200)
 
     elif request.method == 'POST':
@@ -136,43 +206,209 @@ def results_for_question(request, child_id, question_id):
         exercise = question.exercise
         assignment = Assignment.objects.filter(
             assigned_to=child_profile,
-            learning_unit=exercise.learning_unit
+            learning_unit_id=exercise.learning_unit_id
         ).first()
         if not assignment:
             return Response({'error': 'Assignment not found for this question and child'}, status=404)
 
-        # Get or create Exercise_Result
-        exercise_result, _ = Exercise_Result.objects.get_or_create(
-            assignment=assignment,
-            exercise=exercise
-        )
+        with transaction.atomic():
+            # Get or create Exercise_Result, locked so submissions for the same exercise
+            # recompute its totals one after the other
+            exercise_result, _ = Exercise_Result.objects.select_for_update().get_or_create(
+                assignment=assignment,
+                exercise=exercise
+            )
+            previous = _result_totals(exercise_result)
+
+            # Update or create Question_Result
+            result, created = Question_Result.objects.update_or_create(
+                exercise_result=exercise_result,
+                question=question,
+                defaults={
+                    'num_incorrect': num_incorrect,
+                    'num_correct': num_correct,
+                    'time_spent': time_spent,
+                    'completed_at': timezone.now()
+                }
+            )
 
-        # Update or create Question_Result
-        result, created = Question_Result.objects.update_or_create(
-            exercise_result=exercise_result,
-            question=question,
-            defaults={
-                'num_incorrect': num_incorrect,
-                'num_correct': num_correct,
-                'time_spent': time_spent,
-                'completed_at': timezone.now()
-            }
+            # A resubmitted answer replaces the earlier one, as in bulk_results: the totals are
+            # recomputed from the question results and the assignment gets the difference
+            _recompute_totals([exercise_result.pk])
+            exercise_result.refresh_from_db(fields=['num_incorrect', 'num_correct', 'time_spent', 'accuracy'])
+            add_to_counters(assignment.id, *(new - old for new, old in zip(_result_totals(exercise_result), previous)))
+
+        # Relations are already loaded; reuse them so expanding them costs no extra queries
+        exercise_result.exercise = exercise
+        exercise_result.assignment = assignment
+        result.exercise_result = exercise_result
+        result.question = question
+        serializer = QuestionResultSerializer(result, **expansion_options(request))
+        return Response(serializer.data, status=201 if created else 200)
+
+
+def _question_sum(field):
+    return Coalesce(Subquery(
+        Question_Result.objects.filter(exercise_result=OuterRef('pk')).values('exercise_result').annotate(
+            total=Sum(field)
+        ).values('total')
+    ), 0)
+
+
+def _recompute_totals(result_ids):
+    """Set the Exercise_Results' totals and accuracy to the sums of their question results."""
+    num_correct, num_incorrect = _question_sum('num_correct'), _question_sum('num_incorrect')
+    Exercise_Result.objects.filter(id__in=result_ids).update(
+        num_correct=num_correct,
+        num_incorrect=num_incorrect,
+        time_spent=_question_sum('time_spent'),
+        accuracy=accuracy_expression(num_correct, num_correct + num_incorrect),
+    )
+
+
+def _result_totals(result):
+    """What an Exercise_Result contributes to its assignment's counters, in add_to_counters order."""
+    return (int(result.completed_at is not None), result.time_spent, result.num_correct, result.num_incorrect)
+
+
+def _parse_bulk_results(data):
+    """
+    Normalise the bulk payload to [(exercise_id, complete, {question_id: (correct, incorrect, time)})].
+    Accepts {"exercises": [...]} or a single exercise object. Raises ValueError with a message.
+    """
+    exercises = data.get('exercises') if isinstance(data, dict) and 'exercises' in data else [data]
+    if not isinstance(exercises, list) or not exercises:
+        raise ValueError('exercises must be a non-empty list')
+
+    parsed = []
+    for entry in exercises:
+        if not isinstance(entry, dict) or not entry.get('exercise_id'):
+            raise ValueError('every exercise needs an exercise_id')
+        questions = entry.get('questions') or []
+        if not isinstance(questions, list):
+            raise ValueError('questions must be a list')
+        counts = {}
+        for question in questions:
+            try:
+                # A question listed twice keeps its last result
+                counts[str(uuid.UUID(str(question['question_id'])))] = (
+                    int(question['num_correct']), int(question['num_incorrect']), int(question['time_spent'])
+                )
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('every question needs a valid question_id, and num_correct, num_incorrect and time_spent numbers')
+        try:
+            exercise_id = str(uuid.UUID(str(entry['exercise_id'])))
+        except ValueError:
+            raise ValueError(f"invalid exercise_id: {entry['exercise_id']}")
+        parsed.append((exercise_id, bool(entry.get('complete', False)), counts))
+    return parsed
+
+
+@api_view(['POST'])
+def bulk_results(request, child_id):
+    """
+    Save every question result of one or more exercises in one request:
+
+        {"exercises": [{"exercise_id": "...", "complete": true,
+                        "questions": [{"question_id": "...", "num_correct": 2, "num_incorrect": 1, "time_spent": 30}]}]}
+
+    Question results are upserted (a resubmitted question replaces its earlier result, as with
+    results_for_question), each Exercise_Result's totals and accuracy are recomputed from its
+    question results once, and exercises with "complete" are marked completed - all in one
+    transaction.
+    """
+    child_profile = Profile.objects.filter(id=child_id, profile_type='child').first()
+    if not child_profile:
+        return Response({'error': 'Child profile not found'}, status=404)
+
+    try:
+        entries = _parse_bulk_results(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    exercise_ids = {exercise_id for exercise_id, _, _ in entries}
+    question_ids = {question_id for _, _, counts in entries for question_id in counts}
+    exercises = {str(e.id): e for e in Exercise.objects.filter(id__in=exercise_ids)}
+    question_exercise = {str(q_id): str(e_id) for q_id, e_id in Question.objects.filter(
+        id__in=question_ids
+    ).values_list('id', 'exercise_id')}
+
+    missing = exercise_ids - exercises.keys()
+    if missing:
+        return Response({'error': f'Exercise not found: {", ".join(sorted(missing))}'}, status=404)
+    for exercise_id, _, counts in entries:
+        for question_id in counts:
+            if question_exercise.get(question_id) != exercise_id:
+                return Response({'error': f'Question {question_id} not found in exercise {exercise_id}'}, status=404)
+
+    assignments = {}
+    for assignment in Assignment.objects.filter(
+        assigned_to=child_profile,
+        learning_unit_id__in={e.learning_unit_id for e in exercises.values()}
+    ).order_by('id'):
+        assignments.setdefault(assignment.learning_unit_id, assignment)  # same pick as .first()
+    missing = [exercise_id for exercise_id, e in exercises.items() if e.learning_unit_id not in assignments]
+    if missing:
+        return Response({'error': f'Assignment not found for exercise {", ".join(sorted(missing))} and child'}, status=404)
+    assignment_for = {exercise_id: assignments[e.learning_unit_id] for exercise_id, e in exercises.items()}
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Insert the missing results first; rows that already exist (or that a parallel request
+        # just inserted) are skipped by the unique constraint, then every row is read back
+        Exercise_Result.objects.bulk_create([
+            Exercise_Result(assignment=assignment_for[exercise_id], exercise=exercise)
+            for exercise_id, exercise in exercises.items()
+        ], ignore_conflicts=True)
+        # Locked like in results_for_question, so the counter deltas below are exact
+        exercise_results = {}
+        for result in Exercise_Result.objects.select_for_update().filter(
+            assignment__in=assignments.values(), exercise_id__in=exercises.keys()
+        ):
+            exercise_id = str(result.exercise_id)
+            if assignment_for[exercise_id].id == result.assignment_id:
+                exercise_results[exercise_id] = result
+        previous = {result.id: _result_totals(result) for result in exercise_results.values()}
+
+        question_results = {}
+        for exercise_id, _, counts in entries:
+            for question_id, (num_correct, num_incorrect, time_spent) in counts.items():
+                question_results[(exercise_id, question_id)] = Question_Result(
+                    exercise_result=exercise_results[exercise_id], question_id=question_id,
+                    num_correct=num_correct, num_incorrect=num_incorrect, time_spent=time_spent, completed_at=now,
+                )
+        Question_Result.objects.bulk_create(
+            list(question_results.values()),
+            update_conflicts=True,
+            unique_fields=['exercise_result', 'question'],
+            update_fields=['num_correct', 'num_incorrect', 'time_spent', 'completed_at'],
         )
 
-        # Update Exercise_Result aggregates (time spent, num_correct, num_incorrect)
-        # Ensure numeric fields are initialised
-        exercise_result.num_incorrect = (exercise_result.num_incorrect or 0) + num_incorrect
-        exercise_result.num_correct = (exercise_result.num_correct or 0) + num_correct
-        exercise_result.time_spent = (exercise_result.time_spent or 0) + time_spent
+        result_ids = [r.id for r in exercise_results.values()]
+        _recompute_totals(result_ids)
 
-        # Recompute accuracy of child's Exercise_Result from aggregated totals
-        total_answers = exercise_result.num_correct + exercise_result.num_incorrect
-        if total_answers > 0:
-            exercise_result.accuracy = (exercise_result.num_correct / total_answers * 100)
-        else:
-            exercise_result.accuracy = 0.0
+        completed_ids = [exercise_results[exercise_id].id for exercise_id, complete, _ in entries if complete]
+        if completed_ids:
+            Exercise_Result.objects.filter(id__in=completed_ids).update(completed_at=now)
 
-        exercise_result.save()
+        # Add each result's change to its assignment's counters
+        deltas = {}
+        for result in Exercise_Result.objects.filter(id__in=result_ids).only(
+            'assignment', 'completed_at', 'time_spent', 'num_correct', 'num_incorrect'
+        ):
+            delta = deltas.setdefault(result.assignment_id, [0, 0, 0, 0])
+            for i, (new, old) in enumerate(zip(_result_totals(result), previous[result.id])):
+                delta[i] += new - old
+        for assignment_id, delta in deltas.items():
+            add_to_counters(assignment_id, *delta)
+        touched = Assignment.objects.filter(id__in=deltas.keys())
+        if completed_ids:
+            # Assignments whose every exercise now has a completed result
+            touched.filter(completed_at__isnull=True).annotate(
+                total_exercises=Count('learning_unit__exercises')
+            ).filter(completed_exercises__gte=F('total_exercises')).update(completed_at=now)
 
-        serializer = QuestionResultSerializer(result)
-        return Response(serializer.data, status=201 if created else 200)
+    options = expansion_options(request)
+    results = ExerciseResultSerializer.select_expanded(Exercise_Result.objects.filter(id__in=result_ids), options['expand'])
+    serializer = ExerciseResultSerializer(results, many=True, **options)
+    return Response(serializer.data, status=200)
@@ -121,7 +121,7 @@ export default function ChatRooms() {
           
           if (assignments.length > 0) {
             // Get the therapist user ID from assignment
-            const assignerUserId = assignments[0].assigned_by?.id;
+            const assignerUserId = assignments[0].assigned_by;
             
             // Check if assigner is a therapist
             const assignerUserResp = await fetch(`${API_URL}/profile/${assignerUserId}/list/`, {
@@ -133,13 +133,13 @@ export default function ParentDashboard() {
     
     try {
 
-      const assignmentsResp = await fetch(`${API_URL}/assignment/${userId}/assigned_by/`);
+      const assignmentsResp = await fetch(`${API_URL}/assignment/${userId}/assigned_by/?expand=learning_unit`);
 
       if (!assignmentsResp.ok) throw new Error('Failed to fetch data');
 
       const assignments = await assignmentsResp.json();
 
-      const childAssignments = assignments.filter((a: any) => a.assigned_to.id === childId);
+      const childAssignments = assignments.filter((a: any) => a.assigned_to === childId);
 
       const assignedUnitsDetails: AssignedLearningUnit[] = childAssignments.map((assignment: any) => ({
         assignmentId: assignment.id,
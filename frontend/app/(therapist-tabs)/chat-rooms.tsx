@@ -98,7 +98,7 @@ export default function ChatRooms() {
 
     try {
       // Get all assignments created by this therapist
-      const response = await fetch(`${API_URL}/assignment/${userId}/assigned_by/`, {
+      const response = await fetch(`${API_URL}/assignment/${userId}/assigned_by/?expand=assigned_to`, {
         headers: { 'Authorization': `Bearer ${token}` }
       });
       
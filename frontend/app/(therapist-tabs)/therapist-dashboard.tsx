@@ -146,7 +146,7 @@ export default function TherapistDashboard() {
       if (!firstLoad) setLoadingAssignments(true);
 
       // Fetch assignments directly for the child instead of filtering therapist's assignments
-      const assignmentsResp = await fetch(`${API_URL}/assignment/${childId}/assigned_to/`);
+      const assignmentsResp = await fetch(`${API_URL}/assignment/${childId}/assigned_to/?expand=learning_unit`);
 
       if (!assignmentsResp.ok) throw new Error('Failed to fetch data');
 
@@ -41,7 +41,7 @@ export default function AllActivitiesPage() {
       try {
         // Fetch all assignments for the child
         const assignmentsResponse = await fetch(
-          `${API_URL}/assignment/${childId}/assigned_to/`,
+          `${API_URL}/assignment/${childId}/assigned_to/?expand=learning_unit`,
           {
             method: 'GET',
             headers: { 'Content-Type': 'application/json' },
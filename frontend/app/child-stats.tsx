@@ -25,9 +25,17 @@ const StatsPage = () => {
     const fetchAllExerciseResults = async () => {
       if (!childId) return;
       try {
-        const res = await fetch(`${API_URL}/result/${childId}/all/`);
-        const data = res.ok ? await res.json() : [];
-        setAllExerciseResults(Array.isArray(data) ? data : []);
+        // The results feed is cursor-paginated; follow the next links to collect every page
+        const data: any[] = [];
+        let url: string | null = `${API_URL}/result/${childId}/all/?page_size=100`;
+        while (url) {
+          const res = await fetch(url);
+          if (!res.ok) break;
+          const page = await res.json();
+          data.push(...(page.results || []));
+          url = page.next;
+        }
+        setAllExerciseResults(data);
         
         // Calculate accuracy rate from all results
         const resultsArray = Array.isArray(data) ? data : [];
@@ -83,7 +91,7 @@ const StatsPage = () => {
     const fetchExerciseResults = async () => {
       if (!childId || !selectedExerciseId) return;
       try {
-        const res = await fetch(`${API_URL}/result/${childId}/exercise/${selectedExerciseId}/`);
+        const res = await fetch(`${API_URL}/result/${childId}/exercise/${selectedExerciseId}/?expand=exercise`);
         const data = res.ok ? await res.json() : [];
         setExerciseResults(Array.isArray(data) ? data : []);
       } catch (err) {
@@ -185,7 +185,7 @@ export default function LearningUnitDetails() {
           console.log('Child assignments:', assignments.length);
           
           // Check if this specific unit is assigned
-          const isThisUnitAssigned = assignments.some((a: any) => a.learning_unit.id === id);
+          const isThisUnitAssigned = assignments.some((a: any) => a.learning_unit === id);
           
           // Check if ALL assignments are completed
           const allCompleted = assignments.every((a: any) => a.completed_at !== null);
@@ -228,7 +228,7 @@ export default function LearningUnitDetails() {
         const assignments = await response.json();
         console.log('Total assignments for child:', assignments.length);
         
-        const isUnitAssigned = assignments.some((a: any) => a.learning_unit.id === id);
+        const isUnitAssigned = assignments.some((a: any) => a.learning_unit === id);
         console.log('Is unit assigned:', isUnitAssigned);
         
         setIsAssigned(isUnitAssigned);
@@ -146,7 +146,7 @@ const fetchAssignedLearningUnit = async (childId: string, setTasks: (tasks: Task
   console.log('API_URL:', API_URL);
 
   try {
-    const assignmentsResponse = await fetch(`${API_URL}/assignment/${childId}/assigned_to/`, {
+    const assignmentsResponse = await fetch(`${API_URL}/assignment/${childId}/assigned_to/?expand=learning_unit`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
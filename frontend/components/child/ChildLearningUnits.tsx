@@ -57,12 +57,12 @@ export default function ChildLearningUnits() {
 
           if (assignedResponse.ok) {
             const assignments = await assignedResponse.json();
-            assignedUnitIds = assignments.map((a: any) => a.learning_unit.id);
+            assignedUnitIds = assignments.map((a: any) => a.learning_unit);
             console.log('Assigned Unit IDs:', assignedUnitIds);
 
             // Check completion status for each assigned unit
             for (const assignment of assignments) {
-              const unitId = assignment.learning_unit.id;
+              const unitId = assignment.learning_unit;
               
               // Fetch exercises for this unit
               const exercisesResponse = await fetch(`${API_URL}/content/${unitId}/exercises/`, {
@@ -162,7 +162,7 @@ export default function ChildLearningUnits() {
 
         // Fetch assigned units for this child
         if (childId) {
-          const assignedResponse = await fetch(`${API_URL}/assignment/${childId}/assigned_to/`, {
+          const assignedResponse = await fetch(`${API_URL}/assignment/${childId}/assigned_to/?expand=learning_unit`, {
             method: 'GET',
             headers: {
               'Content-Type': 'application/json',
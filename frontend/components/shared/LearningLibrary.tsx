@@ -66,14 +66,14 @@ export default function LearningLibrary({ data, loading = false }: LibraryProps)
 
           const assignments = await response.json();
 
-          const childAssignments = assignments.filter((a: any) => a.assigned_to.id === childId);
+          const childAssignments = assignments.filter((a: any) => a.assigned_to === childId);
 
-          const assignedIds = childAssignments.map((a: any) => a.learning_unit.id);
+          const assignedIds = childAssignments.map((a: any) => a.learning_unit);
           setAssignedUnitIds(new Set(assignedIds));
 
           const completedIds = childAssignments
             .filter((a: any) => a.completed_at !== null)
-            .map((a: any) => a.learning_unit.id);
+            .map((a: any) => a.learning_unit);
           setCompletedUnitIds(new Set(completedIds));
         } catch (err) {
           console.error('Error fetching assignments:', err);
@@ -50,12 +50,12 @@ export default function LearningUnitsPage() {
 
               if (assignedResponse.ok) {
                 const assignments = await assignedResponse.json();
-                assignedUnitIds = assignments.map((a: any) => a.learning_unit.id);
+                assignedUnitIds = assignments.map((a: any) => a.learning_unit);
                 console.log('Assigned Unit IDs:', assignedUnitIds);
 
                 // Check completion status for each assigned unit
                 for (const assignment of assignments) {
-                  const unitId = assignment.learning_unit.id;
+                  const unitId = assignment.learning_unit;
                   
                   const exercisesResponse = await fetch(`${API_URL}/content/${unitId}/exercises/`, {
                     method: 'GET',